@@ -4,58 +4,152 @@ Script for assign an instance policy to the current machine.
 """
 
 import argparse
-import urllib.request
+import http.client
 import logging
+import os
+import random
 import sys
 import time
+import urllib.parse
 
 import boto3
 import botocore
 
 LOGGER = logging.getLogger(__name__)
 
-def _get_local_instance_id():
-    return urllib.request.urlopen('http://169.254.169.254/latest/meta-data/instance-id').read().decode()
-
-def _has_instance_profile():
-    base_url = "http://169.254.169.254/latest/meta-data/iam/security-credentials/"
-    try:
-        print("Reading: " + base_url)
-        iam_role = urllib.request.urlopen(base_url).read().decode()
-    except urllib.error.HTTPError as e:
-        print(e)
-        if e.code == 404:
-            return False
-        raise e
-
-    try:
-        url = base_url + iam_role
-        print("Reading: " + url)
-        req = urllib.request.urlopen(url)
-    except urllib.error.HTTPError as e:
-        print(e)
-        if e.code == 404:
-            return False
-        raise e
+# botocore reads the same variable, so a fake metadata service can stand in for both
+DEFAULT_METADATA_ENDPOINT = os.getenv("AWS_EC2_METADATA_SERVICE_ENDPOINT", "http://169.254.169.254")
+
+# IMDSv2 session tokens are valid for up to 6 hours
+IMDS_TOKEN_TTL_SECONDS = 21600
+
+# Poll quickly at first, then back off up to the maximum delay until the timeout
+DEFAULT_WAIT_TIMEOUT_SECONDS = 300
+POLL_INITIAL_DELAY_SECONDS = 0.1
+POLL_MAX_DELAY_SECONDS = 5
+
+class MetadataClient:
+    """
+    Read the instance metadata service over one keep-alive HTTP connection.
+
+    Uses an IMDSv2 session token, falling back to IMDSv1 requests if the service
+    does not hand out tokens.
+    """
+    def __init__(self, endpoint=DEFAULT_METADATA_ENDPOINT, timeout=2):
+        url = urllib.parse.urlsplit(endpoint)
+        self._conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+        self._token = None
+        self._token_expires = None
+        self.requests = 0
+
+    def close(self):
+        self._conn.close()
+
+    def _request(self, method, path, headers):
+        # The service may close idle connections, reconnect once if it did
+        for attempt in range(2):
+            try:
+                self.requests += 1
+                self._conn.request(method, path, headers=headers)
+                resp = self._conn.getresponse()
+                return (resp.status, resp.read().decode())
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._conn.close()
+                if attempt:
+                    raise
+
+    def _get_token(self):
+        if self._token_expires is None or time.monotonic() >= self._token_expires:
+            self._refresh_token()
+        return self._token
+
+    def _refresh_token(self):
+        (status, body) = self._request("PUT", "/latest/api/token",
+            {"X-aws-ec2-metadata-token-ttl-seconds": str(IMDS_TOKEN_TTL_SECONDS)})
+        if status == 200:
+            self._token = body
+            # Refresh a minute early rather than race the expiration
+            self._token_expires = time.monotonic() + IMDS_TOKEN_TTL_SECONDS - 60
+        else:
+            LOGGER.info("No IMDSv2 token, status %s, using IMDSv1", status)
+            self._token = None
+            self._token_expires = float("inf")
+        return self._token
+
+    def get(self, path):
+        """
+        Return the (status, body) of a metadata path.
+        """
+        token = self._get_token()
+        (status, body) = self._request("GET", path, {"X-aws-ec2-metadata-token": token} if token else {})
+        if status == 401 and token:
+            # The token expired or the service restarted
+            token = self._refresh_token()
+            (status, body) = self._request("GET", path, {"X-aws-ec2-metadata-token": token} if token else {})
+        return (status, body)
+
+def _get_local_instance_id(client):
+    (status, body) = client.get('/latest/meta-data/instance-id')
+    if status != 200:
+        raise ValueError(f"Reading instance id failed with {status}")
+    return body
+
+def _has_instance_profile(client):
+    base_path = "/latest/meta-data/iam/security-credentials/"
+
+    print("Reading: " + base_path)
+    (status, iam_role) = client.get(base_path)
+    if status == 404:
+        return False
+    if status != 200:
+        raise ValueError(f"Reading {base_path} failed with {status}")
+
+    path = base_path + iam_role.strip()
+    print("Reading: " + path)
+    (status, _) = client.get(path)
+    if status == 404:
+        return False
+    if status != 200:
+        raise ValueError(f"Reading {path} failed with {status}")
 
     return True
 
-def _wait_instance_profile():
-    retry = 60
-    while not _has_instance_profile() and retry:
-        time.sleep(5)
-        retry -= 1
-
-    if retry == 0:
-        raise ValueError("Timeout on waiting for instance profile")
+def _wait_instance_profile(client, timeout=DEFAULT_WAIT_TIMEOUT_SECONDS):
+    """
+    Poll until the instance profile's credentials are available.
+
+    Polls fast at first, since the profile often attaches within a second or two,
+    then backs off exponentially with jitter.
+    """
+    start = time.monotonic()
+    delay = POLL_INITIAL_DELAY_SECONDS
+    checks = 1
+    while not _has_instance_profile(client):
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            raise ValueError("Timeout on waiting for instance profile")
+
+        time.sleep(min(random.uniform(delay / 2, delay), timeout - elapsed))
+        delay = min(delay * 2, POLL_MAX_DELAY_SECONDS)
+        checks += 1
+
+    print("Instance profile available after %.1f seconds, %d checks and %d requests" % (
+        time.monotonic() - start, checks, client.requests))
+
+def _assign_instance_policy(iam_instance_arn, metadata_endpoint=DEFAULT_METADATA_ENDPOINT):
+    client = MetadataClient(metadata_endpoint)
+    try:
+        _assign_instance_policy_with(client, iam_instance_arn)
+    finally:
+        client.close()
 
-def _assign_instance_policy(iam_instance_arn):
+def _assign_instance_policy_with(client, iam_instance_arn):
 
-    if _has_instance_profile():
+    if _has_instance_profile(client):
         print("IMPORTANT: Found machine already has instance profile, skipping the assignment")
         return
 
-    instance_id = _get_local_instance_id()
+    instance_id = _get_local_instance_id(client)
 
     ec2_client = boto3.client("ec2", 'us-east-1')
 
@@ -70,7 +164,7 @@ def _assign_instance_policy(iam_instance_arn):
         print(response)
 
         # Wait for the instance profile to be assigned by polling the local instance metadata service
-        _wait_instance_profile()
+        _wait_instance_profile(client)
 
     except botocore.exceptions.ClientError as ce:
         if ce.response["Error"]["Code"] == "RequestLimitExceeded":
@@ -87,6 +181,7 @@ def main() -> None:
     parser.add_argument('-d', "--debug", action='store_true', help="Enable debug logging")
 
     parser.add_argument('--instance_profile_arn', type=str, help="Name of instance profile")
+    parser.add_argument('--metadata_endpoint', type=str, default=DEFAULT_METADATA_ENDPOINT, help="Instance metadata service URL")
 
     args = parser.parse_args()
 
@@ -95,7 +190,7 @@ def main() -> None:
     elif args.verbose:
         logging.basicConfig(level=logging.INFO)
 
-    _assign_instance_policy(args.instance_profile_arn)
+    _assign_instance_policy(args.instance_profile_arn, args.metadata_endpoint)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 """
 Script for assuming an aws role.
+
+Credentials are cached on disk per role until shortly before they expire, so
+steps that assume the same role back to back make one STS call. The cache is
+locked while it is refreshed, so concurrent callers wait for one STS call
+instead of each making their own.
 """
 
 import argparse
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
 import uuid
 import logging
 
@@ -13,13 +25,75 @@ LOGGER = logging.getLogger(__name__)
 
 STS_DEFAULT_ROLE_NAME = "arn:aws:iam::579766882180:role/mark.benvenuto"
 
-def _assume_role(role_name):
-    sts_client = boto3.client("sts")
+STS_DEFAULT_DURATION_SECONDS = 900
 
-    response = sts_client.assume_role(RoleArn=role_name, RoleSessionName=str(uuid.uuid4()), DurationSeconds=900)
+# Cached credentials are refreshed once they expire within this margin
+DEFAULT_REFRESH_MARGIN_SECONDS = 300
 
-    creds = response["Credentials"]
+DEFAULT_CACHE_DIR = os.getenv("AWS_ASSUME_ROLE_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "aws_assume_role"))
+
+def _sts_assume_role(role_name, duration_seconds):
+    sts_client = boto3.client("sts")
 
+    response = sts_client.assume_role(RoleArn=role_name, RoleSessionName=str(uuid.uuid4()), DurationSeconds=duration_seconds)
+
+    return response["Credentials"]
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _read_cache(path):
+    try:
+        with open(path) as f:
+            creds = json.load(f)
+    except (OSError, ValueError):
+        return None
+    creds["Expiration"] = datetime.datetime.fromisoformat(creds["Expiration"])
+    return creds
+
+def _write_cache(path, creds):
+    # Write to a temp file and rename, so a reader never sees a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({**creds, "Expiration": creds["Expiration"].isoformat()}, f)
+    os.replace(tmp_path, path)
+
+def get_credentials(role_name, duration_seconds=STS_DEFAULT_DURATION_SECONDS, cache_dir=DEFAULT_CACHE_DIR,
+        refresh_margin_seconds=DEFAULT_REFRESH_MARGIN_SECONDS):
+    """
+    Get credentials for a role from the cache, or from STS if they expire within the refresh margin.
+
+    Pass cache_dir=None to always call STS.
+    """
+    if not cache_dir:
+        return _sts_assume_role(role_name, duration_seconds)
+
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+    key = hashlib.sha256(role_name.encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, key + ".json")
+
+    with _locked(os.path.join(cache_dir, key + ".lock")):
+        creds = _read_cache(cache_path)
+        refresh_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=refresh_margin_seconds)
+        if creds and creds["Expiration"] > refresh_at:
+            LOGGER.info("Using cached credentials for %s, which expire at %s", role_name, creds["Expiration"])
+            return creds
+
+        LOGGER.info("Assuming role %s", role_name)
+        creds = _sts_assume_role(role_name, duration_seconds)
+        _write_cache(cache_path, creds)
+        return creds
+
+def _assume_role(role_name, duration_seconds=STS_DEFAULT_DURATION_SECONDS, cache_dir=DEFAULT_CACHE_DIR,
+        refresh_margin_seconds=DEFAULT_REFRESH_MARGIN_SECONDS):
+    creds = get_credentials(role_name, duration_seconds, cache_dir, refresh_margin_seconds)
 
     print(f"""{{
   "AccessKeyId" : "{creds["AccessKeyId"]}",
@@ -38,6 +112,11 @@ def main() -> None:
     parser.add_argument('-d', "--debug", action='store_true', help="Enable debug logging")
 
     parser.add_argument('--role_name', type=str, default=STS_DEFAULT_ROLE_NAME, help="Role to assume")
+    parser.add_argument('--duration', type=int, default=STS_DEFAULT_DURATION_SECONDS, help="Seconds the credentials are valid for")
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR, help="Directory to cache credentials in")
+    parser.add_argument('--no_cache', action='store_true', help="Always assume the role with STS")
+    parser.add_argument('--refresh_margin', type=int, default=DEFAULT_REFRESH_MARGIN_SECONDS,
+        help="Refresh cached credentials that expire within this many seconds")
 
     args = parser.parse_args()
 
@@ -46,7 +125,7 @@ def main() -> None:
     elif args.verbose:
         logging.basicConfig(level=logging.INFO)
 
-    _assume_role(args.role_name)
+    _assume_role(args.role_name, args.duration, None if args.no_cache else args.cache_dir, args.refresh_margin)
 
 
 if __name__ == "__main__":
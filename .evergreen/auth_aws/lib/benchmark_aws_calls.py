@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark container_tester's AWS API usage against the offline fake AWS.
+
+Runs remote_ps_container and remote_gc_services_container against a
+fake_aws.FakeAWS cluster of running tasks and stale services, which pages
+list results like AWS does and sleeps a fixed latency per call and per
+client creation, and reports the calls made and the time taken.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import logging
+import time
+
+import container_tester
+import fake_aws
+
+LOGGER = logging.getLogger(__name__)
+
+CLUSTER = "arn:aws:ecs:us-east-2:000000000000:cluster/benchmark"
+
+def _make_cluster(args):
+    aws = fake_aws.FakeAWS(call_latency=args.latency)
+    aws.add_service(CLUSTER, "tasks", desired_count=args.tasks)
+    for i in range(args.services):
+        aws.add_service(CLUSTER, f"stale-{i}", age=datetime.timedelta(hours=2))
+    return aws
+
+def _measure(aws, fn):
+    aws.calls.clear()
+    # Start from an empty client cache, like a fresh run of the script
+    fake_aws.install(aws)
+    start = time.monotonic()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    return time.monotonic() - start, dict(aws.calls)
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='Benchmark container_tester AWS API calls.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument("--tasks", type=int, default=250, help="Number of running tasks in the cluster")
+    parser.add_argument("--services", type=int, default=50, help="Number of stale services for remote_gc_services to delete")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per API call and client creation")
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    aws = _make_cluster(args)
+
+    print(f"{args.tasks} tasks, {args.services} services, {args.latency * 1000:.0f} ms per call")
+    for (name, fn) in [
+            ("ps", lambda: container_tester.remote_ps_container(CLUSTER)),
+            ("gc_services", lambda: container_tester.remote_gc_services_container(CLUSTER)),
+            ]:
+        elapsed, calls = _measure(aws, fn)
+        print(f"{name:<12}{elapsed:8.3f}s  {sum(calls.values()):5d} calls")
+        for (call, count) in sorted(calls.items()):
+            print(f"    {call:<36}{count:5d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark container_tester file transfers against a local sshd.
+
+Starts an unprivileged sshd on a free localhost port as a stand-in for an ECS
+container, then times run_test copying many small files with one scp per file
+and with a single tar stream. Like a real run, each run_test also copies its
+script to /tmp/test.sh.
+
+Requires sshd, ssh-keygen, ssh-agent and ssh-add on the local host, see
+local_sshd.py.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import container_tester
+from local_sshd import LocalSshd
+
+LOGGER = logging.getLogger(__name__)
+
+def _make_payload(work_dir, count, size):
+    payload = os.path.join(work_dir, "payload")
+    os.mkdir(payload)
+    for i in range(count):
+        with open(os.path.join(payload, f"file{i}.pem"), "wb") as f:
+            f.write(os.urandom(size))
+    return payload
+
+def _time_transfer(endpoint, script, files, transfer, compress, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.monotonic()
+        container_tester.run_test(endpoint, script, files, transfer, compress)
+        elapsed = time.monotonic() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='Benchmark container_tester file transfers.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument("--count", type=int, default=50, help="Number of files to copy")
+    parser.add_argument("--size", type=int, default=4096, help="Size of each file in bytes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode, the fastest is reported")
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    work_dir = tempfile.mkdtemp(prefix="ct-bench-")
+    try:
+        with LocalSshd() as sshd:
+            endpoint = sshd.start()
+            payload = _make_payload(work_dir, args.count, args.size)
+            remote = os.path.join(work_dir, "remote")
+
+            script = os.path.join(work_dir, "test.sh")
+            with open(script, "w") as f:
+                f.write("true\n")
+
+            files = [f"{os.path.join(payload, name)}:{os.path.join(remote, name)}" for name in sorted(os.listdir(payload))]
+            # scp does not create missing remote directories
+            os.mkdir(remote)
+
+            print(f"Copying {args.count} files of {args.size} bytes to {endpoint}")
+            for (transfer, compress) in [("scp", False), ("tar", False), ("tar", True)]:
+                best = _time_transfer(endpoint, script, files, transfer, compress, args.repeat)
+                label = transfer + (" (gzip)" if compress else "")
+                print(f"{label:<12}{best:8.3f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,30 @@ Assumes remote host is Linux
 """
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import hashlib
+import io
+import json
 import logging
 import os
+import posixpath
 import pprint
+import queue
+import random
+import shutil
 import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
 import uuid
 
 import boto3
+import botocore.exceptions
 
 LOGGER = logging.getLogger(__name__)
 
@@ -33,12 +49,154 @@ ECS_DEFAULT_SECURITY_GROUP = 'sg-051a91d96332f8f3a'
 # This is just a string local to this file
 DEFAULT_SERVICE_NAME = 'script-test'
 
+# The task definition's sshd accepts root logins on the standard port
+SSH_USER = "root"
+SSH_PORT = 22
+
+# Where --transfer sync records what it last sent to a container
+SYNC_MANIFEST = "/tmp/container_tester_sync/manifest"
+
+# Lines of the test's output kept in memory, and reported when it fails
+DEFAULT_TAIL_LINES = 200
+
 # Garbage collection threshold for old/stale services
 DEFAULT_GARBAGE_COLLECTION_THRESHOLD = datetime.timedelta(hours=1)
 
+# Number of containers run_e2e_matrix runs at once
+DEFAULT_MAX_CONTAINERS = 4
+
+# Warm pool settings, pool services are tagged with the pool name and their lease
+DEFAULT_POOL_NAME = 'default'
+DEFAULT_POOL_SIZE = 4
+DEFAULT_LEASE_DURATION = datetime.timedelta(minutes=30)
+POOL_TAG = 'container-tester-pool'
+LEASE_STATE_TAG = 'container-tester-lease-state'
+LEASE_OWNER_TAG = 'container-tester-lease-owner'
+LEASE_EXPIRES_TAG = 'container-tester-lease-expires'
+# ECS tagging is not transactional, wait this long before checking a lease stuck
+LEASE_SETTLE_SECONDS = 1
+# Optional DynamoDB table, keyed by the string attribute service_arn, whose conditional
+# writes make leases exclusive instead of relying on the tags settling
+DEFAULT_LEASE_TABLE = os.getenv("CONTAINER_TESTER_LEASE_TABLE")
+
+# describe_services and the services waiters accept at most 10 services per call
+ECS_MAX_DESCRIBE_SERVICES = 10
+# Number of services remote_gc_services deletes at once
+DEFAULT_GC_CONCURRENCY = 8
+# Retries and initial delay, doubled after each retry, when AWS throttles a call
+THROTTLE_RETRIES = 6
+THROTTLE_BASE_DELAY = 0.5
+
+# describe_tasks accepts at most 100 tasks per call
+ECS_MAX_DESCRIBE_TASKS = 100
+# Keep describe_network_interfaces filters well under the request size limits
+EC2_MAX_DESCRIBE_NETWORK_INTERFACES = 200
+
 ############################################################################
 
 
+class RemoteTestError(ValueError):
+    """
+    A test script failed or timed out, with the last lines of its output.
+    """
+    def __init__(self, message, returncode, tail):
+        if tail:
+            message += f"\n--- last {len(tail)} lines of output ---\n" + "\n".join(tail)
+        super().__init__(message)
+        self.returncode = returncode
+        self.tail = tail
+
+# How run_test streams a test's output: log_file gets every line, timeout bounds the whole test,
+# command_timeout bounds the time without output, which with bash -x is about one command's runtime,
+# and prefix labels each line
+OutputOptions = collections.namedtuple("OutputOptions", ["log_file", "timeout", "command_timeout", "tail_lines", "prefix"],
+    defaults=(None, None, None, DEFAULT_TAIL_LINES, ""))
+
+
+class PhaseRecorder:
+    """
+    Time the phases of a test run as results.json records.
+
+    Each record has the "status", "test_file", "start", "end" and "elapsed" fields of the
+    results.json files that run-orchestration.sh writes, plus the phase name and any labels.
+    Records can also be streamed to a JSON lines file as each phase finishes.
+    """
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+        self._stream = None
+        self._local = threading.local()
+
+    def stream_to(self, path):
+        self._stream = open(path, "a")
+
+    @contextlib.contextmanager
+    def labels(self, **labels):
+        """
+        Add labels, like the test case, to the records of phases this thread runs.
+        """
+        old = getattr(self._local, "labels", {})
+        self._local.labels = {**old, **labels}
+        try:
+            yield
+        finally:
+            self._local.labels = old
+
+    @contextlib.contextmanager
+    def phase(self, name, **fields):
+        """
+        Time a phase, yielding its record. Set the record's "status" to "FAIL" to fail it.
+
+        A phase that raises is recorded as failed.
+        """
+        labels = getattr(self._local, "labels", {})
+        record = {"status": "PASS", "test_file": f"{labels['case']} {name}" if "case" in labels else name,
+            "phase": name, **labels, **fields}
+        start = time.time()
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "FAIL"
+            raise
+        finally:
+            end = time.time()
+            record.update(start=round(start, 3), end=round(end, 3), elapsed=round(end - start, 3))
+            self._add(record)
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self._stream:
+                self._stream.write(json.dumps(record) + "\n")
+                self._stream.flush()
+
+    def write_results(self, path):
+        """
+        Append the records to a results.json file as one {"results": [...]} document.
+        """
+        with self._lock, open(path, "a") as f:
+            json.dump({"results": self.records}, f, indent=2)
+            f.write("\n")
+
+    def summary(self):
+        """
+        Total seconds and count of each phase, slowest first.
+        """
+        totals = {}
+        for record in self.records:
+            (seconds, count) = totals.get(record["phase"], (0.0, 0))
+            totals[record["phase"]] = (seconds + record["elapsed"], count + 1)
+        return sorted(((phase, seconds, count) for (phase, (seconds, count)) in totals.items()),
+            key=lambda t: -t[1])
+
+    def close(self):
+        if self._stream:
+            self._stream.close()
+            self._stream = None
+
+PHASES = PhaseRecorder()
+
+
 def _run_process(params, cwd=None):
     LOGGER.info("RUNNING COMMAND: %s", params)
     ret = subprocess.run(params, cwd=cwd)
@@ -55,24 +213,269 @@ def _userandhostandport(endpoint):
         return (user, host, "22")
     return (user, host[:colon], host[colon + 1:])
 
-def _scp(endpoint, src, dest):
+def _ssh_options(control_path=None):
+    options = ["-o", "StrictHostKeyChecking=no"]
+    if control_path:
+        options += ["-o", "ControlPath=%s" % (control_path)]
+    return options
+
+@contextlib.contextmanager
+def _ssh_session(endpoint):
+    """
+    Open a multiplexed ssh connection to the endpoint.
+
+    Yields a ControlPath socket for _scp and _ssh to reuse, so each copy and
+    command skips the TCP and SSH handshakes. Yields None if the master
+    connection could not be started, in which case each call connects itself.
+    """
+    (user, host, port) = _userandhostandport(endpoint)
+    # Keep the socket path short, unix sockets are limited to ~100 characters
+    control_dir = tempfile.mkdtemp(prefix="ct-ssh-")
+    control_path = os.path.join(control_dir, "master")
+    user_and_host = "%s@%s" % (user, host)
+
+    with PHASES.phase("ssh_connect") as record:
+        ret = _run_process(["ssh"] + _ssh_options(control_path) +
+            ["-o", "ControlMaster=yes", "-o", "ControlPersist=yes", "-N", "-f", "-p", port, user_and_host])
+        if ret != 0:
+            record["status"] = "FAIL"
+    if ret != 0:
+        LOGGER.warning("Could not open a multiplexed ssh connection, RETURN CODE: %s", ret)
+        shutil.rmtree(control_dir, ignore_errors=True)
+        yield None
+        return
+
+    try:
+        yield control_path
+    finally:
+        _run_process(["ssh"] + _ssh_options(control_path) + ["-O", "exit", "-p", port, user_and_host])
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+def _scp(endpoint, src, dest, control_path=None):
     (user, host, port) = _userandhostandport(endpoint)
-    cmd = ["scp", "-o", "StrictHostKeyChecking=no", "-P", port, src, "%s@%s:%s" % (user, host, dest)]
+    cmd = ["scp"] + _ssh_options(control_path) + ["-P", port]
     if os.path.isdir(src):
-       cmd.insert(5, "-r")
-    _run_process(cmd)
+        cmd.append("-r")
+    cmd += [src, "%s@%s:%s" % (user, host, dest)]
+    return _run_process(cmd)
+
+def _read_lines(stream, name, lines):
+    for raw in iter(stream.readline, b""):
+        lines.put((name, raw.decode(errors="replace").rstrip("\n")))
+    lines.put((name, None))
 
-def _ssh(endpoint, cmd):
+def _ssh_stream(endpoint, cmd, control_path=None, output=OutputOptions()):
+    """
+    Run a command over ssh, streaming its stdout and stderr line by line.
+
+    Each line is timestamped, echoed, appended to output.log_file, and kept in a ring
+    buffer of the last output.tail_lines lines. The command is killed if it runs past
+    output.timeout seconds, or prints nothing for output.command_timeout seconds.
+
+    Returns the return code, or None if it timed out, the timeout message, and the buffered lines.
+    """
     (user, host, port) = _userandhostandport(endpoint)
-    cmd = ["ssh", "-o", "StrictHostKeyChecking=no", "-p", port, "%s@%s" % (user, host), cmd ]
-    ret = _run_process(cmd)
+    cmd = ["ssh"] + _ssh_options(control_path) + ["-p", port, "%s@%s" % (user, host), cmd]
+    LOGGER.info("RUNNING COMMAND: %s", cmd)
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    lines = queue.Queue()
+    for (stream, name) in [(proc.stdout, "out"), (proc.stderr, "err")]:
+        threading.Thread(target=_read_lines, args=(stream, name, lines), daemon=True).start()
+
+    tail = collections.deque(maxlen=output.tail_lines)
+    timed_out = None
+    log = open(output.log_file, "a") if output.log_file else None
+    start = last_line = time.monotonic()
+    try:
+        open_streams = 2
+        while open_streams:
+            now = time.monotonic()
+            deadlines = []
+            if output.timeout:
+                deadlines.append((start + output.timeout, f"test timed out after {output.timeout} seconds"))
+            if output.command_timeout:
+                deadlines.append((last_line + output.command_timeout,
+                    f"test printed nothing for {output.command_timeout} seconds"))
+            (deadline, message) = min(deadlines) if deadlines else (None, None)
+            if deadline is not None and now >= deadline:
+                timed_out = message
+                proc.kill()
+                break
+
+            try:
+                (name, line) = lines.get(timeout=None if deadline is None else deadline - now)
+            except queue.Empty:
+                continue
+            if line is None:
+                open_streams -= 1
+                continue
+
+            last_line = time.monotonic()
+            text = f"{datetime.datetime.now().isoformat(timespec='milliseconds')} {output.prefix}[{name}] {line}"
+            tail.append(text)
+            print(text, file=sys.stdout if name == "out" else sys.stderr, flush=True)
+            if log:
+                log.write(text + "\n")
+                log.flush()
+    finally:
+        if log:
+            log.close()
+
+    ret = proc.wait()
+    LOGGER.info("RETURN CODE: %s", ret)
+    return (None if timed_out else ret, timed_out, list(tail))
+
+def _ssh_capture(endpoint, cmd, input_text, control_path=None):
+    """
+    Run a command over ssh with input_text as its stdin, and return its return code and stdout.
+    """
+    (user, host, port) = _userandhostandport(endpoint)
+    cmd = ["ssh"] + _ssh_options(control_path) + ["-p", port, "%s@%s" % (user, host), cmd]
+    LOGGER.info("RUNNING COMMAND: %s", cmd)
+    ret = subprocess.run(cmd, input=input_text, stdout=subprocess.PIPE, universal_newlines=True)
+    return (ret.returncode, ret.stdout)
+
+# Print each path read from stdin that is an existing directory
+_REMOTE_DIRECTORIES = "while IFS= read -r p; do [ -d \"$p\" ] && printf '%s\\n' \"$p\"; done; true"
+
+def _resolve_dests(endpoint, transfers, control_path=None):
+    """
+    Rewrite (src, dest) pairs so each dest is the path src will have, like scp -r places it.
+
+    A dest that ends with a "/" or is an existing remote directory gets src's
+    basename appended, so src is copied inside it rather than over it.
+    """
+    query = [dest for (_, dest) in transfers if not dest.endswith("/")]
+    directories = set()
+    if query:
+        (ret, out) = _ssh_capture(endpoint, _REMOTE_DIRECTORIES, "".join(dest + "\n" for dest in query), control_path)
+        if ret != 0:
+            raise ValueError(f"checking remote destinations failed with {ret}")
+        directories = set(out.splitlines())
+
+    resolved = []
+    for (src, dest) in transfers:
+        if dest.endswith("/") or dest in directories:
+            dest = posixpath.join(dest, os.path.basename(os.path.normpath(src)))
+        resolved.append((src, dest))
+    return resolved
+
+def _tar_copy(endpoint, transfers, control_path=None, compress=False, extra=()):
+    """
+    Copy a list of (src, dest) pairs as one tar stream over a single ssh channel.
+
+    Each src is extracted at the absolute remote path dest, which should already
+    be resolved with _resolve_dests. Directories are copied recursively. extra is
+    a list of (dest, bytes) pairs to write as files.
+    """
+    (user, host, port) = _userandhostandport(endpoint)
+    remote_cmd = "tar -x%sf - -C /" % ("z" if compress else "")
+    cmd = ["ssh"] + _ssh_options(control_path) + ["-p", port, "%s@%s" % (user, host), remote_cmd]
+    LOGGER.info("RUNNING COMMAND: %s", cmd)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=proc.stdin, mode="w|gz" if compress else "w|") as tar:
+            for (src, dest) in transfers:
+                LOGGER.info("Adding %s as %s", src, dest)
+                tar.add(src, arcname=dest)
+            for (dest, data) in extra:
+                info = tarfile.TarInfo(dest)
+                info.size = len(data)
+                info.mtime = time.time()
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+    finally:
+        proc.stdin.close()
+        ret = proc.wait()
     LOGGER.info("RETURN CODE: %s", ret)
     return ret
 
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _expand_transfers(transfers):
+    """
+    Expand (src, dest) pairs, resolved with _resolve_dests, into one pair per file.
+    """
+    files = []
+    for (src, dest) in transfers:
+        if not os.path.isdir(src):
+            files.append((src, posixpath.normpath(dest)))
+            continue
+        for (root, _, names) in os.walk(src):
+            rel = os.path.relpath(root, src).replace(os.sep, "/")
+            for name in sorted(names):
+                files.append((os.path.join(root, name), posixpath.normpath(posixpath.join(dest, rel, name))))
+    return files
+
+# Print the manifest, then the size, mtime and path of each path read from stdin that exists
+_REMOTE_SYNC_STATUS = ("cat %s 2>/dev/null; echo ---; "
+    "while IFS= read -r p; do stat -c '%%s %%Y %%n' -- \"$p\" 2>/dev/null; done; true") % SYNC_MANIFEST
+
+def _sync_copy(endpoint, transfers, control_path=None, compress=False):
+    """
+    Copy only the files whose content changed since they were last synced to the endpoint.
+
+    The remote manifest records the sha256, size and mtime of each file as it was sent. A remote
+    file is up to date if its manifest hash matches the local file's hash, and its size and mtime
+    still match the manifest, so files changed on the remote side are sent again. The changed files
+    and the updated manifest are sent as one tar stream.
+
+    Returns the ssh return code and the number of files sent.
+    """
+    files = _expand_transfers(_resolve_dests(endpoint, transfers, control_path))
+    (ret, out) = _ssh_capture(endpoint, _REMOTE_SYNC_STATUS, "".join(dest + "\n" for (_, dest) in files), control_path)
+    if ret != 0:
+        return (ret, 0)
+
+    (manifest_text, _, stat_text) = out.partition("---\n")
+    manifest = {}
+    for line in manifest_text.splitlines():
+        (sha, size, mtime, path) = line.split(" ", 3)
+        manifest[path] = (sha, size, mtime)
+    remote = {}
+    for line in stat_text.splitlines():
+        (size, mtime, path) = line.split(" ", 2)
+        remote[path] = (size, mtime)
+
+    changed = []
+    for (src, dest) in files:
+        sha = _sha256(src)
+        entry = manifest.get(dest)
+        if entry and entry[0] == sha and remote.get(dest) == entry[1:]:
+            continue
+        # tar restores the local mtime, which stat reports in whole seconds
+        st = os.stat(src)
+        manifest[dest] = (sha, str(st.st_size), str(int(st.st_mtime)))
+        changed.append((src, dest))
+
+    LOGGER.info("Syncing %d of %d files to %s", len(changed), len(files), endpoint)
+    if not changed:
+        return (0, 0)
+
+    manifest_data = "".join(f"{sha} {size} {mtime} {path}\n" for (path, (sha, size, mtime)) in sorted(manifest.items()))
+    ret = _tar_copy(endpoint, changed, control_path, compress, extra=[(SYNC_MANIFEST, manifest_data.encode())])
+    return (ret, len(changed))
+
+def _parse_files(files):
+    transfers = []
+    for file in files or []:
+        colon = file.find(":")
+        transfers.append((file[:colon], file[colon + 1:]))
+    return transfers
+
+def _output_options(args):
+    return OutputOptions(args.log_file, args.timeout, args.command_timeout, args.tail_lines)
+
 def _run_test_args(args):
-    run_test(args.endpoint, args.script, args.files)
+    run_test(args.endpoint, args.script, args.files, args.transfer, args.compress, _output_options(args))
 
-def run_test(endpoint, script, files):
+def run_test(endpoint, script, files, transfer="tar", compress=False, output=OutputOptions()):
     """
     Run a test on a machine
 
@@ -80,24 +483,124 @@ def run_test(endpoint, script, files):
     1. Copy over a files which are tuples of (src, dest)
     2. Copy over the test script to "/tmp/test.sh"
     3. Run the test script and return the results
-    """
-    LOGGER.info("Copying files to %s", endpoint)
 
-    for file in files:
-        colon = file.find(":")
-        (src, dest) = (file[:colon], file[colon + 1:])
-        _scp(endpoint, src, dest)
+    All steps share one multiplexed ssh connection. With transfer="tar", the files
+    and script are sent as one tar stream, optionally gzip compressed, instead of
+    one scp per file, placed as scp -r would place them. transfer="sync" is like
+    "tar", but only sends the files that changed since the last sync to the same machine. Files with relative destinations
+    are always sent with scp.
 
-    LOGGER.info("Copying script to %s", endpoint)
-    _scp(endpoint, script, "/tmp/test.sh")
-    return_code = _ssh(endpoint, "/bin/bash -x /tmp/test.sh")
+    The test's output is streamed as described by output, see _ssh_stream. Raises
+    RemoteTestError with the tail of the output if the test fails or times out.
+    """
+    transfers = _parse_files(files) + [(script, "/tmp/test.sh")]
+
+    with _ssh_session(endpoint) as control_path:
+        LOGGER.info("Copying files and script to %s", endpoint)
+
+        if transfer == "tar":
+            scp_transfers = [t for t in transfers if not posixpath.isabs(t[1])]
+            tar_transfers = [t for t in transfers if posixpath.isabs(t[1])]
+            with PHASES.phase("copy", transfer="tar", files=len(tar_transfers)):
+                ret = _tar_copy(endpoint, _resolve_dests(endpoint, tar_transfers, control_path), control_path,
+                    compress)
+                if ret != 0:
+                    raise ValueError(f"copying files failed with {ret}")
+        elif transfer == "sync":
+            scp_transfers = [t for t in transfers if not posixpath.isabs(t[1])]
+            sync_transfers = [t for t in transfers if posixpath.isabs(t[1])]
+            with PHASES.phase("copy", transfer="sync") as record:
+                (ret, record["files"]) = _sync_copy(endpoint, sync_transfers, control_path, compress)
+                if ret != 0:
+                    raise ValueError(f"syncing files failed with {ret}")
+        else:
+            scp_transfers = transfers
+
+        for (src, dest) in scp_transfers:
+            with PHASES.phase("copy", transfer="scp", file=dest) as record:
+                if _scp(endpoint, src, dest, control_path) != 0:
+                    record["status"] = "FAIL"
+
+        with PHASES.phase("run_script") as record:
+            (return_code, timed_out, tail) = _ssh_stream(endpoint, "/bin/bash -x /tmp/test.sh", control_path, output)
+            if return_code != 0:
+                record["status"] = "FAIL"
+                record["log_raw"] = "\n".join(tail)
     if return_code != 0:
-        LOGGER.error("FAILED: %s", return_code)
-        raise ValueError(f"test failed with {return_code}")
+        LOGGER.error("FAILED: %s", timed_out or return_code)
+        raise RemoteTestError(timed_out or f"test failed with {return_code}", return_code, tail)
 
 def _get_region(arn):
     return arn.split(':')[3]
 
+# boto3's default session is not thread safe, so create clients one at a time.
+# Clients themselves are thread safe, and creating one is slow, so they are reused.
+_BOTO3_CLIENT_LOCK = threading.Lock()
+_BOTO3_CLIENTS = {}
+
+def _client(service, region_name=None):
+    with _BOTO3_CLIENT_LOCK:
+        key = (service, region_name)
+        if key not in _BOTO3_CLIENTS:
+            _BOTO3_CLIENTS[key] = boto3.client(service, region_name=region_name)
+        return _BOTO3_CLIENTS[key]
+
+def _with_backoff(fn, **kwargs):
+    """
+    Call an AWS API, retrying with exponential backoff while it is throttled.
+    """
+    for attempt in range(THROTTLE_RETRIES + 1):
+        try:
+            return fn(**kwargs)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "ThrottlingException" or attempt == THROTTLE_RETRIES:
+                raise
+            # Jitter the delay so concurrent callers do not retry in lockstep
+            delay = THROTTLE_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+            LOGGER.warning("Throttled, retrying in %.1f seconds", delay)
+            time.sleep(delay)
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _list_tasks(ecs_client, cluster, **kwargs):
+    arns = []
+    for page in ecs_client.get_paginator('list_tasks').paginate(cluster=cluster, **kwargs):
+        arns += page["taskArns"]
+    return arns
+
+def _describe_tasks(ecs_client, cluster, task_arns):
+    tasks = []
+    for chunk in _chunks(task_arns, ECS_MAX_DESCRIBE_TASKS):
+        tasks += ecs_client.describe_tasks(cluster=cluster, tasks=chunk)["tasks"]
+    return tasks
+
+def _task_network(task):
+    """
+    Get a task's ENI ids and private ip address.
+    """
+    enis = []
+    private_ip_address = None
+    for b in [ a['details'] for a in task["attachments"] if a['type'] == 'ElasticNetworkInterface']:
+        for c in b:
+            if c['name'] == 'networkInterfaceId':
+                enis.append(c['value'])
+            elif c['name'] == 'privateIPv4Address':
+                private_ip_address = c['value']
+    return enis, private_ip_address
+
+def _public_ips(ec2_client, enis):
+    """
+    Map ENI ids to their public ip address, with one describe_network_interfaces call for all of them.
+    """
+    public_ips = {}
+    for chunk in _chunks(enis, EC2_MAX_DESCRIBE_NETWORK_INTERFACES):
+        resp = ec2_client.describe_network_interfaces(NetworkInterfaceIds=chunk)
+        for n in resp["NetworkInterfaces"]:
+            if "Association" in n:
+                public_ips[n["NetworkInterfaceId"]] = n["Association"]["PublicIp"]
+    return public_ips
+
 
 def _remote_ps_container_args(args):
     remote_ps_container(args.cluster)
@@ -108,36 +611,28 @@ def remote_ps_container(cluster):
 
     Emulates the docker ps and ecs-cli ps commands.
     """
-    ecs_client = boto3.client('ecs', region_name=_get_region(cluster))
-    ec2_client = boto3.client('ec2', region_name=_get_region(cluster))
+    ecs_client = _client('ecs', _get_region(cluster))
+    ec2_client = _client('ec2', _get_region(cluster))
 
-    tasks = ecs_client.list_tasks(cluster=cluster)
+    task_list = _describe_tasks(ecs_client, cluster, _list_tasks(ecs_client, cluster))
 
-    task_list = ecs_client.describe_tasks(cluster=cluster, tasks=tasks['taskArns'])
+    networks = [_task_network(task) for task in task_list]
+    public_ips = _public_ips(ec2_client, [eni for (enis, _) in networks for eni in enis])
 
     #Example from ecs-cli tool
     #Name                                       State    Ports                    TaskDefinition  Health
     #aa2c2642-3013-4370-885e-8b8d956e753d/sshd  RUNNING  3.15.149.114:22->22/tcp  sshd:1          UNKNOWN
 
     print("Name                                       State    Public IP                Private IP               TaskDefinition  Health")
-    for task in task_list['tasks']:
+    for (task, (enis, private_ip_address)) in zip(task_list, networks):
 
         taskDefinition = task['taskDefinitionArn']
         taskDefinition_short = taskDefinition[taskDefinition.rfind('/') + 1:]
 
-        private_ip_address = None
-        enis = []
-        for b in [ a['details'] for a in task["attachments"] if a['type'] == 'ElasticNetworkInterface']:
-            for c in b:
-                if c['name'] == 'networkInterfaceId':
-                    enis.append(c['value'])
-                elif c['name'] == 'privateIPv4Address':
-                    private_ip_address = c['value']
         assert enis
         assert private_ip_address
 
-        eni = ec2_client.describe_network_interfaces(NetworkInterfaceIds=enis)
-        public_ip = [n["Association"]["PublicIp"] for n in eni["NetworkInterfaces"]][0]
+        public_ip = [public_ips[eni] for eni in enis if eni in public_ips][0]
 
         for container in task['containers']:
             taskArn = container['taskArn']
@@ -151,35 +646,74 @@ def remote_ps_container(cluster):
 def _remote_create_container_args(args):
     remote_create_container(args.cluster, args.task_definition, args.service, args.subnets, args.security_group)
 
-def remote_create_container(cluster, task_definition, service_name, subnets, security_group):
+def _list_services(ecs_client, cluster):
+    arns = []
+    for page in ecs_client.get_paginator('list_services').paginate(cluster=cluster):
+        arns += page["serviceArns"]
+    return arns
+
+def _describe_services(ecs_client, cluster, service_arns):
+    """
+    Describe services, with their tags, in batches of the most describe_services accepts.
+    """
+    services = []
+    for chunk in _chunks(service_arns, ECS_MAX_DESCRIBE_SERVICES):
+        services += ecs_client.describe_services(cluster=cluster, services=chunk, include=['TAGS'])["services"]
+    return services
+
+def _wait_services(ecs_client, cluster, service_arns, waiter_name):
+    waiter = ecs_client.get_waiter(waiter_name)
+    for chunk in _chunks(service_arns, ECS_MAX_DESCRIBE_SERVICES):
+        waiter.wait(cluster=cluster, services=chunk)
+
+def _tags(service):
+    return {tag['key']: tag['value'] for tag in service.get('tags', [])}
+
+def _service_name(service_arn):
+    return service_arn[service_arn.rfind('/') + 1:]
+
+def remote_create_container(cluster, task_definition, service_name, subnets, security_group, tags=None, wait=True):
     """
     Create a task in ECS
+
+    Returns the service ARN. With wait=False, returns without waiting for the service to become stable.
     """
-    ecs_client = boto3.client('ecs', region_name=_get_region(cluster))
-
-    resp = ecs_client.create_service(cluster=cluster, serviceName=service_name,
-        taskDefinition = task_definition,
-        desiredCount = 1,
-        launchType='FARGATE',
-        networkConfiguration={
-            'awsvpcConfiguration': {
-                'subnets': subnets,
-                'securityGroups': [
-                    security_group,
-                ],
-                'assignPublicIp': "ENABLED"
-            }
-        }
-        )
+    ecs_client = _client('ecs', _get_region(cluster))
+
+    extra_args = {}
+    if tags:
+        extra_args['tags'] = [{'key': key, 'value': value} for (key, value) in tags.items()]
+
+    with PHASES.phase("create_service"):
+        resp = ecs_client.create_service(cluster=cluster, serviceName=service_name,
+            taskDefinition = task_definition,
+            desiredCount = 1,
+            launchType='FARGATE',
+            networkConfiguration={
+                'awsvpcConfiguration': {
+                    'subnets': subnets,
+                    'securityGroups': [
+                        security_group,
+                    ],
+                    'assignPublicIp': "ENABLED"
+                }
+            },
+            **extra_args
+            )
 
     pprint.pprint(resp)
 
     service_arn = resp["service"]["serviceArn"]
+    if not wait:
+        return service_arn
+
     print(f"Waiting for Service {service_arn} to become active...")
 
     waiter = ecs_client.get_waiter('services_stable')
 
-    waiter.wait(cluster=cluster, services=[service_arn])
+    with PHASES.phase("wait_stable"):
+        waiter.wait(cluster=cluster, services=[service_arn])
+    return service_arn
 
 def _remote_stop_container_args(args):
     remote_stop_container(args.cluster, args.service)
@@ -188,9 +722,10 @@ def remote_stop_container(cluster, service_name):
     """
     Stop a ECS task
     """
-    ecs_client = boto3.client('ecs', region_name=_get_region(cluster))
+    ecs_client = _client('ecs', _get_region(cluster))
 
-    resp = ecs_client.delete_service(cluster=cluster, service=service_name, force=True)
+    with PHASES.phase("delete_service"):
+        resp = _with_backoff(ecs_client.delete_service, cluster=cluster, service=service_name, force=True)
     pprint.pprint(resp)
 
     service_arn = resp["service"]["serviceArn"]
@@ -198,81 +733,240 @@ def remote_stop_container(cluster, service_name):
     print(f"Waiting for Service {service_arn} to become inactive...")
     waiter = ecs_client.get_waiter('services_inactive')
 
-    waiter.wait(cluster=cluster, services=[service_arn])
+    with PHASES.phase("wait_inactive"):
+        waiter.wait(cluster=cluster, services=[service_arn])
 
 def _remote_gc_services_container_args(args):
-    remote_gc_services_container(args.cluster)
+    remote_gc_services_container(args.cluster, args.max_concurrency, args.dry_run)
 
-def remote_gc_services_container(cluster):
+def remote_gc_services_container(cluster, max_concurrency=DEFAULT_GC_CONCURRENCY, dry_run=False):
     """
     Delete all ECS services over then a given treshold.
+
+    Warm pool services are only deleted when they are leased past their lease expiration.
+    Services are deleted concurrently, then waited on together until they are inactive.
+    With dry_run, only print the services that would be deleted.
+
+    Returns the names of the expired services.
     """
-    ecs_client = boto3.client('ecs', region_name=_get_region(cluster))
+    ecs_client = _client('ecs', _get_region(cluster))
 
-    services = ecs_client.list_services(cluster=cluster)
-    if not services["serviceArns"]:
-        return
+    services = _list_services(ecs_client, cluster)
+    if not services:
+        return []
 
-    services_details = ecs_client.describe_services(cluster=cluster, services=services["serviceArns"])
+    services_details = _describe_services(ecs_client, cluster, services)
 
     not_expired_now = datetime.datetime.now().astimezone() - DEFAULT_GARBAGE_COLLECTION_THRESHOLD
+    action = "WOULD DELETE" if dry_run else "DELETING"
+
+    expired = []
+    for service in services_details:
+        if service["status"] != "ACTIVE":
+            # Already being deleted
+            continue
+
+        tags = _tags(service)
+        if POOL_TAG in tags:
+            if _lease_expired(tags, time.time()):
+                print("%s pool service %s whose lease expired at %s." % (action, service["serviceName"], tags[LEASE_EXPIRES_TAG]))
+                expired.append(service["serviceName"])
+            continue
 
-    for service in services_details["services"]:
         created_at = service["createdAt"]
 
         # Find the services that we created "too" long ago
         if created_at < not_expired_now:
-            print("DELETING expired service %s which was created at %s." % (service["serviceName"], created_at))
+            print("%s expired service %s which was created at %s." % (action, service["serviceName"], created_at))
+            expired.append(service["serviceName"])
+
+    if dry_run or not expired:
+        return expired
+
+    def delete(service_name):
+        resp = _with_backoff(ecs_client.delete_service, cluster=cluster, service=service_name, force=True)
+        return resp["service"]["serviceArn"]
+
+    deleted = []
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {executor.submit(delete, service_name): service_name for service_name in expired}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                deleted.append(future.result())
+            except Exception:
+                LOGGER.exception("Failed to delete service %s", futures[future])
+                failed.append(futures[future])
+
+    print(f"Waiting for {len(deleted)} services to become inactive...")
+    _wait_services(ecs_client, cluster, deleted, 'services_inactive')
+
+    if failed:
+        raise ValueError(f"Failed to delete services: {', '.join(failed)}")
 
-            remote_stop_container(cluster, service["serviceName"])
+    return expired
+
+def _lease_expired(tags, now):
+    return tags.get(LEASE_STATE_TAG) == 'leased' and float(tags.get(LEASE_EXPIRES_TAG, 0)) < now
+
+def _pool_services(ecs_client, cluster, pool):
+    services = _describe_services(ecs_client, cluster, _list_services(ecs_client, cluster))
+    return [s for s in services if s['status'] == 'ACTIVE' and _tags(s).get(POOL_TAG) == pool]
+
+def _service_ready(service):
+    # A service being reset has a second deployment until its new task is running
+    return (len(service['deployments']) == 1 and service['desiredCount'] > 0
+        and service['runningCount'] == service['desiredCount'])
+
+def _pool_fill_args(args):
+    pool_fill(args.cluster, args.task_definition, args.subnets, args.security_group, args.size, args.pool)
+
+def pool_fill(cluster, task_definition, subnets, security_group, size=DEFAULT_POOL_SIZE, pool=DEFAULT_POOL_NAME):
+    """
+    Create services until the warm pool has size services, and wait for them to become stable.
+    """
+    ecs_client = _client('ecs', _get_region(cluster))
+
+    missing = size - len(_pool_services(ecs_client, cluster, pool))
+    if missing <= 0:
+        return
+
+    tags = {POOL_TAG: pool, LEASE_STATE_TAG: 'free'}
+    service_arns = [remote_create_container(cluster, task_definition, f"pool-{pool}-{uuid.uuid4()}", subnets,
+        security_group, tags=tags, wait=False) for _ in range(missing)]
+
+    print(f"Waiting for {len(service_arns)} pool services to become active...")
+    _wait_services(ecs_client, cluster, service_arns, 'services_stable')
+
+def _pool_lease_args(args):
+    service_arn = pool_lease(args.cluster, args.pool, datetime.timedelta(minutes=args.lease_minutes),
+        args.lease_table)
+    if not service_arn:
+        raise ValueError(f"No free service in pool {args.pool}")
+    print(service_arn)
+    print(_get_endpoint(args.cluster, _service_name(service_arn)))
+
+def _lock_lease(dynamodb_client, table, service_arn, owner, expires):
+    """
+    Record a lease in the lease table, unless another unexpired lease holds the service.
+    """
+    try:
+        dynamodb_client.put_item(TableName=table,
+            Item={'service_arn': {'S': service_arn}, 'owner': {'S': owner}, 'expires': {'N': str(int(expires))}},
+            ConditionExpression='attribute_not_exists(service_arn) OR expires < :now',
+            ExpressionAttributeValues={':now': {'N': str(int(time.time()))}})
+        return True
+    except botocore.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+def pool_lease(cluster, pool=DEFAULT_POOL_NAME, lease_duration=DEFAULT_LEASE_DURATION, lease_table=DEFAULT_LEASE_TABLE):
+    """
+    Lease a free, ready service from the warm pool.
+
+    Returns the service ARN, or None if no service is free. The lease is recorded in the
+    service's tags, and remote_gc_services reaps the service if the lease is not returned
+    before it expires.
+
+    With a lease_table, a conditional write to it makes the lease exclusive. Without one,
+    each candidate is described again just before tagging it, and the lease is only kept
+    if the tags still name this caller after they settle.
+    """
+    ecs_client = _client('ecs', _get_region(cluster))
+    dynamodb_client = _client('dynamodb', _get_region(cluster)) if lease_table else None
+    owner = str(uuid.uuid4())
+
+    for candidate in _pool_services(ecs_client, cluster, pool):
+        service_arn = candidate['serviceArn']
+        # The list is stale by the time a lost race on an earlier candidate settles
+        (service,) = _describe_services(ecs_client, cluster, [service_arn])
+        if _tags(service).get(LEASE_STATE_TAG) != 'free' or not _service_ready(service):
+            continue
+
+        expires = time.time() + lease_duration.total_seconds()
+        if dynamodb_client and not _lock_lease(dynamodb_client, lease_table, service_arn, owner, expires):
+            continue
+        ecs_client.tag_resource(resourceArn=service_arn, tags=[
+            {'key': LEASE_STATE_TAG, 'value': 'leased'},
+            {'key': LEASE_OWNER_TAG, 'value': owner},
+            {'key': LEASE_EXPIRES_TAG, 'value': str(int(expires))},
+        ])
+        if dynamodb_client:
+            LOGGER.info("Leased %s until %s", service_arn, int(expires))
+            return service_arn
+
+        # Another caller may have tagged the same service at the same time, the last tag wins
+        time.sleep(LEASE_SETTLE_SECONDS)
+        (current,) = _describe_services(ecs_client, cluster, [service_arn])
+        tags = _tags(current)
+        if tags.get(LEASE_STATE_TAG) == 'leased' and tags.get(LEASE_OWNER_TAG) == owner:
+            LOGGER.info("Leased %s until %s", service_arn, int(expires))
+            return service_arn
+
+    return None
+
+def _pool_return_args(args):
+    pool_return(args.cluster, args.service, args.lease_table)
+
+def pool_return(cluster, service_arn, lease_table=DEFAULT_LEASE_TABLE):
+    """
+    Reset a leased service and return it to the warm pool.
+
+    The reset replaces the service's task with a fresh one, and pool_lease skips the service until the
+    replacement is running.
+    """
+    ecs_client = _client('ecs', _get_region(cluster))
+
+    ecs_client.update_service(cluster=cluster, service=service_arn, forceNewDeployment=True)
+    ecs_client.untag_resource(resourceArn=service_arn, tagKeys=[LEASE_OWNER_TAG, LEASE_EXPIRES_TAG])
+    ecs_client.tag_resource(resourceArn=service_arn, tags=[{'key': LEASE_STATE_TAG, 'value': 'free'}])
+    if lease_table:
+        _client('dynamodb', _get_region(cluster)).delete_item(TableName=lease_table,
+            Key={'service_arn': {'S': service_arn}})
+    LOGGER.info("Returned %s to the pool", service_arn)
 
 def remote_get_public_endpoint_str(cluster, service_name):
     """
     Get an SSH connection string for the remote service via the public ip address
     """
-    ecs_client = boto3.client('ecs', region_name=_get_region(cluster))
-    ec2_client = boto3.client('ec2', region_name=_get_region(cluster))
+    ecs_client = _client('ecs', _get_region(cluster))
+    ec2_client = _client('ec2', _get_region(cluster))
 
     tasks = ecs_client.list_tasks(cluster=cluster, serviceName=service_name)
 
-    task_list = ecs_client.describe_tasks(cluster=cluster, tasks=tasks['taskArns'])
+    # Only the first task is used, so only describe that one
+    task_list = ecs_client.describe_tasks(cluster=cluster, tasks=tasks['taskArns'][:1])
 
     for task in task_list['tasks']:
 
-        enis = []
-        for b in [ a['details'] for a in task["attachments"] if a['type'] == 'ElasticNetworkInterface']:
-            for c in b:
-                if c['name'] == 'networkInterfaceId':
-                    enis.append(c['value'])
+        (enis, _) = _task_network(task)
         assert enis
 
-        eni = ec2_client.describe_network_interfaces(NetworkInterfaceIds=enis)
-        public_ip = [n["Association"]["PublicIp"] for n in eni["NetworkInterfaces"]][0]
+        public_ips = _public_ips(ec2_client, enis)
+        public_ip = [public_ips[eni] for eni in enis if eni in public_ips][0]
         break
 
-    return f"root@{public_ip}:22"
+    return f"{SSH_USER}@{public_ip}:{SSH_PORT}"
 
 def remote_get_endpoint_str(cluster, service_name):
     """
     Get an SSH connection string for the remote service via the private ip address
     """
-    ecs_client = boto3.client('ecs', region_name=_get_region(cluster))
+    ecs_client = _client('ecs', _get_region(cluster))
 
     tasks = ecs_client.list_tasks(cluster=cluster, serviceName=service_name)
 
-    task_list = ecs_client.describe_tasks(cluster=cluster, tasks=tasks['taskArns'])
+    # Only the first task is used, so only describe that one
+    task_list = ecs_client.describe_tasks(cluster=cluster, tasks=tasks['taskArns'][:1])
 
     for task in task_list['tasks']:
 
-        private_ip_address = None
-        for b in [ a['details'] for a in task["attachments"] if a['type'] == 'ElasticNetworkInterface']:
-            for c in b:
-                if c['name'] == 'privateIPv4Address':
-                    private_ip_address = c['value']
+        (_, private_ip_address) = _task_network(task)
         assert private_ip_address
         break
 
-    return f"root@{private_ip_address}:22"
+    return f"{SSH_USER}@{private_ip_address}:{SSH_PORT}"
 
 def _remote_get_endpoint_args(args):
     _remote_get_endpoint(args.cluster, args.service)
@@ -282,37 +976,126 @@ def _remote_get_endpoint(cluster, service_name):
     print(endpoint)
 
 def _get_caller_identity(args):
-    sts_client = boto3.client('sts')
+    sts_client = _client('sts')
 
     pprint.pprint(sts_client.get_caller_identity())
 
 
 def _run_e2e_test_args(args):
-    _run_e2e_test(args.script, args.files, args.cluster, args.task_definition, args.subnets, args.security_group)
+    _run_e2e_test(args.script, args.files, args.cluster, args.task_definition, args.subnets, args.security_group,
+        args.transfer, args.compress, args.pool, _output_options(args))
 
-def _run_e2e_test(script, files, cluster, task_definition, subnets, security_group):
+def _get_endpoint(cluster, service_name):
+    with PHASES.phase("endpoint"):
+        if cluster == ECS_DEFAULT_CLUSTER:
+            # The test account hosted ECS tasks are only available via the public ip address
+            return remote_get_public_endpoint_str(cluster, service_name)
+
+        # The build account hosted ECS tasks are the opposite, only private ip address access
+        return remote_get_endpoint_str(cluster, service_name)
+
+def _run_e2e_test(script, files, cluster, task_definition, subnets, security_group, transfer="tar", compress=False,
+        pool=None, output=OutputOptions()):
     """
     Run a test end-to-end
 
-    1. Start an ECS service
+    1. Start an ECS service, or lease one from the warm pool if given a pool name
     2. Copy the files over and run the test
-    3. Stop the ECS service
+    3. Stop the ECS service, or reset it and return it to the pool
     """
-    service_name = str(uuid.uuid4())
-
-    remote_create_container(cluster, task_definition, service_name, subnets, security_group)
+    if pool:
+        with PHASES.phase("pool_lease"):
+            service_arn = pool_lease(cluster, pool)
+        if service_arn:
+            try:
+                run_test(_get_endpoint(cluster, _service_name(service_arn)), script, files, transfer, compress, output)
+            finally:
+                with PHASES.phase("pool_return"):
+                    pool_return(cluster, service_arn)
+            return
+
+        LOGGER.warning("No free service in pool %s, creating a new service", pool)
 
-    # The build account hosted ECS tasks are only available via the private ip address
-    endpoint = remote_get_endpoint_str(cluster, service_name)
-    if cluster == ECS_DEFAULT_CLUSTER:
-        # The test account hosted ECS tasks are the opposite, only public ip address access
-        endpoint = remote_get_public_endpoint_str(cluster, service_name)
+    service_name = str(uuid.uuid4())
 
     try:
-        run_test(endpoint, script, files)
+        remote_create_container(cluster, task_definition, service_name, subnets, security_group)
+
+        run_test(_get_endpoint(cluster, service_name), script, files, transfer, compress, output)
     finally:
-        remote_stop_container(cluster, service_name)
+        try:
+            remote_stop_container(cluster, service_name)
+        except Exception:
+            # Do not hide the test's own error, remote_gc_services reaps leaked services
+            LOGGER.exception("Failed to stop service %s", service_name)
+
+def _load_matrix(scripts, files, matrix_file):
+    """
+    Build the list of test cases, each a dict with a "script" and "files".
+
+    Each script shares the --files list. A matrix file is a JSON list of
+    objects with a "script" and optional "files" and "name".
+    """
+    cases = [{"name": script, "script": script, "files": files or []} for script in scripts or []]
+    if matrix_file:
+        with open(matrix_file) as f:
+            for case in json.load(f):
+                cases.append({"name": case.get("name", case["script"]), "script": case["script"],
+                    "files": case.get("files", [])})
+    if not cases:
+        raise ValueError("run_e2e_matrix needs at least one --scripts entry or a --matrix file")
+    return cases
+
+def _run_e2e_matrix_args(args):
+    run_e2e_matrix(_load_matrix(args.scripts, args.files, args.matrix), args.cluster, args.task_definition,
+        args.subnets, args.security_group, args.max_containers, args.transfer, args.compress, args.pool,
+        _output_options(args))
+
+def run_e2e_matrix(cases, cluster, task_definition, subnets, security_group, max_containers=DEFAULT_MAX_CONTAINERS,
+        transfer="tar", compress=False, pool=None, output=OutputOptions()):
+    """
+    Run several tests end-to-end at the same time, each in its own ECS service.
 
+    At most max_containers services exist at once. Every service is stopped
+    whether its test passes or fails. Raises ValueError if any test failed.
+    Output lines are prefixed with the test's name.
+    """
+    def run_case(case):
+        start = time.monotonic()
+        try:
+            with PHASES.labels(case=case["name"]):
+                _run_e2e_test(case["script"], case["files"], cluster, task_definition, subnets, security_group,
+                    transfer, compress, pool, output._replace(prefix=case["name"] + " "))
+            return (case["name"], "PASS", time.monotonic() - start, None)
+        except Exception as e:
+            LOGGER.exception("Test %s failed", case["name"])
+            return (case["name"], "FAIL", time.monotonic() - start, e)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_containers) as executor:
+        results = list(executor.map(run_case, cases))
+
+    print("{:<50}{:<8}{:>10}".format("Test", "Status", "Seconds"))
+    for (name, status, elapsed, error) in results:
+        print("{:<50}{:<8}{:>10.1f}".format(name, status, elapsed))
+        if error:
+            # The full error, with any output tail, was logged when the test failed
+            print(f"    {type(error).__name__}: {(str(error).splitlines() or [''])[0]}")
+
+    failed = [name for (name, status, _, _) in results if status != "PASS"]
+    if failed:
+        raise ValueError(f"{len(failed)} of {len(results)} tests failed: {', '.join(failed)}")
+
+
+def _add_transfer_args(cmd):
+    cmd.add_argument("--transfer", choices=["tar", "scp", "sync"], default="tar",
+        help="Send files as one tar stream, with one scp per file, or as one tar stream of the files that changed since the last sync")
+    cmd.add_argument("--compress", action='store_true', help="Gzip the tar stream")
+
+def _add_output_args(cmd):
+    cmd.add_argument("--log_file", type=str, help="Append the test's timestamped output to this file")
+    cmd.add_argument("--timeout", type=float, help="Seconds before the test is killed")
+    cmd.add_argument("--command_timeout", type=float, help="Seconds without output before the test is killed")
+    cmd.add_argument("--tail_lines", type=int, default=DEFAULT_TAIL_LINES, help="Lines of output to report when the test fails")
 
 def main() -> None:
     """Execute Main entry point."""
@@ -321,6 +1104,8 @@ def main() -> None:
 
     parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
     parser.add_argument('-d', "--debug", action='store_true', help="Enable debug logging")
+    parser.add_argument("--results_json", type=str, help="Append phase timings to this results.json file")
+    parser.add_argument("--records_jsonl", type=str, help="Stream phase timings to this JSON lines file")
 
     sub = parser.add_subparsers(title="Container Tester subcommands", help="sub-command help")
 
@@ -328,6 +1113,8 @@ def main() -> None:
     run_test_cmd.add_argument("--endpoint", required=True, type=str, help="User and Host and port, ie user@host:port")
     run_test_cmd.add_argument("--script", required=True, type=str, help="script to run")
     run_test_cmd.add_argument("--files", type=str, nargs="*", help="Files to copy, each string must be a pair of src:dest joined by a colon")
+    _add_transfer_args(run_test_cmd)
+    _add_output_args(run_test_cmd)
     run_test_cmd.set_defaults(func=_run_test_args)
 
     remote_ps_cmd = sub.add_parser('remote_ps', help='Stop Local Container')
@@ -349,6 +1136,8 @@ def main() -> None:
 
     remote_gc_services_cmd = sub.add_parser('remote_gc_services', help='GC Remote Container')
     remote_gc_services_cmd.add_argument("--cluster", type=str, default=ECS_DEFAULT_CLUSTER, help="ECS Cluster to target")
+    remote_gc_services_cmd.add_argument("--max_concurrency", type=int, default=DEFAULT_GC_CONCURRENCY, help="Number of services to delete at once")
+    remote_gc_services_cmd.add_argument("--dry_run", action='store_true', help="Print the services that would be deleted")
     remote_gc_services_cmd.set_defaults(func=_remote_gc_services_container_args)
 
     get_caller_identity_cmd = sub.add_parser('get_caller_identity', help='Get the AWS IAM caller identity')
@@ -366,8 +1155,47 @@ def main() -> None:
     run_e2e_test_cmd.add_argument("--task_definition", type=str, default=ECS_DEFAULT_TASK_DEFINITION, help="ECS Task Definition to use to create service")
     run_e2e_test_cmd.add_argument("--subnets", type=str, nargs="*", default=ECS_DEFAULT_SUBNETS, help="EC2 subnets to use")
     run_e2e_test_cmd.add_argument("--security_group", type=str, default=ECS_DEFAULT_SECURITY_GROUP, help="EC2 security group use")
+    run_e2e_test_cmd.add_argument("--pool", type=str, help="Lease a container from this warm pool instead of creating one")
+    _add_transfer_args(run_e2e_test_cmd)
+    _add_output_args(run_e2e_test_cmd)
     run_e2e_test_cmd.set_defaults(func=_run_e2e_test_args)
 
+    run_e2e_matrix_cmd = sub.add_parser('run_e2e_matrix', help='Run several tests concurrently, each in its own container')
+    run_e2e_matrix_cmd.add_argument("--scripts", type=str, nargs="*", help="scripts to run, each in its own container")
+    run_e2e_matrix_cmd.add_argument("--files", type=str, nargs="*", help="Files to copy for every script, each string must be a pair of src:dest joined by a colon")
+    run_e2e_matrix_cmd.add_argument("--matrix", type=str, help="JSON file listing test cases as objects with a script and optional files and name")
+    run_e2e_matrix_cmd.add_argument("--max_containers", type=int, default=DEFAULT_MAX_CONTAINERS, help="Maximum number of containers to run at once")
+    run_e2e_matrix_cmd.add_argument("--cluster", type=str, default=ECS_DEFAULT_CLUSTER, help="ECS Cluster to target")
+    run_e2e_matrix_cmd.add_argument("--task_definition", type=str, default=ECS_DEFAULT_TASK_DEFINITION, help="ECS Task Definition to use to create service")
+    run_e2e_matrix_cmd.add_argument("--subnets", type=str, nargs="*", default=ECS_DEFAULT_SUBNETS, help="EC2 subnets to use")
+    run_e2e_matrix_cmd.add_argument("--security_group", type=str, default=ECS_DEFAULT_SECURITY_GROUP, help="EC2 security group use")
+    run_e2e_matrix_cmd.add_argument("--pool", type=str, help="Lease containers from this warm pool instead of creating them")
+    _add_transfer_args(run_e2e_matrix_cmd)
+    _add_output_args(run_e2e_matrix_cmd)
+    run_e2e_matrix_cmd.set_defaults(func=_run_e2e_matrix_args)
+
+    pool_fill_cmd = sub.add_parser('pool_fill', help='Create services until the warm pool is full')
+    pool_fill_cmd.add_argument("--pool", type=str, default=DEFAULT_POOL_NAME, help="Warm pool name")
+    pool_fill_cmd.add_argument("--size", type=int, default=DEFAULT_POOL_SIZE, help="Number of services to keep in the pool")
+    pool_fill_cmd.add_argument("--cluster", type=str, default=ECS_DEFAULT_CLUSTER, help="ECS Cluster to target")
+    pool_fill_cmd.add_argument("--task_definition", type=str, default=ECS_DEFAULT_TASK_DEFINITION, help="ECS Task Definition to use to create service")
+    pool_fill_cmd.add_argument("--subnets", type=str, nargs="*", default=ECS_DEFAULT_SUBNETS, help="EC2 subnets to use")
+    pool_fill_cmd.add_argument("--security_group", type=str, default=ECS_DEFAULT_SECURITY_GROUP, help="EC2 security group use")
+    pool_fill_cmd.set_defaults(func=_pool_fill_args)
+
+    pool_lease_cmd = sub.add_parser('pool_lease', help='Lease a service from the warm pool, print its ARN and SSH endpoint')
+    pool_lease_cmd.add_argument("--pool", type=str, default=DEFAULT_POOL_NAME, help="Warm pool name")
+    pool_lease_cmd.add_argument("--lease_minutes", type=int, default=int(DEFAULT_LEASE_DURATION.total_seconds() // 60), help="Minutes until the lease expires")
+    pool_lease_cmd.add_argument("--cluster", type=str, default=ECS_DEFAULT_CLUSTER, help="ECS Cluster to target")
+    pool_lease_cmd.add_argument("--lease_table", type=str, default=DEFAULT_LEASE_TABLE, help="DynamoDB table that makes leases exclusive")
+    pool_lease_cmd.set_defaults(func=_pool_lease_args)
+
+    pool_return_cmd = sub.add_parser('pool_return', help='Reset a leased service and return it to the warm pool')
+    pool_return_cmd.add_argument("--service", type=str, required=True, help="ARN of the leased ECS Service")
+    pool_return_cmd.add_argument("--cluster", type=str, default=ECS_DEFAULT_CLUSTER, help="ECS Cluster to target")
+    pool_return_cmd.add_argument("--lease_table", type=str, default=DEFAULT_LEASE_TABLE, help="DynamoDB table that makes leases exclusive")
+    pool_return_cmd.set_defaults(func=_pool_return_args)
+
     args = parser.parse_args()
 
     print("AWS_SHARED_CREDENTIALS_FILE: %s" % (os.getenv("AWS_SHARED_CREDENTIALS_FILE")))
@@ -377,8 +1205,17 @@ def main() -> None:
     elif args.verbose:
         logging.basicConfig(level=logging.INFO)
 
+    if args.records_jsonl:
+        PHASES.stream_to(args.records_jsonl)
 
-    args.func(args)
+    try:
+        args.func(args)
+    finally:
+        PHASES.close()
+        if args.results_json and PHASES.records:
+            PHASES.write_results(args.results_json)
+        for (phase, seconds, count) in PHASES.summary():
+            LOGGER.info("PHASE %-16s %8.1fs total over %d", phase, seconds, count)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the ECS, EC2 and STS APIs that container_tester uses.
+
+    python3 fake_aws.py --provision_latency 5 --sshd -- run_e2e_matrix --scripts a.sh b.sh
+
+Replaces boto3 in container_tester with FakeAWS, then runs container_tester
+with the arguments after "--". The fake keeps its services, tasks and network
+interfaces in memory, so they only last as long as the process.
+
+Services take provision_latency seconds to start their tasks, and
+drain_latency seconds to become inactive after they are deleted. Every API
+call sleeps call_latency seconds and is counted in FakeAWS.calls. Each task
+gets its own loopback address, and with --sshd an unprivileged sshd is
+started on that address for the life of the task, see local_sshd.py.
+"""
+
+import argparse
+import collections
+import datetime
+import getpass
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+
+import botocore.exceptions
+
+import container_tester
+
+LOGGER = logging.getLogger(__name__)
+
+ACCOUNT_ID = "000000000000"
+REGION = "us-east-2"
+
+# Page sizes of the list APIs and batch limits of the describe APIs
+LIST_TASKS_PAGE = 100
+LIST_SERVICES_PAGE = 10
+DESCRIBE_TASKS_LIMIT = 100
+DESCRIBE_SERVICES_LIMIT = 10
+
+# Seconds between waiter polls, and polls before the waiter gives up
+WAITER_DELAY = 0.1
+WAITER_MAX_ATTEMPTS = 600
+
+# botocore's legacy retry mode makes up to 5 attempts at a throttled call
+BOTOCORE_MAX_ATTEMPTS = 5
+
+# Port the --sshd stand-ins listen on, on each task's loopback address
+FAKE_SSH_PORT = 2222
+
+def _error(code, operation, message=""):
+    return botocore.exceptions.ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+def _now():
+    return datetime.datetime.now().astimezone()
+
+class _Task:
+    def __init__(self, service, address, ready_at):
+        task_id = uuid.uuid4().hex
+        self.arn = f"arn:aws:ecs:{REGION}:{ACCOUNT_ID}:task/{service.cluster_name}/{task_id}"
+        self.eni = f"eni-{task_id[:17]}"
+        self.service = service
+        self.address = address
+        self.ready_at = ready_at
+        self.stopped = False
+
+    def status(self, now):
+        if self.stopped:
+            return "STOPPED"
+        return "RUNNING" if now >= self.ready_at else "PENDING"
+
+    def describe(self, now):
+        status = self.status(now)
+        return {
+            "taskArn": self.arn,
+            "clusterArn": self.service.cluster,
+            "taskDefinitionArn": self.service.task_definition,
+            "lastStatus": status,
+            "attachments": [{"type": "ElasticNetworkInterface", "details": [
+                {"name": "networkInterfaceId", "value": self.eni},
+                {"name": "privateIPv4Address", "value": self.address},
+            ]}],
+            "containers": [{"taskArn": self.arn, "name": "sshd", "lastStatus": status}],
+        }
+
+class _Service:
+    def __init__(self, cluster, name, task_definition, desired_count, tags, created_at):
+        self.cluster = cluster
+        self.cluster_name = cluster[cluster.rfind('/') + 1:]
+        self.name = name
+        self.arn = f"arn:aws:ecs:{REGION}:{ACCOUNT_ID}:service/{self.cluster_name}/{name}"
+        self.task_definition = task_definition
+        self.desired_count = desired_count
+        self.tags = dict(tags)
+        self.created_at = created_at
+        self.status = "ACTIVE"
+        self.inactive_at = None
+        # Deployments are [id, created_at, tasks], newest last
+        self.deployments = []
+
+    def tasks(self):
+        return [task for (_, _, tasks) in self.deployments for task in tasks if not task.stopped]
+
+    def describe(self, now, include_tags):
+        deployments = [{"id": deployment_id, "status": "PRIMARY" if i == len(self.deployments) - 1 else "ACTIVE",
+                        "createdAt": created_at, "desiredCount": self.desired_count}
+                       for (i, (deployment_id, created_at, _)) in enumerate(self.deployments)]
+        service = {
+            "serviceArn": self.arn,
+            "serviceName": self.name,
+            "clusterArn": self.cluster,
+            "taskDefinition": self.task_definition,
+            "status": self.status,
+            "desiredCount": self.desired_count if self.status == "ACTIVE" else 0,
+            "runningCount": sum(1 for task in self.tasks() if task.status(now) == "RUNNING"),
+            "pendingCount": sum(1 for task in self.tasks() if task.status(now) == "PENDING"),
+            "deployments": deployments,
+            "createdAt": self.created_at,
+        }
+        if include_tags:
+            service["tags"] = [{"key": key, "value": value} for (key, value) in self.tags.items()]
+        return service
+
+class _Paginator:
+    def __init__(self, method):
+        self._method = method
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self._method(**kwargs, **({"nextToken": token} if token else {}))
+            yield page
+            token = page.get("nextToken")
+            if not token:
+                return
+
+class _Waiter:
+    def __init__(self, name, done):
+        self._name = name
+        self._done = done
+
+    def wait(self, **kwargs):
+        for _ in range(WAITER_MAX_ATTEMPTS):
+            if self._done(**kwargs):
+                return
+            time.sleep(WAITER_DELAY)
+        raise botocore.exceptions.WaiterError(name=self._name, reason="Max attempts exceeded", last_response={})
+
+class _Client:
+    def __init__(self, aws):
+        self._aws = aws
+
+    def get_paginator(self, name):
+        return _Paginator(getattr(self, name))
+
+    def _call(self, operation):
+        self._aws.record_call(f"{self.SERVICE}.{operation}")
+
+    @staticmethod
+    def _page(items, size, key, nextToken=None):
+        start = int(nextToken or 0)
+        page = {key: items[start:start + size]}
+        if start + size < len(items):
+            page["nextToken"] = str(start + size)
+        return page
+
+class _ECS(_Client):
+    SERVICE = "ecs"
+
+    def create_service(self, cluster, serviceName, taskDefinition, desiredCount=1, tags=(), **kwargs):
+        self._call("create_service")
+        tags = {tag["key"]: tag["value"] for tag in tags}
+        service = self._aws.add_service(cluster, serviceName, taskDefinition, desiredCount, tags)
+        with self._aws.lock:
+            return {"service": service.describe(time.time(), include_tags=True)}
+
+    def update_service(self, cluster, service, desiredCount=None, forceNewDeployment=False, **kwargs):
+        self._call("update_service")
+        with self._aws.lock:
+            svc = self._aws.find_service(cluster, service, "UpdateService")
+            if desiredCount is not None:
+                svc.desired_count = desiredCount
+            if forceNewDeployment or desiredCount is not None:
+                self._aws.deploy(svc)
+            result = {"service": svc.describe(time.time(), include_tags=False)}
+        self._aws.run_hooks()
+        return result
+
+    def delete_service(self, cluster, service, force=False):
+        self._call("delete_service")
+        with self._aws.lock:
+            svc = self._aws.find_service(cluster, service, "DeleteService")
+            if svc.desired_count and not force:
+                raise _error("InvalidParameterException", "DeleteService", "The service cannot be stopped while it is scaled above 0.")
+            svc.status = "DRAINING"
+            svc.inactive_at = time.time() + self._aws.drain_latency
+            for task in svc.tasks():
+                self._aws.stop_task(task)
+            result = {"service": svc.describe(time.time(), include_tags=False)}
+        self._aws.run_hooks()
+        return result
+
+    def list_services(self, cluster, nextToken=None, **kwargs):
+        self._call("list_services")
+        with self._aws.lock:
+            arns = [svc.arn for svc in self._aws.services(cluster) if svc.status != "INACTIVE"]
+        return self._page(arns, LIST_SERVICES_PAGE, "serviceArns", nextToken)
+
+    def describe_services(self, cluster, services, include=()):
+        self._call("describe_services")
+        return self._describe_services(cluster, services, "TAGS" in include)
+
+    def _describe_services(self, cluster, services, include_tags=False):
+        if len(services) > DESCRIBE_SERVICES_LIMIT:
+            raise _error("InvalidParameterException", "DescribeServices", "services can have at most 10 items.")
+        now = time.time()
+        with self._aws.lock:
+            found = []
+            failures = []
+            for name in services:
+                svc = self._aws.get_service(cluster, name)
+                if svc:
+                    found.append(svc.describe(now, include_tags))
+                else:
+                    failures.append({"arn": name, "reason": "MISSING"})
+        return {"services": found, "failures": failures}
+
+    def list_tasks(self, cluster, serviceName=None, nextToken=None, **kwargs):
+        self._call("list_tasks")
+        with self._aws.lock:
+            services = self._aws.services(cluster)
+            if serviceName:
+                services = [svc for svc in services if serviceName in (svc.name, svc.arn)]
+            arns = [task.arn for svc in services for task in svc.tasks()]
+        return self._page(arns, LIST_TASKS_PAGE, "taskArns", nextToken)
+
+    def describe_tasks(self, cluster, tasks):
+        self._call("describe_tasks")
+        if len(tasks) > DESCRIBE_TASKS_LIMIT:
+            raise _error("InvalidParameterException", "DescribeTasks", "tasks can have at most 100 items.")
+        now = time.time()
+        with self._aws.lock:
+            found = [self._aws.tasks[arn].describe(now) for arn in tasks if arn in self._aws.tasks]
+            failures = [{"arn": arn, "reason": "MISSING"} for arn in tasks if arn not in self._aws.tasks]
+        return {"tasks": found, "failures": failures}
+
+    def tag_resource(self, resourceArn, tags):
+        self._call("tag_resource")
+        with self._aws.lock:
+            svc = self._aws.find_service(None, resourceArn, "TagResource")
+            svc.tags.update({tag["key"]: tag["value"] for tag in tags})
+        return {}
+
+    def untag_resource(self, resourceArn, tagKeys):
+        self._call("untag_resource")
+        with self._aws.lock:
+            svc = self._aws.find_service(None, resourceArn, "UntagResource")
+            for key in tagKeys:
+                svc.tags.pop(key, None)
+        return {}
+
+    def get_waiter(self, name):
+        # Waiters poll describe_services, and like botocore's, do not retry throttled polls
+        def stable(cluster, services):
+            self._aws.record_call("ecs.describe_services", throttle=False)
+            resp = self._describe_services(cluster, services)
+            if resp["failures"] or any(s["status"] != "ACTIVE" for s in resp["services"]):
+                raise botocore.exceptions.WaiterError(name=name, reason="Waiter encountered a terminal failure state", last_response=resp)
+            return all(len(s["deployments"]) == 1 and s["runningCount"] == s["desiredCount"] for s in resp["services"])
+
+        def inactive(cluster, services):
+            self._aws.record_call("ecs.describe_services", throttle=False)
+            resp = self._describe_services(cluster, services)
+            if resp["failures"]:
+                raise botocore.exceptions.WaiterError(name=name, reason="Waiter encountered a terminal failure state", last_response=resp)
+            return all(s["status"] == "INACTIVE" for s in resp["services"])
+
+        return _Waiter(name, {"services_stable": stable, "services_inactive": inactive}[name])
+
+class _EC2(_Client):
+    SERVICE = "ec2"
+
+    def describe_network_interfaces(self, NetworkInterfaceIds):
+        self._call("describe_network_interfaces")
+        with self._aws.lock:
+            missing = [eni for eni in NetworkInterfaceIds if eni not in self._aws.enis]
+            if missing:
+                raise _error("InvalidNetworkInterfaceID.NotFound", "DescribeNetworkInterfaces",
+                    f"The networkInterface ID '{missing[0]}' does not exist")
+            tasks = [self._aws.enis[eni] for eni in NetworkInterfaceIds]
+        return {"NetworkInterfaces": [{
+            "NetworkInterfaceId": task.eni,
+            "PrivateIpAddress": task.address,
+            "Association": {"PublicIp": task.address},
+        } for task in tasks]}
+
+class _STS(_Client):
+    SERVICE = "sts"
+
+    def get_caller_identity(self):
+        self._call("get_caller_identity")
+        return {"UserId": "AIDAFAKEUSER", "Account": ACCOUNT_ID, "Arn": f"arn:aws:iam::{ACCOUNT_ID}:user/fake"}
+
+    def assume_role(self, RoleArn, RoleSessionName, DurationSeconds=3600, **kwargs):
+        self._call("assume_role")
+        role_name = RoleArn[RoleArn.rfind('/') + 1:]
+        return {
+            "Credentials": {
+                "AccessKeyId": "ASIA" + uuid.uuid4().hex[:16].upper(),
+                "SecretAccessKey": uuid.uuid4().hex,
+                "SessionToken": uuid.uuid4().hex,
+                "Expiration": _now() + datetime.timedelta(seconds=DurationSeconds),
+            },
+            "AssumedRoleUser": {
+                "AssumedRoleId": f"AROAFAKEROLE:{RoleSessionName}",
+                "Arn": f"arn:aws:sts::{ACCOUNT_ID}:assumed-role/{role_name}/{RoleSessionName}",
+            },
+        }
+
+class FakeAWS:
+    """
+    A module-like stand-in for boto3, with in-memory ECS, EC2 and STS backends.
+
+    on_task_start and on_task_stop are called with a task's address when it is
+    created and when it is stopped.
+    """
+    def __init__(self, provision_latency=0.0, drain_latency=0.0, call_latency=0.0, throttle_rate=0.0,
+            on_task_start=None, on_task_stop=None, seed=None):
+        self.provision_latency = provision_latency
+        self.drain_latency = drain_latency
+        self.call_latency = call_latency
+        self.throttle_rate = throttle_rate
+        self.on_task_start = on_task_start
+        self.on_task_stop = on_task_stop
+        self.calls = collections.Counter()
+        self.lock = threading.RLock()
+        self.tasks = {}
+        self.enis = {}
+        self._services = {}
+        self._random = random.Random(seed)
+        self._next_address = 0
+        self._hooks = []
+
+    def client(self, service, region_name=None):
+        self.record_call("boto3.client", throttle=False)
+        return {"ecs": _ECS, "ec2": _EC2, "sts": _STS}[service](self)
+
+    def record_call(self, name, throttle=True):
+        # Like botocore, retry throttled calls before raising ThrottlingException
+        for _ in range(BOTOCORE_MAX_ATTEMPTS):
+            with self.lock:
+                self.calls[name] += 1
+                throttled = throttle and self._random.random() < self.throttle_rate
+                if throttled:
+                    self.calls["throttled"] += 1
+            time.sleep(self.call_latency)
+            if not throttled:
+                return
+        raise _error("ThrottlingException", name, "Rate exceeded")
+
+    def services(self, cluster):
+        self._refresh()
+        return [svc for svc in self._services.values() if svc.cluster == cluster]
+
+    def get_service(self, cluster, name_or_arn):
+        self._refresh()
+        for svc in reversed(list(self._services.values())):
+            if cluster not in (None, svc.cluster):
+                continue
+            if name_or_arn == svc.arn or (name_or_arn == svc.name and svc.status != "INACTIVE"):
+                return svc
+        return None
+
+    def find_service(self, cluster, name_or_arn, operation):
+        svc = self.get_service(cluster, name_or_arn)
+        if not svc or svc.status != "ACTIVE":
+            raise _error("ServiceNotActiveException" if svc else "ServiceNotFoundException", operation, "Service not found.")
+        return svc
+
+    def add_service(self, cluster, name, task_definition="fake-task-definition:1", desired_count=1, tags=(),
+            age=datetime.timedelta(0)):
+        """
+        Create a service, as if it was created age ago.
+        """
+        with self.lock:
+            if self.get_service(cluster, name):
+                raise _error("InvalidParameterException", "CreateService", "Creation of service was not idempotent.")
+            svc = _Service(cluster, name, task_definition, desired_count, tags, _now() - age)
+            self._services[svc.arn] = svc
+            self.deploy(svc, ready_at=time.time() + (self.provision_latency if not age else 0))
+        self.run_hooks()
+        return svc
+
+    def deploy(self, svc, ready_at=None):
+        """
+        Start a new deployment, which replaces the service's tasks once they are running.
+        """
+        ready_at = ready_at if ready_at is not None else time.time() + self.provision_latency
+        tasks = []
+        for _ in range(svc.desired_count):
+            task = _Task(svc, self._allocate_address(), ready_at)
+            self.tasks[task.arn] = task
+            self.enis[task.eni] = task
+            self._hooks.append((self.on_task_start, task.address))
+            tasks.append(task)
+        svc.deployments.append((f"ecs-svc/{uuid.uuid4().int % 10 ** 19}", _now(), tasks))
+
+    def stop_task(self, task):
+        task.stopped = True
+        self.tasks.pop(task.arn, None)
+        self.enis.pop(task.eni, None)
+        self._hooks.append((self.on_task_stop, task.address))
+
+    def run_hooks(self):
+        """
+        Call the task hooks queued by the last API call, outside of the lock.
+        """
+        with self.lock:
+            (hooks, self._hooks) = (self._hooks, [])
+        for (hook, address) in hooks:
+            if hook:
+                hook(address)
+
+    def _allocate_address(self):
+        # Any address in 127.0.0.0/8 is local, so each task can have its own sshd
+        n = self._next_address
+        self._next_address += 1
+        return f"127.0.{n // 250}.{n % 250 + 2}"
+
+    def _refresh(self):
+        now = time.time()
+        for svc in self._services.values():
+            if svc.status == "DRAINING" and now >= svc.inactive_at:
+                svc.status = "INACTIVE"
+            # Once the newest deployment's tasks are running, the older deployments are stopped
+            if len(svc.deployments) > 1 and all(task.status(now) == "RUNNING" for task in svc.deployments[-1][2]):
+                for (_, _, tasks) in svc.deployments[:-1]:
+                    for task in tasks:
+                        if not task.stopped:
+                            self.stop_task(task)
+                svc.deployments = svc.deployments[-1:]
+
+    def close(self):
+        with self.lock:
+            for task in list(self.tasks.values()):
+                self.stop_task(task)
+        self.run_hooks()
+
+def install(aws):
+    """
+    Make container_tester use aws in place of boto3.
+    """
+    container_tester.boto3 = aws
+    container_tester._BOTO3_CLIENTS.clear()
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='Run container_tester against an offline fake of ECS, EC2 and STS.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument("--provision_latency", type=float, default=2.0, help="Seconds for a service's tasks to start")
+    parser.add_argument("--drain_latency", type=float, default=1.0, help="Seconds for a deleted service to become inactive")
+    parser.add_argument("--call_latency", type=float, default=0.02, help="Seconds per API call")
+    parser.add_argument("--throttle_rate", type=float, default=0.0, help="Fraction of API calls that are throttled")
+    parser.add_argument("--stale_services", type=int, default=0, help="Services to create two hours ago, for remote_gc_services")
+    parser.add_argument("--warm_pool", type=int, default=0, help="Free services to create in the default warm pool")
+    parser.add_argument("--sshd", action='store_true', help="Run a local sshd for each task")
+    parser.add_argument("container_tester_args", nargs=argparse.REMAINDER, help="Arguments for container_tester, after --")
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    sshd = None
+    hooks = {}
+    if args.sshd:
+        from local_sshd import LocalSshd
+        sshd = LocalSshd()
+        container_tester.SSH_USER = getpass.getuser()
+        container_tester.SSH_PORT = FAKE_SSH_PORT
+        hooks = {"on_task_start": lambda address: sshd.start(address, FAKE_SSH_PORT),
+                 "on_task_stop": lambda address: sshd.stop(address, FAKE_SSH_PORT)}
+
+    aws = FakeAWS(args.provision_latency, args.drain_latency, args.call_latency, args.throttle_rate, **hooks)
+    install(aws)
+
+    for i in range(args.stale_services):
+        aws.add_service(container_tester.ECS_DEFAULT_CLUSTER, f"stale-{i}", age=datetime.timedelta(hours=2))
+    for i in range(args.warm_pool):
+        aws.add_service(container_tester.ECS_DEFAULT_CLUSTER, f"pool-{i}", age=datetime.timedelta(minutes=1),
+            tags={container_tester.POOL_TAG: container_tester.DEFAULT_POOL_NAME, container_tester.LEASE_STATE_TAG: 'free'})
+
+    rest = args.container_tester_args
+    if rest[:1] == ["--"]:
+        rest = rest[1:]
+
+    sys.argv = ["container_tester.py"] + rest
+    try:
+        container_tester.main()
+    finally:
+        aws.close()
+        if sshd:
+            sshd.close()
+        LOGGER.info("API calls: %s", dict(aws.calls))
+
+
+if __name__ == "__main__":
+    main()
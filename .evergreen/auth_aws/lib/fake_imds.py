@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the EC2 instance metadata service.
+
+    python3 fake_imds.py --attach_after 1.5
+
+Serves the instance id and, once attach_after seconds have passed, an instance
+profile's role and credentials, over HTTP/1.1 keep-alive connections. IMDSv2
+session tokens are handed out and checked, and --require_token rejects IMDSv1
+requests like an instance with tokens required.
+
+Run as a script, it times aws_assign_instance_profile waiting for the profile
+and reports the requests and connections it took. Pass --serve to only run
+the server, for AWS_EC2_METADATA_SERVICE_ENDPOINT to point at.
+"""
+
+import argparse
+import http.server
+import json
+import logging
+import threading
+import time
+import uuid
+
+import aws_assign_instance_profile
+
+LOGGER = logging.getLogger(__name__)
+
+INSTANCE_ID = "i-0123456789abcdef0"
+ROLE_NAME = "fake-instance-profile-role"
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.stats["connections"] += 1
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format, *args)
+
+    def _send(self, status, body=""):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        self.server.stats["requests"] += 1
+        if self.path != "/latest/api/token" or "X-aws-ec2-metadata-token-ttl-seconds" not in self.headers:
+            self._send(400)
+            return
+        token = uuid.uuid4().hex
+        self.server.tokens.add(token)
+        self._send(200, token)
+
+    def do_GET(self):
+        self.server.stats["requests"] += 1
+        token = self.headers.get("X-aws-ec2-metadata-token")
+        if token is not None and token not in self.server.tokens:
+            self._send(401)
+            return
+        if token is None and self.server.require_token:
+            self._send(401)
+            return
+
+        attached = time.monotonic() >= self.server.attach_at
+        base = "/latest/meta-data/iam/security-credentials/"
+        if self.path == "/latest/meta-data/instance-id":
+            self._send(200, INSTANCE_ID)
+        elif self.path == base and attached:
+            self._send(200, ROLE_NAME)
+        elif self.path == base + ROLE_NAME and attached:
+            self._send(200, json.dumps({"Code": "Success", "AccessKeyId": "ASIAFAKE", "SecretAccessKey": "fake",
+                "Token": "fake", "Expiration": "2100-01-01T00:00:00Z"}))
+        else:
+            self._send(404)
+
+class FakeMetadataServer(http.server.ThreadingHTTPServer):
+    """
+    Serve fake instance metadata on a free localhost port in a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, attach_after=0.0, require_token=False, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.attach_at = time.monotonic() + attach_after
+        self.require_token = require_token
+        self.tokens = set()
+        self.stats = {"connections": 0, "requests": 0}
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='Fake EC2 instance metadata service.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument("--attach_after", type=float, default=1.5, help="Seconds until the instance profile appears")
+    parser.add_argument("--require_token", action='store_true', help="Reject requests without an IMDSv2 token")
+    parser.add_argument("--serve", action='store_true', help="Only serve until interrupted")
+    parser.add_argument("--port", type=int, default=0, help="Port to serve on, defaults to a free port")
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    with FakeMetadataServer(args.attach_after, args.require_token, args.port) as server:
+        if args.serve:
+            print(f"Serving on {server.endpoint}")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return
+
+        client = aws_assign_instance_profile.MetadataClient(server.endpoint)
+        start = time.monotonic()
+        aws_assign_instance_profile._wait_instance_profile(client)
+        elapsed = time.monotonic() - start
+        client.close()
+
+        print(f"Profile attached after {args.attach_after:.1f}s, seen after {elapsed:.2f}s, "
+              f"{server.stats['requests']} requests over {server.stats['connections']} connections")
+
+
+if __name__ == "__main__":
+    main()
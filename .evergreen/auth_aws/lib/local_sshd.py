@@ -0,0 +1,115 @@
+"""
+Unprivileged sshd processes on the local host, as stand-ins for ECS containers.
+
+Every sshd shares one host key, and accepts one client key that is loaded into
+a private ssh-agent, so plain ssh and scp as run by container_tester log in
+without prompting. Each sshd can listen on its own loopback address, which on
+Linux is any address in 127.0.0.0/8.
+
+Requires sshd, ssh-keygen, ssh-agent and ssh-add on the local host.
+"""
+
+import getpass
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+SSHD_CONFIG = """\
+ListenAddress {address}
+Port {port}
+HostKey {dir}/host_key
+AuthorizedKeysFile {dir}/client_key.pub
+PidFile {dir}/sshd-{address}-{port}.pid
+PasswordAuthentication no
+StrictModes no
+UsePAM no
+"""
+
+def free_port(address="127.0.0.1"):
+    with socket.socket() as sock:
+        sock.bind((address, 0))
+        return sock.getsockname()[1]
+
+def _wait_for_port(address, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((address, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise ValueError(f"sshd did not start listening on {address}:{port}")
+
+class LocalSshd:
+    """
+    Start sshd processes that accept the current user's ssh and scp.
+
+    Sets SSH_AUTH_SOCK in this process's environment while open.
+    """
+    def __init__(self):
+        self._work_dir = tempfile.mkdtemp(prefix="local-sshd-")
+        self._sshds = {}
+        self._agent = None
+        self._old_auth_sock = os.environ.get("SSH_AUTH_SOCK")
+
+        for key in ("host_key", "client_key"):
+            subprocess.run(["ssh-keygen", "-q", "-t", "ed25519", "-N", "", "-f", os.path.join(self._work_dir, key)], check=True)
+
+        # container_tester runs plain ssh and scp, which pick keys up from the agent.
+        agent_sock = os.path.join(self._work_dir, "agent.sock")
+        self._agent = subprocess.Popen(["ssh-agent", "-D", "-a", agent_sock], stdout=subprocess.DEVNULL)
+        while not os.path.exists(agent_sock):
+            time.sleep(0.05)
+        os.environ["SSH_AUTH_SOCK"] = agent_sock
+        try:
+            subprocess.run(["ssh-add", "-q", os.path.join(self._work_dir, "client_key")], check=True)
+        except subprocess.CalledProcessError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self, address="127.0.0.1", port=None):
+        """
+        Start an sshd listening on address, and return its user@host:port endpoint.
+        """
+        port = port or free_port(address)
+        config = os.path.join(self._work_dir, f"sshd_config-{address}-{port}")
+        with open(config, "w") as f:
+            f.write(SSHD_CONFIG.format(address=address, port=port, dir=self._work_dir))
+
+        sshd_path = shutil.which("sshd") or "/usr/sbin/sshd"
+        self._sshds[(address, port)] = subprocess.Popen([sshd_path, "-D", "-e", "-f", config], stderr=subprocess.DEVNULL)
+        _wait_for_port(address, port)
+        LOGGER.info("Started sshd on %s:%s", address, port)
+
+        return f"{getpass.getuser()}@{address}:{port}"
+
+    def stop(self, address="127.0.0.1", port=None):
+        for key in [key for key in self._sshds if key[0] == address and port in (None, key[1])]:
+            proc = self._sshds.pop(key)
+            proc.terminate()
+            proc.wait()
+
+    def close(self):
+        for (address, port) in list(self._sshds):
+            self.stop(address, port)
+        if self._agent:
+            self._agent.terminate()
+            self._agent.wait()
+            self._agent = None
+        if self._old_auth_sock is None:
+            os.environ.pop("SSH_AUTH_SOCK", None)
+        else:
+            os.environ["SSH_AUTH_SOCK"] = self._old_auth_sock
+        shutil.rmtree(self._work_dir, ignore_errors=True)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Benchmark mongodb_download against a local HTTP server.
+
+    python3 benchmark_download.py --size_mb 200 --bandwidth_mb 25
+
+Serves a generated MongoDB-like archive from a local server that sends an
+ETag and Last-Modified, answers conditional and range requests, and can hold
+each connection to a bandwidth like a CDN does. Then times downloading and
+unpacking it the way download-mongodb.sh did, one request and then tar, against
+concurrent range requests, unpacking while downloading, unpacking only the
+binaries orchestration needs, and the cache cold and warm. Pass --serve to
+only run the server.
+"""
+
+import argparse
+import email.utils
+import hashlib
+import http.server
+import io
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+
+import mongodb_download
+
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_PATH = "/mongodb-linux-x86_64-benchmark.tgz"
+
+def make_archive(size_mb):
+    """
+    Return a .tgz laid out like a server archive, with about size_mb of incompressible binaries.
+    """
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz", compresslevel=1) as tar:
+        for (name, share) in [("mongod", 0.35), ("mongos", 0.25), ("mongo", 0.1), ("mongodump", 0.1),
+                ("mongorestore", 0.1), ("mongoexport", 0.05), ("mongoimport", 0.05)]:
+            data = os.urandom(int(size_mb * share * 1024 * 1024))
+            info = tarfile.TarInfo(f"mongodb-linux-x86_64-benchmark/bin/{name}")
+            info.size = len(data)
+            info.mode = 0o755
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format, *args)
+
+    def do_GET(self):
+        server = self.server
+        server.stats["requests"] += 1
+        if self.path != ARCHIVE_PATH:
+            self.send_error(404)
+            return
+
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.send_header("ETag", server.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        (start, end) = (0, len(server.archive) - 1)
+        ranged = self._range() if self.headers.get("If-Range", server.etag) == server.etag else None
+        if ranged:
+            (start, end) = (ranged[0], min(ranged[1], end))
+            server.stats["ranges"] += 1
+
+        self.send_response(206 if ranged else 200)
+        self.send_header("Content-Type", "application/gzip")
+        self.send_header("Content-Length", str(end - start + 1))
+        if ranged:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.archive)}")
+        self.send_header("Accept-Ranges", "bytes" if server.ranges else "none")
+        self.send_header("ETag", server.etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.end_headers()
+        self._write(memoryview(server.archive)[start:end + 1])
+
+    def _range(self):
+        # Only the single "bytes=start-end" ranges mongodb_download asks for
+        value = self.headers.get("Range", "")
+        if not self.server.ranges or not value.startswith("bytes=") or "," in value:
+            return None
+        (start, _, end) = value[len("bytes="):].partition("-")
+        return (int(start), int(end)) if start and end else None
+
+    def _write(self, data):
+        # Send in 64 KB slices, sleeping to hold each connection to the configured bandwidth
+        step = 64 * 1024
+        start = time.monotonic()
+        for offset in range(0, len(data), step):
+            self.wfile.write(data[offset:offset + step])
+            self.server.stats["bytes"] += len(data[offset:offset + step])
+            if self.server.bandwidth:
+                ahead = (offset + step) / self.server.bandwidth - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+class DownloadServer(http.server.ThreadingHTTPServer):
+    """
+    Serve an archive on a free localhost port in a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, archive, bandwidth=None, ranges=True, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.archive = archive
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.etag = '"%s"' % hashlib.md5(archive).hexdigest()
+        self.last_modified = email.utils.formatdate(usegmt=True)
+        self.stats = {"requests": 0, "ranges": 0, "bytes": 0}
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}{ARCHIVE_PATH}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+def _timed(server, fn):
+    server.stats.update(requests=0, ranges=0, bytes=0)
+    start = time.monotonic()
+    fn()
+    return (time.monotonic() - start, dict(server.stats))
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='Benchmark the MongoDB download cache.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument("--size_mb", type=float, default=100, help="Size of the generated archive")
+    parser.add_argument("--bandwidth_mb", type=float, default=0, help="Bandwidth per connection in MB/s, 0 for unlimited")
+    parser.add_argument("--connections", type=int, default=mongodb_download.DEFAULT_CONNECTIONS,
+        help="Concurrent range requests per download")
+    parser.add_argument("--serve", action='store_true', help="Only serve until interrupted")
+    parser.add_argument("--port", type=int, default=0, help="Port to serve on, defaults to a free port")
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    archive = make_archive(args.size_mb)
+    bandwidth = args.bandwidth_mb * 1024 * 1024 or None
+    with DownloadServer(archive, bandwidth, port=args.port) as server:
+        if args.serve:
+            print(f"Serving {len(archive)} bytes at {server.url}")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return
+
+        work_dir = tempfile.mkdtemp(prefix="benchmark-download-")
+        try:
+            cache = mongodb_download.DownloadCache(os.path.join(work_dir, "cache"), connections=args.connections)
+            dest = os.path.join(work_dir, "mongodb-binaries.tgz")
+            out = os.path.join(work_dir, "out")
+            binaries = ("mongod", "mongos", "mongo")
+
+            def download_then_extract(connections):
+                mongodb_download._download(server.url, dest, connections=connections)
+                with tarfile.open(dest) as tar:
+                    tar.extractall(out)
+                os.unlink(dest)
+
+            print(f"{len(archive) / 1024 / 1024:.1f} MB archive, "
+                  + (f"{args.bandwidth_mb:g} MB/s per connection" if bandwidth else "unlimited bandwidth")
+                  + f", {args.connections} connections")
+            for (name, fn) in [
+                    ("download, then tar", lambda: download_then_extract(1)),
+                    ("ranged, then tar", lambda: download_then_extract(args.connections)),
+                    ("streamed", lambda: mongodb_download.extract(server.url, out, connections=args.connections)),
+                    ("streamed binaries", lambda: mongodb_download.extract(server.url, out, binaries,
+                        args.connections)),
+                    ("cold cache", lambda: cache.extract(server.url, out, binaries)),
+                    ("warm cache", lambda: cache.extract(server.url, out, binaries)),
+                    ]:
+                shutil.rmtree(out, ignore_errors=True)
+                (elapsed, stats) = _timed(server, fn)
+                print(f"{name:<20}{elapsed:8.3f}s  {stats['requests']:3d} requests  {stats['ranges']:3d} ranges  "
+                      f"{stats['bytes']:>12} bytes")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
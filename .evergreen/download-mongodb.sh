@@ -1,6 +1,7 @@
 #!/bin/sh
 
-#For future use the feed to get full list of distros : http://downloads.mongodb.org/full.json
+# get_mongodb_download_url_for resolves versions with an index of the release
+# feed, http://downloads.mongodb.org/full.json, see mongodb_versions.py.
 
 set -o xtrace   # Write all commands first to stderr
 set -o errexit  # Exit the script with error if any of the commands fail
@@ -41,6 +42,16 @@ get_distro ()
    echo $DISTRO
 }
 
+# Sets PYTHON3 to a Python 3.6+ with fcntl, for the download cache and version
+# index, or to an empty string if there is none.
+find_python3 ()
+{
+   PYTHON3=$(command -v /opt/mongodbtoolchain/v3/bin/python3 || command -v python3 || true)
+   if [ -n "$PYTHON3" ] && ! $PYTHON3 -c 'import fcntl, sys; assert sys.version_info >= (3, 6)' >/dev/null 2>&1; then
+      PYTHON3=""
+   fi
+}
+
 # get_mongodb_download_url_for "linux-distro-version-architecture" "latest|40|36|34|32|30|28|26|24"
 # Sets EXTRACT to aproprate extract command
 # Sets MONGODB_DOWNLOAD_URL to the aproprate download url
@@ -368,6 +379,24 @@ get_mongodb_download_url_for ()
       2.4) MONGODB_DOWNLOAD_URL=$MONGODB_24 ;;
    esac
 
+   # Prefer the release feed's download for the version, which for a series
+   # like 4.2 is its newest release, see mongodb_versions.py. Development
+   # builds like latest are not in the feed. Set MONGODB_VERSIONS_NO_INDEX to
+   # only use the URLs above.
+   # MONGODB_INDEXED_URL and MONGODB_INDEXED_SHA256 record the feed's download
+   # and its sha256, if it has one, for download_and_extract to verify.
+   find_python3
+   MONGODB_INDEXED_URL=""
+   MONGODB_INDEXED_SHA256=""
+   if [ -n "$_VERSION" ] && [ -n "$PYTHON3" ] && [ -z "$MONGODB_VERSIONS_NO_INDEX" ] \
+         && [ -f "$DRIVERS_TOOLS/.evergreen/mongodb_versions.py" ]; then
+      MONGODB_INDEXED_URL=$($PYTHON3 "$DRIVERS_TOOLS/.evergreen/mongodb_versions.py" resolve "$_DISTRO" "$_VERSION" 2>/dev/null || true)
+      if [ -n "$MONGODB_INDEXED_URL" ]; then
+         MONGODB_DOWNLOAD_URL=$MONGODB_INDEXED_URL
+         MONGODB_INDEXED_SHA256=$($PYTHON3 "$DRIVERS_TOOLS/.evergreen/mongodb_versions.py" resolve --sha256 "$_DISTRO" "$_VERSION" 2>/dev/null || true)
+      fi
+   fi
+
    [ -z "$MONGODB_DOWNLOAD_URL" ] && MONGODB_DOWNLOAD_URL="Unknown version: $_VERSION for $_DISTRO"
 
    echo $MONGODB_DOWNLOAD_URL
@@ -379,10 +408,51 @@ download_and_extract ()
    EXTRACT=$2
 
    cd $DRIVERS_TOOLS
-   curl --retry 8 -sS $MONGODB_DOWNLOAD_URL --max-time 300 --output mongodb-binaries.tgz
-   $EXTRACT mongodb-binaries.tgz
+   # Download through the host's shared download cache when Python 3.6+ with
+   # fcntl is available, see mongodb_download.py. A .tgz is unpacked while it
+   # downloads, and only the programs named in MONGODB_EXTRACT_ONLY if it is set,
+   # e.g. MONGODB_EXTRACT_ONLY="mongod mongos mongo". Set MONGODB_DOWNLOAD_NO_CACHE
+   # to always download with curl.
+   find_python3
+   MONGODB_DOWNLOAD=""
+   if [ -z "$MONGODB_DOWNLOAD_NO_CACHE" ] && [ -n "$PYTHON3" ]; then
+      MONGODB_DOWNLOAD="$PYTHON3 $DRIVERS_TOOLS/.evergreen/mongodb_download.py -v"
+   fi
+
+   # Verify the download if get_mongodb_download_url_for found its sha256 in
+   # the release feed.
+   _SHA256=""
+   if [ "$MONGODB_DOWNLOAD_URL" = "$MONGODB_INDEXED_URL" ]; then
+      _SHA256=$MONGODB_INDEXED_SHA256
+   fi
+
+   _DOWNLOADED=""
+   if [ -n "$MONGODB_DOWNLOAD" ] && [ "$EXTRACT" = "tar zxf" ]; then
+      $MONGODB_DOWNLOAD extract $MONGODB_DOWNLOAD_URL . ${MONGODB_EXTRACT_ONLY:+--binaries $MONGODB_EXTRACT_ONLY} \
+         ${_SHA256:+--sha256 $_SHA256} && _DOWNLOADED=extracted
+   elif [ -n "$MONGODB_DOWNLOAD" ]; then
+      $MONGODB_DOWNLOAD fetch $MONGODB_DOWNLOAD_URL mongodb-binaries.tgz ${_SHA256:+--sha256 $_SHA256} && _DOWNLOADED=fetched
+   fi
+
+   if [ "$_DOWNLOADED" != "extracted" ]; then
+      if [ -z "$_DOWNLOADED" ]; then
+         # Fall back to curl once. mongodb_download.py has already retried, so
+         # curl only retries a couple of times after it.
+         _CURL_RETRIES=8
+         if [ -n "$MONGODB_DOWNLOAD" ]; then
+            _CURL_RETRIES=2
+         fi
+         curl --retry $_CURL_RETRIES -sS $MONGODB_DOWNLOAD_URL --max-time 300 --output mongodb-binaries.tgz
+         if [ -n "$_SHA256" ] && [ "$($PYTHON3 -c 'import hashlib, sys; print(hashlib.sha256(open(sys.argv[1], "rb").read()).hexdigest())' mongodb-binaries.tgz)" != "$_SHA256" ]; then
+            echo "mongodb-binaries.tgz from $MONGODB_DOWNLOAD_URL does not have sha256 $_SHA256"
+            rm -f mongodb-binaries.tgz
+            exit 1
+         fi
+      fi
+      $EXTRACT mongodb-binaries.tgz
+      rm -f mongodb-binaries.tgz
+   fi
 
-   rm -f mongodb-binaries.tgz
    mv mongodb* mongodb
    chmod -R +x mongodb
    find . -name vcredist_x64.exe -exec {} /install /quiet \;
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for mongo-orchestration's REST API.
+
+    python3 fake_orchestration.py --startup_delay 1.5
+
+Answers after startup_delay seconds, like a server that is still importing
+and binding, and creates clusters after create_delay seconds, describing
+them with a mongodb_uri but starting nothing.
+
+Run as a script, it times orchestration_client launching it as a separate
+process and starting a cluster, against the ten seconds of sleeps that
+start-orchestration.sh used. Pass --serve to only run the server, for
+orchestration_client's launch command.
+"""
+
+import argparse
+import http.server
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import orchestration_client
+
+LOGGER = logging.getLogger(__name__)
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format, *args)
+
+    def _send(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _topology(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] == "v1" and parts[1] in orchestration_client.TOPOLOGIES:
+            return (parts[1], parts[2] if len(parts) > 2 else None)
+        return (None, None)
+
+    def do_GET(self):
+        (topology, cluster_id) = self._topology()
+        if self.path == "/":
+            self._send(200, {"service": "mongo-orchestration", "version": "fake"})
+        elif self.path == "/v1/servers":
+            self._send(200, {"servers": list(self.server.servers.values())})
+        elif (topology, cluster_id, self.path.strip("/").split("/")[-1]) in self.server.members:
+            # A cluster's members, shards, routers or configsvrs
+            self._send(200, self.server.members[(topology, cluster_id, self.path.strip("/").split("/")[-1])])
+        elif topology and cluster_id in self.server.clusters:
+            self._send(200, self.server.clusters[cluster_id])
+        else:
+            self._send(404)
+
+    def do_POST(self):
+        (topology, cluster_id) = self._topology()
+        config = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if topology == "servers" and cluster_id in self.server.servers:
+            self.server.servers[cluster_id]["procInfo"]["alive"] = config.get("action") != "stop"
+            self._send(200, self.server.servers[cluster_id])
+            return
+        if not topology:
+            self._send(404)
+            return
+
+        time.sleep(self.server.create_delay)
+        cluster_id = config.get("id") or str(uuid.uuid4())
+        self.server.add_cluster(topology, cluster_id, config)
+        port = orchestration_client._process_params(topology, config)[0][1].get("port", 27017)
+        cluster = {"id": cluster_id, "mongodb_uri": f"mongodb://127.0.0.1:{port}"}
+        if config.get("login"):
+            cluster["mongodb_auth_uri"] = f"mongodb://{config['login']}:{config.get('password', '')}@127.0.0.1:{port}"
+        self.server.clusters[cluster_id] = cluster
+        self._send(200, cluster)
+
+    def do_DELETE(self):
+        (topology, cluster_id) = self._topology()
+        if topology and self.server.clusters.pop(cluster_id, None):
+            self._send(204)
+        else:
+            self._send(404)
+
+class FakeOrchestrationServer(http.server.ThreadingHTTPServer):
+    """
+    Serve a fake mongo-orchestration on localhost in a background thread.
+
+    Like mongo-orchestration, it gives each mongod a dbpath and writes an
+    options file for each process, but it starts none of them.
+    """
+    daemon_threads = True
+
+    def __init__(self, create_delay=0.0, port=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.create_delay = create_delay
+        self.clusters = {}
+        self.servers = {}
+        # Map (topology, cluster id, "members", "shards", "routers" or "configsvrs") to what mongo-orchestration lists
+        self.members = {}
+        self.work_dir = tempfile.mkdtemp(prefix="fake-orchestration-")
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def add_server(self, name, params, auth_key=None, server_id=None):
+        server_id = server_id or str(uuid.uuid4())
+        server_dir = os.path.join(self.work_dir, server_id)
+        os.makedirs(server_dir)
+        params = dict(params)
+        params.setdefault("logpath", os.path.join(server_dir, f"{name}.log"))
+        if name == "mongod":
+            params["dbpath"] = params.get("dbpath") or os.path.join(server_dir, "db")
+            os.makedirs(params["dbpath"], exist_ok=True)
+            with open(os.path.join(params["dbpath"], "WiredTiger"), "w") as f:
+                f.write(f"fake data for port {params.get('port')}\n")
+        if auth_key:
+            params["keyFile"] = os.path.join(server_dir, "key")
+            with open(params["keyFile"], "w") as f:
+                f.write(auth_key)
+        optfile = os.path.join(server_dir, f"{name}.conf")
+        with open(optfile, "w") as f:
+            f.write("\n".join(f"{key}={value}" for (key, value) in params.items()))
+        self.servers[server_id] = {"id": server_id, "name": name, "procInfo":
+            {"name": name, "params": params, "optfile": optfile, "pid": None, "alive": True}}
+        return server_id
+
+    def add_cluster(self, topology, cluster_id, config):
+        """
+        Add the servers of a topology config, and list its members as mongo-orchestration does.
+        """
+        auth_key = config.get("auth_key")
+        if topology == "servers":
+            self.add_server("mongod", config.get("procParams", {}), auth_key, cluster_id)
+        elif topology == "replica_sets":
+            self._add_replica_set(cluster_id, config.get("members", []), auth_key)
+        else:
+            key = (topology, cluster_id)
+            self.members[key + ("routers",)] = [{"id": self.add_server("mongos", router, auth_key)}
+                                                for router in config.get("routers", [])]
+            self.members[key + ("configsvrs",)] = [{"id": self.add_server("mongod", configsvr, auth_key)}
+                                                   for configsvr in config.get("configsvrs", [])]
+            shards = []
+            for shard in config.get("shards", []):
+                shard_params = shard.get("shardParams", {})
+                if "members" in shard_params:
+                    set_id = shard_params.get("id") or str(uuid.uuid4())
+                    self._add_replica_set(set_id, shard_params["members"], auth_key)
+                    shards.append({"id": shard.get("id"), "_id": set_id, "isReplicaSet": True})
+                else:
+                    server_id = self.add_server("mongod", shard_params.get("procParams", {}), auth_key)
+                    shards.append({"id": shard.get("id"), "_id": server_id, "isServer": True})
+            self.members[key + ("shards",)] = shards
+
+    def _add_replica_set(self, set_id, members, auth_key):
+        # mongo-orchestration names each member's replica set after the set's id
+        self.members[("replica_sets", set_id, "members")] = [
+            {"_id": i, "server_id": self.add_server("mongod", dict(member.get("procParams", {}), replSet=set_id), auth_key)}
+            for (i, member) in enumerate(members)]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _serve(args):
+    time.sleep(args.startup_delay)
+    with FakeOrchestrationServer(args.create_delay, args.port) as server:
+        print(f"Serving on {server.url}", flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+def _compare(args):
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    work_dir = tempfile.mkdtemp(prefix="fake-orchestration-")
+    config = os.path.join(work_dir, "basic.json")
+    with open(config, "w") as f:
+        json.dump({"name": "mongod", "procParams": {"port": 27017}}, f)
+
+    timer = orchestration_client.StepTimer()
+    process = orchestration_client.launch(work_dir, [sys.executable, os.path.abspath(__file__), "--serve",
+        "--port", str(port), "--startup_delay", str(args.startup_delay), "--create_delay", str(args.create_delay)],
+        url, timer=timer)
+    try:
+        orchestration_client.start_cluster(config, url + "/v1/servers", os.path.join(work_dir, "mo-expansion.yml"),
+            os.path.join(work_dir, "tmp.json"), work_dir, timer)
+    finally:
+        process.terminate()
+        process.wait()
+
+    for record in timer.records:
+        print(f"{record['test_file']:<24}{record['elapsed']:8.3f}s")
+    total = sum(record["elapsed"] for record in timer.records)
+    print(f"{'total':<24}{total:8.3f}s, against at least {10 + args.create_delay:.3f}s with fixed sleeps")
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='Fake mongo-orchestration.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument("--startup_delay", type=float, default=1.5, help="Seconds before the server answers")
+    parser.add_argument("--create_delay", type=float, default=0.5, help="Seconds to create a cluster")
+    parser.add_argument("--serve", action='store_true', help="Only serve until interrupted")
+    parser.add_argument("--port", type=int, default=8889, help="Port to serve on")
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if args.serve:
+        _serve(args)
+    else:
+        _compare(args)
+
+
+if __name__ == "__main__":
+    main()
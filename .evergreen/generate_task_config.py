@@ -1,31 +1,22 @@
-import itertools
+"""Print the standard test tasks for config.yml.
 
+The tasks are compiled from the matrix in task_matrix.yml with
+evergreen_config_generator, which is imported from this checkout.
+"""
 
-TASK_TEMPLATE = '''
-    - name: "test-{version}-{topology}"
-      tags: ["{version}", "{topology}"]
-      commands:
-        - func: "bootstrap mongo-orchestration"
-          vars:
-            VERSION: "{version}"
-            TOPOLOGY: "{mo_topology}"
-        - func: "run tests"'''
+import os
+import sys
 
-MONGODB_VERSIONS = ['2.4', '2.6', '3.0', '3.2', '3.4', 'latest']
-TOPOLOGY_OPTIONS = ['standalone', 'replica_set', 'sharded_cluster']
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'evergreen_config_generator'))
 
+from evergreen_config_generator import yaml_dump
+from evergreen_config_generator.spec import load
 
-def create_task(version, topology):
-    mo_topology= topology
-    # mongo-orchestration uses 'server' as the name for 'standalone'
-    if mo_topology == 'standalone':
-        mo_topology = 'server'
-    return TASK_TEMPLATE.format(**locals())
 
+tasks, _ = load(os.path.join(HERE, 'task_matrix.yml'))
 
-tasks = []
-for version, topology in itertools.product(MONGODB_VERSIONS,
-                                           TOPOLOGY_OPTIONS):
-    tasks.append(create_task(version, topology))
-
-print('\n'.join(tasks))
+# config.yml indents its task list by four spaces.
+for task in tasks:
+    print('\n'.join('    ' + line if line else line
+                    for line in yaml_dump([task]).split('\n')))
@@ -0,0 +1,665 @@
+#!/usr/bin/env python3
+"""
+Download MongoDB archives through a shared, content-addressed cache.
+
+    python3 mongodb_download.py fetch URL mongodb-binaries.tgz
+    python3 mongodb_download.py extract URL $DRIVERS_TOOLS --binaries mongod mongos mongo
+
+Each archive is stored once in the cache directory, named by its sha256. An
+index maps every URL to the archive it last downloaded, with the ETag and
+Last-Modified the server sent for it. A cached URL is revalidated with a
+conditional request, and a hit is hard linked into place, or reflinked or
+copied if the destination is on another filesystem.
+
+The cache is shared by every task on the host. The index is locked while it
+is updated, each URL is locked while it is fetched so concurrent tasks
+download it once, and the least recently used archives are evicted once the
+cache grows past its size limit.
+
+Downloads use concurrent range requests when the server supports them, and
+extract unpacks a .tgz as it downloads rather than after, optionally only the
+named binaries.
+"""
+
+import argparse
+import contextlib
+import errno
+import fcntl
+import hashlib
+import http.client
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.getenv("MONGODB_DOWNLOAD_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mongodb-downloads"))
+
+# Server archives are a few hundred MB each, so this holds a handful of versions
+DEFAULT_CACHE_SIZE = int(os.getenv("MONGODB_DOWNLOAD_CACHE_SIZE", 4 * 1024 ** 3))
+
+# Retry like the curl --retry 8 download-mongodb.sh used before, but give up
+# on revalidating a cached archive sooner, since the cached one can be used
+DOWNLOAD_RETRIES = 8
+REVALIDATE_RETRIES = 2
+DOWNLOAD_SOCKET_TIMEOUT_SECONDS = 60
+DOWNLOAD_MAX_DELAY_SECONDS = 30
+
+CHUNK_SIZE = 1024 * 1024
+
+# Leave archives that are not in the index alone for this long, in case
+# another process is about to add them
+EVICT_GRACE_SECONDS = 10 * 60
+
+# Range requests are made a piece at a time, and each connection may run this
+# many pieces ahead of the reader, which bounds the memory used to 2 * pieces
+# * connections
+DEFAULT_CONNECTIONS = int(os.getenv("MONGODB_DOWNLOAD_CONNECTIONS", 4))
+RANGE_PIECE_SIZE = 8 * 1024 * 1024
+RANGE_PIECES_AHEAD = 2
+
+# Clones a file's extents on filesystems that support it, such as btrfs and xfs
+FICLONE = 0x40049409
+
+# Connection errors, timeouts and truncated responses, which are worth retrying
+_TRANSIENT_ERRORS = (OSError, http.client.HTTPException)
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _backoff(retries):
+    """
+    Yield an attempt number for each of 1 + retries attempts, sleeping with backoff between them.
+    """
+    delay = 1
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(delay)
+            delay = min(delay * 2, DOWNLOAD_MAX_DELAY_SECONDS)
+        yield attempt
+
+class _RangedReader(io.RawIOBase):
+    """
+    Read a URL front to back, while worker threads download the pieces ahead with range requests.
+
+    Each worker keeps one connection open. Pieces are requested with If-Range,
+    so a file that changes mid-download fails rather than mixes versions.
+    """
+    def __init__(self, url, first_piece, size, validator, connections):
+        super().__init__()
+        split = urllib.parse.urlsplit(url)
+        self._url = url
+        self._scheme = split.scheme
+        self._netloc = split.netloc
+        self._path = split.path + ("?" + split.query if split.query else "")
+        self._validator = validator
+        self._pieces = [(start, min(start + RANGE_PIECE_SIZE, size) - 1) for start in range(0, size, RANGE_PIECE_SIZE)]
+
+        self._cond = threading.Condition()
+        self._done = {0: first_piece}
+        self._next_piece = 1
+        self._read_piece = 0
+        self._max_ahead = RANGE_PIECES_AHEAD * connections
+        self._error = None
+        self._buf = memoryview(b"")
+
+        self._threads = [threading.Thread(target=self._work, daemon=True)
+            for _ in range(min(connections, len(self._pieces) - 1))]
+        for thread in self._threads:
+            thread.start()
+
+    def _connect(self):
+        if self._scheme == "https":
+            return http.client.HTTPSConnection(self._netloc, timeout=DOWNLOAD_SOCKET_TIMEOUT_SECONDS)
+        return http.client.HTTPConnection(self._netloc, timeout=DOWNLOAD_SOCKET_TIMEOUT_SECONDS)
+
+    def _get_piece(self, conn, start, end):
+        headers = {"Range": f"bytes={start}-{end}"}
+        if self._validator:
+            headers["If-Range"] = self._validator
+        conn.request("GET", self._path, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        if resp.status != 206 or len(data) != end - start + 1:
+            raise http.client.HTTPException(
+                f"Range {start}-{end} of {self._url} returned {resp.status} with {len(data)} bytes")
+        return data
+
+    def _work(self):
+        conn = self._connect()
+        try:
+            while True:
+                with self._cond:
+                    while (self._next_piece < len(self._pieces) and not self.closed and self._error is None
+                            and self._next_piece - self._read_piece >= self._max_ahead):
+                        self._cond.wait()
+                    if self._next_piece >= len(self._pieces) or self.closed or self._error is not None:
+                        return
+                    index = self._next_piece
+                    self._next_piece += 1
+
+                (start, end) = self._pieces[index]
+                try:
+                    for attempt in _backoff(DOWNLOAD_RETRIES):
+                        try:
+                            data = self._get_piece(conn, start, end)
+                            break
+                        except _TRANSIENT_ERRORS as e:
+                            conn.close()
+                            if attempt == DOWNLOAD_RETRIES:
+                                raise
+                            LOGGER.info("Range %s-%s of %s failed with %r, retrying", start, end, self._url, e)
+                except Exception as e:
+                    with self._cond:
+                        self._error = e
+                        self._cond.notify_all()
+                    return
+
+                with self._cond:
+                    self._done[index] = data
+                    self._cond.notify_all()
+        finally:
+            conn.close()
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not len(self._buf):
+            with self._cond:
+                if self._read_piece == len(self._pieces):
+                    return 0
+                while self._read_piece not in self._done and self._error is None:
+                    self._cond.wait()
+                if self._read_piece not in self._done:
+                    raise self._error
+                data = self._done.pop(self._read_piece)
+                self._read_piece += 1
+                self._cond.notify_all()
+
+            # The first piece is the response to the request that found the size
+            if isinstance(data, http.client.HTTPResponse):
+                with data:
+                    data = data.read()
+                if len(data) != self._pieces[0][1] + 1:
+                    raise http.client.IncompleteRead(data, self._pieces[0][1] + 1 - len(data))
+            self._buf = memoryview(data)
+
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        with self._cond:
+            super().close()
+            self._cond.notify_all()
+        first_piece = self._done.pop(0, None)
+        if isinstance(first_piece, http.client.HTTPResponse):
+            first_piece.close()
+
+class _Tee(io.RawIOBase):
+    """
+    Read through to a download, hashing it, copying it to sink and checking its size at the end.
+    """
+    def __init__(self, raw, size, sink=None):
+        super().__init__()
+        self._raw = raw
+        self._expected_size = size
+        self._sink = sink
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._raw.readinto(b)
+        if n:
+            data = memoryview(b)[:n]
+            self.sha256.update(data)
+            if self._sink:
+                self._sink.write(data)
+            self.size += n
+        elif self._expected_size is not None and self.size != self._expected_size:
+            raise http.client.IncompleteRead(b"", self._expected_size - self.size)
+        return n
+
+    def drain(self):
+        """
+        Read whatever the consumer left, such as the padding after a tarball's last member.
+        """
+        buf = bytearray(CHUNK_SIZE)
+        while self.readinto(buf):
+            pass
+
+def _open(url, headers, connections):
+    """
+    Start downloading url, and return (reader, size, response headers), or None for 304 Not Modified.
+
+    The first request asks for the first piece. If the server answers with a
+    partial response, the rest of the pieces are downloaded concurrently.
+    """
+    headers = dict(headers)
+    if connections > 1:
+        headers["Range"] = f"bytes=0-{RANGE_PIECE_SIZE - 1}"
+    try:
+        resp = urllib.request.urlopen(urllib.request.Request(url, headers=headers),
+            timeout=DOWNLOAD_SOCKET_TIMEOUT_SECONDS)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+    content_range = resp.headers.get("Content-Range", "")
+    if resp.status == 206 and content_range.startswith("bytes 0-") and not content_range.endswith("/*"):
+        size = int(content_range.rsplit("/", 1)[1])
+        if size > RANGE_PIECE_SIZE:
+            # Follow any redirect once, and pin the pieces to the version first seen
+            validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+            return (_RangedReader(resp.geturl(), resp, size, validator, connections), size, resp.headers)
+    elif resp.status != 200:
+        resp.close()
+        raise http.client.HTTPException(f"Downloading {url} returned {resp.status}")
+
+    length = resp.headers.get("Content-Length")
+    return (resp, int(length) if length is not None else None, resp.headers)
+
+def _transfer(url, consume=None, sink=None, headers=None, retries=DOWNLOAD_RETRIES, connections=DEFAULT_CONNECTIONS):
+    """
+    Download url into the file sink, and retry transient failures with backoff.
+
+    If consume is given, it is called with a file object reading the download
+    as it arrives, and called again from the start on a retry. Returns (a
+    _Tee with the download's sha256 and size, response headers), or None if
+    the server answered a conditional request with 304 Not Modified.
+    """
+    for attempt in _backoff(retries):
+        try:
+            opened = _open(url, headers or {}, connections)
+            if opened is None:
+                return None
+            (reader, size, resp_headers) = opened
+            if sink:
+                sink.seek(0)
+                sink.truncate()
+            with reader:
+                tee = _Tee(reader, size, sink)
+                if consume:
+                    consume(tee)
+                tee.drain()
+            return (tee, resp_headers)
+        except urllib.error.HTTPError as e:
+            if e.code < 500 or attempt == retries:
+                raise
+            LOGGER.info("Downloading %s failed with %s, retrying", url, e.code)
+        except _TRANSIENT_ERRORS as e:
+            if attempt == retries:
+                raise
+            LOGGER.info("Downloading %s failed with %r, retrying", url, e)
+
+def _download(url, path, headers=None, retries=DOWNLOAD_RETRIES, connections=DEFAULT_CONNECTIONS):
+    """
+    Download url to path.
+
+    Returns (sha256, size, response headers), or None if the server answered
+    a conditional request with 304 Not Modified.
+    """
+    with open(path, "wb") as f:
+        result = _transfer(url, sink=f, headers=headers, retries=retries, connections=connections)
+    if result is None:
+        return None
+    (tee, resp_headers) = result
+    return (tee.sha256.hexdigest(), tee.size, resp_headers)
+
+def _wanted(name, binaries):
+    # Server archives keep their programs in <top level directory>/bin/
+    (parent, base) = os.path.split(name)
+    if os.path.basename(parent) != "bin":
+        return False
+    if base.endswith(".exe"):
+        base = base[:-len(".exe")]
+    return base in binaries
+
+def _extract(fileobj, dest_dir, binaries=None):
+    """
+    Unpack a .tgz read front to back from fileobj into dest_dir.
+
+    If binaries is given, only those programs from the archive's bin directory are unpacked.
+    """
+    # Keep the permissions, but not the owners, that the archive was made with
+    extract_args = {"filter": "tar"} if hasattr(tarfile, "tar_filter") else {}
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+        for member in tar:
+            if binaries and not _wanted(member.name, binaries):
+                continue
+            tar.extract(member, dest_dir, **extract_args)
+
+@contextlib.contextmanager
+def _staged(dest_dir, binaries=None):
+    """
+    Yield a function that unpacks a .tgz into a staging directory, for _transfer to consume a download with.
+
+    Each call starts from an empty staging directory, so a retried download
+    never unpacks over a partial one. When the block exits without an error,
+    such as a sha256 mismatch, each top-level entry is renamed into dest_dir,
+    replacing any entry there with the same name.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=dest_dir, prefix=".extract-")
+
+    def consume(fileobj):
+        shutil.rmtree(staging)
+        os.mkdir(staging)
+        _extract(fileobj, staging, binaries)
+
+    try:
+        yield consume
+        for name in os.listdir(staging):
+            dest = os.path.join(dest_dir, name)
+            if os.path.isdir(dest) and not os.path.islink(dest):
+                shutil.rmtree(dest)
+            elif os.path.lexists(dest):
+                os.unlink(dest)
+            os.rename(os.path.join(staging, name), dest)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def extract(url, dest_dir, binaries=None, connections=DEFAULT_CONNECTIONS):
+    """
+    Download and unpack a .tgz into dest_dir, without the cache.
+    """
+    with _staged(dest_dir, binaries) as consume:
+        _transfer(url, consume, connections=connections)
+
+def _link(src, dest):
+    """
+    Make dest a copy of src as cheaply as the filesystem allows.
+
+    Returns how the copy was made, "hardlink", "reflink" or "copy".
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(dest)
+
+    try:
+        os.link(src, dest)
+        return "hardlink"
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+
+    return _clone(src, dest)
+
+def _clone(src, dest):
+    """
+    Make dest a copy of src that shares its blocks if the filesystem can, for a copy that will be written to.
+
+    Returns how the copy was made, "reflink" or "copy".
+    """
+    try:
+        with open(src, "rb") as s, open(dest, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return "reflink"
+    except OSError:
+        shutil.copyfile(src, dest)
+        return "copy"
+
+class DownloadCache:
+    """
+    A directory of downloaded archives, shared by every process on the host.
+
+    objects/ holds each archive named by its sha256, and index.json maps each
+    URL to its archive's sha256, validators, size and when it was last used.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE, connections=DEFAULT_CONNECTIONS):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.connections = connections
+        self._objects_dir = os.path.join(cache_dir, "objects")
+        self._locks_dir = os.path.join(cache_dir, "locks")
+        self._index_path = os.path.join(cache_dir, "index.json")
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._locks_dir, exist_ok=True)
+
+    def _object_path(self, sha256):
+        return os.path.join(self._objects_dir, sha256)
+
+    @contextlib.contextmanager
+    def _index(self):
+        """
+        Lock the index, and yield it as a dict to read and update.
+        """
+        with _locked(os.path.join(self.cache_dir, "index.lock")):
+            try:
+                with open(self._index_path) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+
+            yield index
+
+            # Write to a temp file and rename, so a crash never leaves a partial index
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self._index_path)
+
+    def _evict(self, index, keep):
+        """
+        Delete the least recently used archives until the cache fits in max_size.
+
+        Never deletes keep, the archive being fetched. Archives in objects/ that
+        are not in the index are left over from a crash, and go first, once they
+        are older than EVICT_GRACE_SECONDS.
+        """
+        last_used = {}
+        for entry in index.values():
+            last_used[entry["sha256"]] = max(last_used.get(entry["sha256"], 0), entry["used"])
+
+        sizes = {}
+        now = time.time()
+        for name in os.listdir(self._objects_dir):
+            # .part files are downloads in progress
+            if name.endswith(".part"):
+                continue
+            st = os.stat(self._object_path(name))
+            if name not in last_used and now - st.st_mtime < EVICT_GRACE_SECONDS:
+                continue
+            sizes[name] = st.st_size
+        total = sum(sizes.values())
+
+        for sha256 in sorted(sizes, key=lambda name: last_used.get(name, 0)):
+            if total <= self.max_size:
+                break
+            if sha256 == keep:
+                continue
+            LOGGER.info("Evicting %s, %d bytes", sha256, sizes[sha256])
+            os.unlink(self._object_path(sha256))
+            total -= sizes[sha256]
+            for url in [url for (url, entry) in index.items() if entry["sha256"] == sha256]:
+                del index[url]
+
+    def entries(self):
+        with self._index() as index:
+            return dict(index)
+
+    def _get(self, url, sha256=None, link_to=None, on_download=None):
+        """
+        Make sure the cache has a current copy of url, and return (hit, the open archive).
+
+        On a download, on_download is called with a file object reading it as
+        it arrives. If link_to is given, the archive is linked there.
+        """
+        url_key = hashlib.sha256(url.encode()).hexdigest()
+        with _locked(os.path.join(self._locks_dir, url_key + ".lock")):
+            while True:
+                with self._index() as index:
+                    entry = index.get(url)
+                if entry and (not os.path.exists(self._object_path(entry["sha256"]))
+                        or (sha256 and entry["sha256"] != sha256)):
+                    entry = None
+
+                headers = {}
+                if entry and entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry and entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+                fd, tmp_path = tempfile.mkstemp(dir=self._objects_dir, suffix=".part")
+                try:
+                    with os.fdopen(fd, "wb") as part:
+                        try:
+                            result = _transfer(url, on_download, part, headers,
+                                REVALIDATE_RETRIES if entry else DOWNLOAD_RETRIES, self.connections)
+                        except _TRANSIENT_ERRORS as e:
+                            if not entry or (isinstance(e, urllib.error.HTTPError) and e.code < 500):
+                                raise
+                            LOGGER.warning("Revalidating %s failed with %r, using the cached archive", url, e)
+                            result = None
+
+                    hit = result is None
+                    if not hit:
+                        (tee, resp_headers) = result
+                        digest = tee.sha256.hexdigest()
+                        if sha256 and digest != sha256:
+                            raise ValueError(f"Downloaded {url} has sha256 {digest}, expected {sha256}")
+
+                        # Linked copies share the object's inode, so keep it from being modified through them
+                        os.chmod(tmp_path, 0o444)
+                        entry = {"sha256": digest, "size": tee.size, "etag": resp_headers.get("ETag"),
+                            "last_modified": resp_headers.get("Last-Modified")}
+
+                    # Add, open and link the archive while the index is locked, so it cannot be evicted first
+                    with self._index() as index:
+                        if hit and not os.path.exists(self._object_path(entry["sha256"])):
+                            LOGGER.warning("Cached archive for %s was evicted while revalidating, downloading it again",
+                                url)
+                            continue
+                        if not hit:
+                            os.replace(tmp_path, self._object_path(entry["sha256"]))
+                        entry["used"] = time.time()
+                        index[url] = entry
+                        self._evict(index, keep=entry["sha256"])
+                        archive = open(self._object_path(entry["sha256"]), "rb")
+                        if link_to:
+                            LOGGER.info("%s to %s", _link(self._object_path(entry["sha256"]), link_to), link_to)
+                finally:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(tmp_path)
+                break
+
+        LOGGER.info("%s %s", "Cache hit for" if hit else "Downloaded", url)
+        return (hit, archive)
+
+    def fetch(self, url, dest, sha256=None):
+        """
+        Put the archive at url at dest, downloading it only if the cache has no current copy.
+
+        If sha256 is given, the archive must match it. If the server cannot be
+        reached to revalidate a cached archive, the cached archive is used.
+        Returns True for a cache hit.
+        """
+        (hit, archive) = self._get(url, sha256, link_to=dest)
+        archive.close()
+        return hit
+
+    def extract(self, url, dest_dir, binaries=None, sha256=None):
+        """
+        Unpack the .tgz at url into dest_dir, as it downloads on a cache miss.
+
+        If binaries is given, only those programs are unpacked. A download is
+        unpacked into a staging directory, and only moved into dest_dir once
+        its size and sha256 are verified. Returns True for a cache hit.
+        """
+        with _staged(dest_dir, binaries) as consume:
+            (hit, archive) = self._get(url, sha256, on_download=consume)
+            with archive:
+                if hit:
+                    consume(archive)
+        return hit
+
+def _fetch(args):
+    cache = DownloadCache(args.cache_dir, args.cache_size, args.connections)
+    start = time.monotonic()
+    hit = cache.fetch(args.url, args.dest, args.sha256)
+    print("%s %s in %.1f seconds" % ("Cache hit for" if hit else "Downloaded", args.url, time.monotonic() - start))
+
+def _extract_args(args):
+    start = time.monotonic()
+    if args.no_cache:
+        extract(args.url, args.dest_dir, args.binaries, args.connections)
+        hit = False
+    else:
+        cache = DownloadCache(args.cache_dir, args.cache_size, args.connections)
+        hit = cache.extract(args.url, args.dest_dir, args.binaries, args.sha256)
+    print("%s %s in %.1f seconds" % ("Extracted cached" if hit else "Downloaded and extracted", args.url,
+        time.monotonic() - start))
+
+def _list(args):
+    cache = DownloadCache(args.cache_dir, args.cache_size)
+    entries = cache.entries()
+    for (url, entry) in sorted(entries.items(), key=lambda item: item[1]["used"], reverse=True):
+        print(f"{entry['sha256'][:12]}  {entry['size']:>12}  {time.ctime(entry['used'])}  {url}")
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='MongoDB download cache.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument('-d', "--debug", action='store_true', help="Enable debug logging")
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR, help="Directory to cache downloads in")
+    parser.add_argument('--cache_size', type=int, default=DEFAULT_CACHE_SIZE, help="Bytes to keep in the cache")
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+        help="Concurrent range requests per download, 1 for a single request")
+
+    sub = parser.add_subparsers(title="Download Cache subcommands", help="sub-command help")
+
+    fetch_cmd = sub.add_parser('fetch', help='Download a URL through the cache')
+    fetch_cmd.add_argument('url', type=str, help="URL to download")
+    fetch_cmd.add_argument('dest', type=str, help="Path to put the download at")
+    fetch_cmd.add_argument('--sha256', type=str, help="Expected sha256 of the download")
+    fetch_cmd.set_defaults(func=_fetch)
+
+    extract_cmd = sub.add_parser('extract', help='Download and unpack a .tgz through the cache')
+    extract_cmd.add_argument('url', type=str, help="URL to download")
+    extract_cmd.add_argument('dest_dir', type=str, help="Directory to unpack into")
+    extract_cmd.add_argument('--binaries', type=str, nargs="+", help="Only unpack these programs, e.g. mongod mongos mongo")
+    extract_cmd.add_argument('--sha256', type=str, help="Expected sha256 of the download")
+    extract_cmd.add_argument('--no_cache', action='store_true', help="Download without the cache")
+    extract_cmd.set_defaults(func=_extract_args)
+
+    list_cmd = sub.add_parser('list', help='List cached downloads, most recently used first')
+    list_cmd.set_defaults(func=_list)
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if not hasattr(args, "func"):
+        parser.error("a subcommand is required")
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Resolve MongoDB download URLs from an index of the release feed.
+
+    python3 mongodb_versions.py resolve linux-ubuntu-18.04-x86_64 4.2
+
+The index is built from full.json, the feed of every release's downloads,
+and keys each download by target, arch, edition and version, plus the newest
+production release of each major.minor series. It is cached locally and
+rebuilt once it is older than its TTL. If the feed cannot be read, a stale
+index is used, or else the snapshot bundled next to this script.
+
+A distro, as printed by get_distro in download-mongodb.sh, maps to a short
+list of feed targets and arches, so resolving a version is a handful of dict
+lookups. Development builds, such as "latest", are not in the feed, and are
+left to download-mongodb.sh.
+"""
+
+import argparse
+import fnmatch
+import http.client
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import mongodb_download
+
+LOGGER = logging.getLogger(__name__)
+
+FULL_JSON_URL = os.getenv("MONGODB_FULL_JSON_URL", "https://downloads.mongodb.org/full.json")
+
+DEFAULT_INDEX_TTL_SECONDS = int(os.getenv("MONGODB_VERSIONS_TTL", 24 * 60 * 60))
+
+# After failing to read the feed, wait this long before trying again
+FEED_RETRY_SECONDS = 10 * 60
+FEED_TIMEOUT_SECONDS = 10
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mongodb_versions_snapshot.json")
+
+# Feed targets for each distro, most specific first. Distros are matched in
+# order, like the case statement in get_mongodb_download_url_for.
+PLATFORMS = [
+    ("darwin*", ["macos", "osx"]),
+    ("sunos*", ["sunos5"]),
+    ("linux-rhel-8*", ["rhel80"]),
+    ("linux-rhel-7*-s390x", ["rhel72"]),
+    ("linux-rhel-7.1-ppc64le", ["rhel71"]),
+    ("linux-rhel-7.0*", ["rhel70"]),
+    ("linux-rhel-6*-s390x", ["rhel67"]),
+    ("linux-rhel-6.2*", ["rhel62"]),
+    ("linux-rhel-5.5*", ["rhel55"]),
+    ("linux-sles-11*", ["suse11"]),
+    ("linux-sles-12*", ["suse12"]),
+    ("linux-sles-15*", ["suse15"]),
+    ("linux-amzn-2018*", ["amazon"]),
+    ("linux-amzn-2-*", ["amazon2"]),
+    ("linux-debian-7*", ["debian71"]),
+    ("linux-debian-8*", ["debian81"]),
+    ("linux-debian-9*", ["debian92"]),
+    ("linux-debian-10*", ["debian10"]),
+    ("linux-ubuntu-20.04*", ["ubuntu2004"]),
+    ("linux-ubuntu-18.04*", ["ubuntu1804"]),
+    ("linux-ubuntu-16.04*", ["ubuntu1604"]),
+    ("linux-ubuntu-14.04*", ["ubuntu1404"]),
+    ("linux-ubuntu-12.04*", ["ubuntu1204"]),
+    ("windows64*", ["windows", "windows_x86_64-2012plus", "windows_x86_64-2008plus-ssl", "windows_x86_64"]),
+    ("cygwin*-x86_64", ["windows", "windows_x86_64-2012plus", "windows_x86_64-2008plus-ssl", "windows_x86_64"]),
+    ("windows32*", ["windows_i686"]),
+    ("cygwin*-i686", ["windows_i686"]),
+]
+
+# Generic builds, for a distro with no download of its own
+GENERIC_PLATFORMS = [
+    ("*linux*x86_64", ["linux_x86_64"]),
+]
+
+# Feed arches for the last part of a distro, where they differ. get_distro
+# names Windows without an arch, as windows64 or windows32.
+ARCHES = {
+    "i86pc": ["x86_64"],
+    "windows64": ["x86_64"],
+    "windows32": ["i386"],
+    "aarch64": ["aarch64", "arm64"],
+    "i686": ["i386"],
+}
+
+# Prefer enterprise builds, as download-mongodb.sh does
+EDITIONS = ["enterprise", "subscription", "targeted", "base"]
+
+def _version_tuple(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version))
+
+def _series(version):
+    return ".".join(version.split(".")[:2])
+
+def _key(*parts):
+    return "/".join(parts)
+
+def build_index(feed):
+    """
+    Index the downloads in a full.json feed.
+
+    Returns a dict with "downloads", mapping "target/arch/edition/version" to
+    the archive's url and sha256, and "series", mapping
+    "target/arch/edition/major.minor" to the newest production version.
+    """
+    downloads = {}
+    series = {}
+    for release in feed["versions"]:
+        version = release["version"]
+        for download in release.get("downloads", []):
+            archive = download.get("archive")
+            if not archive or not download.get("target") or download.get("edition") == "source":
+                continue
+
+            platform = (download["target"], download["arch"], download["edition"])
+            downloads[_key(*platform, version)] = {"url": archive["url"], "sha256": archive.get("sha256")}
+            if release.get("production_release"):
+                series_key = _key(*platform, _series(version))
+                if series_key not in series or _version_tuple(version) > _version_tuple(series[series_key]):
+                    series[series_key] = version
+
+    return {"downloads": downloads, "series": series}
+
+def _platforms(distro):
+    """
+    Yield the (target, arch, edition) to look a distro's downloads up under, in order of preference.
+    """
+    arch = distro.rsplit("-", 1)[-1]
+    arches = ARCHES.get(arch, [arch])
+    for table in (PLATFORMS, GENERIC_PLATFORMS):
+        for (pattern, targets) in table:
+            if fnmatch.fnmatch(distro, pattern):
+                for target in targets:
+                    for arch in arches:
+                        for edition in EDITIONS:
+                            yield (target, arch, edition)
+                break
+
+def resolve(index, distro, version):
+    """
+    Return the download for a distro and version, as a dict with url and sha256, or None.
+
+    version is a release like "4.2.5", or a series like "4.2" for its newest production release.
+    """
+    for platform in _platforms(distro):
+        exact = index["series"].get(_key(*platform, version), version)
+        download = index["downloads"].get(_key(*platform, exact))
+        if download:
+            return download
+    return None
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _read_snapshot():
+    return _read_json(SNAPSHOT_PATH) or {"downloads": {}, "series": {}}
+
+def _write_json(path, value):
+    # Write to a temp file and rename, so a reader never sees a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(value, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _fetch_feed(feed_url, etag):
+    """
+    Return (feed, etag), or None if the feed has not changed since etag.
+    """
+    headers = {"If-None-Match": etag} if etag else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(feed_url, headers=headers),
+                timeout=FEED_TIMEOUT_SECONDS) as resp:
+            return (json.load(resp), resp.headers.get("ETag"))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+def load_index(cache_dir=mongodb_download.DEFAULT_CACHE_DIR, ttl=DEFAULT_INDEX_TTL_SECONDS, feed_url=FULL_JSON_URL):
+    """
+    Return the cached index, rebuilding it from the feed if it is older than ttl.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, "versions-index.json")
+    with mongodb_download._locked(path + ".lock"):
+        index = _read_json(path)
+        if index and index.get("feed_url") == feed_url and time.time() - index["checked"] < ttl:
+            return index
+
+        try:
+            fetched = _fetch_feed(feed_url, index.get("etag") if index else None)
+            if fetched:
+                (feed, etag) = fetched
+                LOGGER.info("Indexing %d releases from %s", len(feed["versions"]), feed_url)
+                index = build_index(feed)
+                index["etag"] = etag
+            index["source"] = feed_url
+            index["checked"] = time.time()
+        except (OSError, ValueError, KeyError, http.client.HTTPException) as e:
+            if not index:
+                LOGGER.warning("Reading %s failed with %r, using the bundled snapshot", feed_url, e)
+                index = _read_snapshot()
+                index["source"] = SNAPSHOT_PATH
+            else:
+                LOGGER.warning("Reading %s failed with %r, using the index from %s", feed_url, e, index["source"])
+            # Keep using it for a while rather than wait on the feed every time
+            index["checked"] = time.time() - ttl + FEED_RETRY_SECONDS
+
+        index["feed_url"] = feed_url
+        _write_json(path, index)
+        return index
+
+def _resolve(args):
+    if args.offline:
+        index = _read_snapshot()
+    else:
+        index = load_index(args.cache_dir, args.ttl, args.feed_url)
+    download = resolve(index, args.distro, args.version)
+    if not download:
+        LOGGER.info("No download for %s %s in the index", args.distro, args.version)
+        sys.exit(1)
+    if args.sha256 and not download["sha256"]:
+        LOGGER.info("The index has no sha256 for %s %s", args.distro, args.version)
+        sys.exit(1)
+    print(download["sha256"] if args.sha256 else download["url"])
+
+def _snapshot(args):
+    if os.path.exists(args.feed):
+        with open(args.feed) as f:
+            feed = json.load(f)
+    else:
+        (feed, _) = _fetch_feed(args.feed, None)
+    index = build_index(feed)
+    with open(args.output, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {len(index['downloads'])} downloads to {args.output}")
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='MongoDB version resolver.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument('-d', "--debug", action='store_true', help="Enable debug logging")
+
+    sub = parser.add_subparsers(title="Version Resolver subcommands", help="sub-command help")
+
+    resolve_cmd = sub.add_parser('resolve', help='Print the download URL for a distro and version')
+    resolve_cmd.add_argument('distro', type=str, help="Distro, as printed by get_distro")
+    resolve_cmd.add_argument('version', type=str, help="Release, e.g. 4.2.5, or series, e.g. 4.2")
+    resolve_cmd.add_argument('--sha256', action='store_true', help="Print the download's sha256 instead")
+    resolve_cmd.add_argument('--cache_dir', type=str, default=mongodb_download.DEFAULT_CACHE_DIR,
+        help="Directory to cache the index in")
+    resolve_cmd.add_argument('--ttl', type=int, default=DEFAULT_INDEX_TTL_SECONDS,
+        help="Seconds before the cached index is rebuilt")
+    resolve_cmd.add_argument('--feed_url', type=str, default=FULL_JSON_URL, help="Release feed URL")
+    resolve_cmd.add_argument('--offline', action='store_true', help="Only use the bundled snapshot")
+    resolve_cmd.set_defaults(func=_resolve)
+
+    snapshot_cmd = sub.add_parser('snapshot', help='Rebuild the bundled snapshot from a feed')
+    snapshot_cmd.add_argument('--feed', type=str, default=FULL_JSON_URL, help="Release feed file or URL")
+    snapshot_cmd.add_argument('--output', type=str, default=SNAPSHOT_PATH, help="Snapshot to write")
+    snapshot_cmd.set_defaults(func=_snapshot)
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if not hasattr(args, "func"):
+        parser.error("a subcommand is required")
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
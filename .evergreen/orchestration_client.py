@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Start mongo-orchestration and a cluster on it, without fixed sleeps.
+
+    python3 orchestration_client.py launch --mo_home $MONGO_ORCHESTRATION_HOME -- mongo-orchestration ... start
+    python3 orchestration_client.py start_cluster --config $ORCHESTRATION_FILE --url $ORCHESTRATION_URL
+
+launch starts the server in the background and polls it until it answers,
+quickly at first and then backing off, and fails as soon as the server
+process exits with an error. start_cluster posts a topology config, saves
+the response and writes the cluster's URI to mo-expansion.yml. Both append
+the time each step took to a results.json with --results_json.
+
+    python3 orchestration_client.py start_clusters --url $URL standalone=servers/basic.json repl=replica_sets/basic.json
+
+start_clusters starts several topologies at once on one mongo-orchestration.
+Every port in each config is replaced with a free one, reserved host-wide
+so that concurrent jobs do not collide, and every mongod gets its own
+dbpath. It writes each cluster's URI to mo-expansion.yml as
+MONGODB_URI_<NAME>, and the first one as MONGODB_URI as well.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import copy
+import errno
+import http.client
+import json
+import logging
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SERVER_URL = "http://localhost:8889"
+
+# mongo-orchestration usually answers within a second or two of starting
+READY_TIMEOUT_SECONDS = 120
+PROBE_INITIAL_DELAY_SECONDS = 0.05
+PROBE_MAX_DELAY_SECONDS = 1
+PROBE_TIMEOUT_SECONDS = 2
+
+# Match the curl --max-time 600 run-orchestration.sh used before
+CLUSTER_TIMEOUT_SECONDS = 600
+
+TOPOLOGIES = ("servers", "replica_sets", "sharded_clusters")
+
+# Ports handed out by PortAllocator stay reserved this long, long enough for
+# the processes they are for to bind them
+DEFAULT_PORTS_DIR = os.getenv("ORCHESTRATION_PORTS_DIR", os.path.join(tempfile.gettempdir(), "orchestration-ports"))
+PORT_RESERVATION_SECONDS = 10 * 60
+
+# start_clusters records the temp dirs it creates here, in the
+# mongo-orchestration home, for stop-orchestration.sh to remove
+DATA_DIRS_FILE = "orchestration-data-dirs.txt"
+
+class StepTimer:
+    """
+    Time named steps, as records for an Evergreen results.json.
+    """
+    def __init__(self):
+        self.records = []
+
+    @contextlib.contextmanager
+    def step(self, name):
+        record = {"status": "PASS", "test_file": name, "start": time.time()}
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "FAIL"
+            raise
+        finally:
+            record["end"] = time.time()
+            record["elapsed"] = record["end"] - record["start"]
+            self.records.append(record)
+            LOGGER.info("%s %s in %.3f seconds", name, record["status"], record["elapsed"])
+
+    def write_results(self, path):
+        """
+        Append the records to a results.json, like run-orchestration.sh does.
+        """
+        if not path or not self.records:
+            return
+        with open(path, "a") as f:
+            json.dump({"results": self.records}, f, indent=2)
+            f.write("\n")
+
+class OrchestrationClient:
+    """
+    Talk to mongo-orchestration's REST API.
+    """
+    def __init__(self, url=DEFAULT_SERVER_URL):
+        self.url = url.rstrip("/")
+
+    def _request(self, method, url, body=None, timeout=PROBE_TIMEOUT_SECONDS):
+        request = urllib.request.Request(url, data=body, method=method,
+            headers={"Content-Type": "application/json"} if body is not None else {})
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            data = resp.read()
+        return json.loads(data.decode()) if data else None
+
+    def is_ready(self):
+        try:
+            self._request("GET", self.url + "/")
+            return True
+        except (OSError, ValueError, http.client.HTTPException):
+            return False
+
+    def wait_ready(self, timeout=READY_TIMEOUT_SECONDS, process=None):
+        """
+        Poll until the server answers, failing early if process exits with an error.
+        """
+        start = time.monotonic()
+        delay = PROBE_INITIAL_DELAY_SECONDS
+        probes = 1
+        while not self.is_ready():
+            returncode = process.poll() if process else None
+            if returncode:
+                raise ValueError(f"mongo-orchestration exited with {returncode}")
+            elapsed = time.monotonic() - start
+            if elapsed >= timeout:
+                raise ValueError(f"Timeout waiting for mongo-orchestration at {self.url}")
+
+            time.sleep(min(delay, timeout - elapsed))
+            delay = min(delay * 2, PROBE_MAX_DELAY_SECONDS)
+            probes += 1
+
+        LOGGER.info("mongo-orchestration ready after %.2f seconds and %d probes", time.monotonic() - start, probes)
+
+    def create(self, topology_url, config, timeout=CLUSTER_TIMEOUT_SECONDS):
+        """
+        Post a topology config, as bytes or a dict, and return the new cluster's description.
+        """
+        if not isinstance(config, bytes):
+            config = json.dumps(config).encode()
+        return self._request("POST", topology_url, config, timeout)
+
+    def delete(self, topology_url, cluster_id, timeout=CLUSTER_TIMEOUT_SECONDS):
+        self._request("DELETE", f"{topology_url.rstrip('/')}/{urllib.parse.quote(cluster_id)}", timeout=timeout)
+
+    def servers(self):
+        """
+        Return the description of every mongod and mongos the server runs, with each one's procInfo.
+        """
+        data = self._request("GET", self.url + "/v1/servers", timeout=CLUSTER_TIMEOUT_SECONDS)
+        return data["servers"] if isinstance(data, dict) else data
+
+    def members(self, topology, cluster_id, kind="members"):
+        """
+        Return a replica set's members, or a sharded cluster's "shards", "routers" or "configsvrs".
+        """
+        return self._request("GET", f"{self.url}/v1/{topology}/{urllib.parse.quote(cluster_id)}/{kind}",
+            timeout=CLUSTER_TIMEOUT_SECONDS)
+
+    def server_action(self, server_id, action, timeout=CLUSTER_TIMEOUT_SECONDS):
+        """
+        Run an action, such as "stop" or "start", on one mongod or mongos.
+        """
+        body = json.dumps({"action": action}).encode()
+        self._request("POST", f"{self.url}/v1/servers/{urllib.parse.quote(server_id)}", body, timeout)
+
+def cluster_uri(cluster):
+    return cluster.get("mongodb_auth_uri") or cluster["mongodb_uri"]
+
+def _dump_logs(mo_home):
+    if not mo_home:
+        return
+    for name in ("out.log", "server.log"):
+        path = os.path.join(mo_home, name)
+        print(f"See {path}:")
+        with contextlib.suppress(OSError), open(path, errors="replace") as f:
+            sys.stdout.write(f.read())
+
+def launch(mo_home, command, url=DEFAULT_SERVER_URL, timeout=READY_TIMEOUT_SECONDS, timer=None):
+    """
+    Start mongo-orchestration in the background, with its output in mo_home/out.log, and wait until it answers.
+    """
+    timer = timer or StepTimer()
+    with timer.step("Orchestration launch"):
+        with open(os.path.join(mo_home, "out.log"), "w") as out:
+            # Start a new session, so the server outlives this script and the task's shell
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT,
+                start_new_session=True)
+        try:
+            OrchestrationClient(url).wait_ready(timeout, process)
+        except ValueError:
+            print("Failed to start mongo-orchestration")
+            _dump_logs(mo_home)
+            raise
+    return process
+
+def start_cluster(config_path, topology_url, expansion="mo-expansion.yml", response="tmp.json", mo_home=None,
+        timer=None):
+    """
+    Start the cluster in a topology config file, and write its URI to an expansion file.
+    """
+    timer = timer or StepTimer()
+    with open(config_path, "rb") as f:
+        config = f.read()
+
+    split = urllib.parse.urlsplit(topology_url)
+    client = OrchestrationClient(f"{split.scheme}://{split.netloc}")
+    with timer.step("Orchestration cluster"):
+        try:
+            cluster = client.create(topology_url, config)
+        except (OSError, ValueError, http.client.HTTPException):
+            print(f"Failed to start cluster from {config_path}")
+            _dump_logs(mo_home)
+            raise
+
+    write_cluster(cluster, expansion, response)
+    return cluster
+
+def write_cluster(cluster, expansion="mo-expansion.yml", response="tmp.json"):
+    """
+    Save a cluster's description, and write its URI to an expansion file.
+    """
+    if response:
+        with open(response, "w") as f:
+            json.dump(cluster, f, indent=2)
+
+    uri = cluster_uri(cluster)
+    _write_expansion(expansion, {"MONGODB_URI": uri})
+    print(f"Cluster URI: {uri}")
+
+def _write_expansion(expansion, values):
+    with open(expansion, "w") as f:
+        f.write("".join(f'{key}: "{value}"\n' for (key, value) in values.items()))
+
+def _unused_port():
+    """
+    Return a port nothing listens on, on IPv4 or IPv6 localhost, or None.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    if socket.has_ipv6:
+        try:
+            with socket.socket(socket.AF_INET6) as sock:
+                sock.bind(("::1", port))
+        except OSError as e:
+            # Hosts without IPv6 localhost can only collide on IPv4
+            if e.errno == errno.EADDRINUSE:
+                return None
+    return port
+
+class PortAllocator:
+    """
+    Hand out free localhost ports, reserved host-wide for a while.
+
+    Each reservation is a file named by its port in ports_dir, so jobs on the
+    same host do not pick a port that another has handed out but not bound yet.
+    """
+    def __init__(self, ports_dir=DEFAULT_PORTS_DIR, ttl=PORT_RESERVATION_SECONDS):
+        self.ports_dir = ports_dir
+        self.ttl = ttl
+        os.makedirs(ports_dir, exist_ok=True)
+
+    def _reserve(self, port):
+        path = os.path.join(self.ports_dir, str(port))
+        with contextlib.suppress(OSError):
+            if time.time() - os.path.getmtime(path) >= self.ttl:
+                os.unlink(path)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def allocate(self):
+        for _ in range(100):
+            port = _unused_port()
+            if port and self._reserve(port):
+                return port
+        raise ValueError(f"No free port found, see the reservations in {self.ports_dir}")
+
+def _process_params(topology, config):
+    """
+    Return (name, params) for each process in a topology config, where params is the dict holding its options.
+    """
+    if topology == "servers":
+        return [("mongod", config.setdefault("procParams", {}))]
+    if topology == "replica_sets":
+        return [("mongod", member.setdefault("procParams", {})) for member in config.get("members", [])]
+
+    params = [("mongos", router) for router in config.get("routers", [])]
+    params += [("mongod", configsvr) for configsvr in config.get("configsvrs", [])]
+    for shard in config.get("shards", []):
+        shard_params = shard.setdefault("shardParams", {})
+        if "members" in shard_params:
+            params += [("mongod", member.setdefault("procParams", {})) for member in shard_params["members"]]
+        else:
+            params.append(("mongod", shard_params.setdefault("procParams", {})))
+    return params
+
+def rewrite_config(topology, config, name, allocator, data_dir):
+    """
+    Return a copy of a topology config with its own ports, dbpaths and logpaths, and ids unique to name.
+
+    mongo-orchestration keeps one namespace of cluster, replica set and server
+    ids, so the shard and member ids are suffixed as well as the top-level id.
+    """
+    config = copy.deepcopy(config)
+    def suffix(entry, key):
+        if key in entry:
+            entry[key] = f"{entry[key]}-{name}"
+    suffix(config, "id")
+    for member in config.get("members", []):
+        suffix(member, "server_id")
+    for shard in config.get("shards", []):
+        suffix(shard, "id")
+        shard_params = shard.get("shardParams", {})
+        suffix(shard_params, "id")
+        for member in shard_params.get("members", []):
+            suffix(member, "server_id")
+    for (process, params) in _process_params(topology, config):
+        params["port"] = allocator.allocate()
+        process_dir = os.path.join(data_dir, name, str(params["port"]))
+        if process == "mongod":
+            params["dbpath"] = os.path.join(process_dir, "db")
+        params["logpath"] = os.path.join(process_dir, f"{process}.log")
+        os.makedirs(params.get("dbpath", process_dir), exist_ok=True)
+    return config
+
+def parse_cluster(spec, configs_dir):
+    """
+    Parse "name=topology/config.json" into (name, topology, config path).
+    """
+    (name, _, path) = spec.partition("=")
+    if not name or not path:
+        raise ValueError(f"Expected name=topology/config.json, not {spec}")
+    path = os.path.join(configs_dir, path)
+    topology = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"{path} is not in a {', '.join(TOPOLOGIES)} directory")
+    return (name, topology, path)
+
+def start_clusters(clusters, url=DEFAULT_SERVER_URL, data_dir=None, expansion="mo-expansion.yml", mo_home=None,
+        allocator=None, timer=None):
+    """
+    Start several clusters at once, each on its own ports, and write their URIs to an expansion file.
+
+    clusters is a list of (name, topology, config path). Each cluster's
+    description is saved to tmp-<name>.json next to the expansion file. Without
+    data_dir, the dbpaths go in a new temp dir, which is recorded in
+    DATA_DIRS_FILE in mo_home, or next to the expansion file.
+    """
+    timer = timer or StepTimer()
+    allocator = allocator or PortAllocator()
+    out_dir = os.path.dirname(os.path.abspath(expansion))
+    if not data_dir:
+        data_dir = tempfile.mkdtemp(prefix="orchestration-clusters-")
+        with open(os.path.join(mo_home or out_dir, DATA_DIRS_FILE), "a") as f:
+            f.write(f"{data_dir}\n")
+    client = OrchestrationClient(url)
+
+    configs = []
+    for (name, topology, config_path) in clusters:
+        with open(config_path) as f:
+            configs.append(rewrite_config(topology, json.load(f), name, allocator, data_dir))
+
+    def create(name, topology, config):
+        with timer.step(f"Orchestration cluster {name}"):
+            return client.create(f"{client.url}/v1/{topology}", config)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(clusters) or 1) as executor:
+        futures = [executor.submit(create, name, topology, config)
+                   for ((name, topology, _), config) in zip(clusters, configs)]
+        concurrent.futures.wait(futures)
+
+    errors = [(name, future.exception()) for ((name, _, _), future) in zip(clusters, futures) if future.exception()]
+    if errors:
+        print(f"Failed to start {', '.join(name for (name, _) in errors)}")
+        _dump_logs(mo_home)
+        raise errors[0][1]
+
+    uris = {}
+    for ((name, _, _), future) in zip(clusters, futures):
+        cluster = future.result()
+        with open(os.path.join(out_dir, f"tmp-{name}.json"), "w") as f:
+            json.dump(cluster, f, indent=2)
+        uris["MONGODB_URI_" + re.sub(r"\W", "_", name).upper()] = cluster_uri(cluster)
+        print(f"Cluster {name} URI: {cluster_uri(cluster)}")
+    if uris:
+        uris = dict(MONGODB_URI=next(iter(uris.values())), **uris)
+    _write_expansion(expansion, uris)
+    return [future.result() for future in futures]
+
+def _launch(args):
+    if not args.command:
+        raise ValueError("launch needs the mongo-orchestration command after --")
+    timer = StepTimer()
+    try:
+        launch(args.mo_home, args.command, args.url, args.timeout, timer)
+    finally:
+        timer.write_results(args.results_json)
+
+def _start_cluster(args):
+    timer = StepTimer()
+    try:
+        start_cluster(args.config, args.url, args.expansion, args.response, args.mo_home, timer)
+    finally:
+        timer.write_results(args.results_json)
+
+def _start_clusters(args):
+    clusters = [parse_cluster(spec, args.configs_dir) for spec in args.clusters]
+    timer = StepTimer()
+    try:
+        start_clusters(clusters, args.url, args.data_dir, args.expansion, args.mo_home, timer=timer)
+    finally:
+        timer.write_results(args.results_json)
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='mongo-orchestration client.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument('-d', "--debug", action='store_true', help="Enable debug logging")
+    parser.add_argument('--results_json', type=str, help="Append step timings to this results.json")
+    parser.add_argument('--mo_home', type=str, default=os.getenv("MONGO_ORCHESTRATION_HOME"),
+        help="mongo-orchestration home, for out.log and server.log")
+
+    sub = parser.add_subparsers(title="Orchestration subcommands", help="sub-command help")
+
+    launch_cmd = sub.add_parser('launch', help='Start mongo-orchestration and wait until it answers')
+    launch_cmd.add_argument('--url', type=str, default=DEFAULT_SERVER_URL, help="mongo-orchestration URL")
+    launch_cmd.add_argument('--timeout', type=float, default=READY_TIMEOUT_SECONDS,
+        help="Seconds to wait for mongo-orchestration")
+    launch_cmd.add_argument('command', nargs=argparse.REMAINDER, help="-- and the command to start mongo-orchestration")
+    launch_cmd.set_defaults(func=_launch)
+
+    start_cluster_cmd = sub.add_parser('start_cluster', help='Start a cluster and write its URI expansion')
+    start_cluster_cmd.add_argument('--config', type=str, required=True, help="Topology config file")
+    start_cluster_cmd.add_argument('--url', type=str, required=True,
+        help="Topology URL, e.g. http://localhost:8889/v1/servers")
+    start_cluster_cmd.add_argument('--expansion', type=str, default="mo-expansion.yml", help="Expansion file to write")
+    start_cluster_cmd.add_argument('--response', type=str, default="tmp.json", help="File to save the response in")
+    start_cluster_cmd.set_defaults(func=_start_cluster)
+
+    start_clusters_cmd = sub.add_parser('start_clusters', help='Start several clusters at once on free ports')
+    start_clusters_cmd.add_argument('--url', type=str, default=DEFAULT_SERVER_URL, help="mongo-orchestration URL")
+    start_clusters_cmd.add_argument('--configs_dir', type=str,
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "orchestration", "configs"),
+        help="Directory the cluster configs are relative to")
+    start_clusters_cmd.add_argument('--data_dir', type=str, help="Directory for the dbpaths, defaults to a new temp dir")
+    start_clusters_cmd.add_argument('--expansion', type=str, default="mo-expansion.yml", help="Expansion file to write")
+    start_clusters_cmd.add_argument('clusters', nargs='+', help="Clusters to start, as name=topology/config.json")
+    start_clusters_cmd.set_defaults(func=_start_clusters)
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if not hasattr(args, "func"):
+        parser.error("a subcommand is required")
+
+    if getattr(args, "command", None) and args.command[0] == "--":
+        args.command = args.command[1:]
+    if args.func == _launch and not args.mo_home:
+        parser.error("launch needs --mo_home or MONGO_ORCHESTRATION_HOME")
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Start orchestration clusters from snapshots of their initialized data.
+
+    python3 orchestration_snapshot.py start_cluster --config $ORCHESTRATION_FILE --url $ORCHESTRATION_URL
+
+The first time a topology config starts on a host with a given server
+version, the cluster is started through mongo-orchestration as usual. Each
+of its processes is then stopped cleanly, its data and options are copied
+into a snapshot, and it is started again. Later tasks with the same config
+and version restore the snapshot instead. Each mongod and mongos starts
+directly from a copy of its data, with its replica set config, shards and
+users in place, so initiation, elections and user creation are skipped.
+
+Restored processes are not managed by mongo-orchestration, so its REST API
+cannot stop or step them down. The stop command stops them, and
+stop-orchestration.sh calls it. Snapshots are keyed by the sha256 of the
+config file and the output of mongod --version. The least recently used are
+deleted once the snapshots take more than their size limit.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.client
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import ssl
+import struct
+import subprocess
+import tempfile
+import time
+import urllib.parse
+
+import mongodb_download
+import orchestration_client
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.getenv("ORCHESTRATION_SNAPSHOT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "orchestration-snapshots"))
+
+DEFAULT_CACHE_SIZE = int(os.getenv("ORCHESTRATION_SNAPSHOT_SIZE", 4 * 1024 ** 3))
+
+# The processes restored for a task, for the stop command
+PIDS_FILE = "snapshot-pids.json"
+
+STOP_TIMEOUT_SECONDS = 60
+
+def server_version(binaries):
+    """
+    Return the first line of mongod --version, such as "db version v4.4.1".
+    """
+    mongod = shutil.which("mongod", path=binaries)
+    if not mongod:
+        raise ValueError(f"No mongod in {binaries}")
+    return subprocess.check_output([mongod, "--version"]).decode().splitlines()[0].strip()
+
+def snapshot_key(config_path, version):
+    digest = hashlib.sha256()
+    with open(config_path, "rb") as f:
+        digest.update(f.read())
+    digest.update(b"\0" + version.encode())
+    return digest.hexdigest()
+
+def _read_options(optfile):
+    # mongo-orchestration writes one key=value per line
+    with open(optfile) as f:
+        return [line.split("=", 1) for line in f.read().splitlines() if "=" in line]
+
+def _write_options(path, options):
+    with open(path, "w") as f:
+        f.write("".join(f"{key}={value}\n" for (key, value) in options))
+
+def _stop_order(servers):
+    # Stop the routers before the shards and config servers they talk to
+    return sorted(servers, key=lambda server: "mongos" not in server["name"])
+
+def _cluster_servers(client, topology, cluster):
+    """
+    Return the id, name, port and options of each mongod and mongos in a cluster mongo-orchestration started.
+
+    mongo-orchestration lists the servers of every cluster it runs, so the
+    cluster's own are found through its members, routers, config servers and shards.
+    """
+    servers = {server["id"]: server for server in client.servers()}
+
+    def replica_set(set_id):
+        return [servers[member["server_id"]] for member in client.members("replica_sets", set_id)]
+
+    if topology == "servers":
+        found = [servers[cluster["id"]]]
+    elif topology == "replica_sets":
+        found = replica_set(cluster["id"])
+    else:
+        found = [servers[router["id"]] for router in client.members(topology, cluster["id"], "routers")]
+        # Each config server and shard entry is one server, or a replica set
+        for member in (client.members(topology, cluster["id"], "configsvrs")
+                + client.members(topology, cluster["id"], "shards")):
+            member_id = member.get("_id", member["id"])
+            found += [servers[member_id]] if member_id in servers else replica_set(member_id)
+
+    records = []
+    for server in found:
+        options = _read_options(server["procInfo"]["optfile"])
+        records.append({"id": server["id"], "name": os.path.basename(server["procInfo"]["name"]),
+                        "port": int(dict(options)["port"]), "options": options})
+    return records
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for (root, _, names) in os.walk(path) for name in names)
+
+# The legacy OP_QUERY isMaster, which every server version answers, even those
+# that only take OP_MSG for other commands
+_OP_QUERY = 2004
+_IS_MASTER = b"\x10isMaster\x00" + struct.pack("<i", 1) + b"\x00"
+_IS_MASTER = struct.pack("<i", len(_IS_MASTER) + 4) + _IS_MASTER
+
+# Sizes of the fixed-size BSON types, by type byte
+_BSON_SIZES = {1: 8, 7: 12, 8: 1, 9: 8, 10: 0, 16: 4, 17: 8, 18: 8, 19: 16, 127: 0, 255: 0}
+
+def _bson_decode(data, offset=0):
+    """
+    Decode the top-level fields of the BSON document at offset, keeping strings, booleans and numbers.
+    """
+    (size,) = struct.unpack_from("<i", data, offset)
+    (pos, end, doc) = (offset + 4, offset + size - 1, {})
+    while pos < end:
+        kind = data[pos]
+        name_end = data.index(b"\x00", pos + 1)
+        name = data[pos + 1:name_end].decode()
+        pos = name_end + 1
+        if kind == 2:
+            (length,) = struct.unpack_from("<i", data, pos)
+            doc[name] = data[pos + 4:pos + 3 + length].decode(errors="replace")
+            pos += 4 + length
+        elif kind in (3, 4):
+            pos += struct.unpack_from("<i", data, pos)[0]
+        elif kind == 5:
+            pos += 5 + struct.unpack_from("<i", data, pos)[0]
+        elif kind in _BSON_SIZES:
+            if kind == 8:
+                doc[name] = data[pos] == 1
+            elif kind in (1, 16, 18):
+                doc[name] = struct.unpack_from({1: "<d", 16: "<i", 18: "<q"}[kind], data, pos)[0]
+            pos += _BSON_SIZES[kind]
+        else:
+            raise ValueError(f"Unexpected BSON type {kind} in isMaster reply")
+    return doc
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed during isMaster")
+        data += chunk
+    return data
+
+def _is_master(server):
+    """
+    Return the isMaster reply of a restored mongod or mongos, connecting with TLS if it requires it.
+    """
+    options = dict(server["options"])
+    sock = socket.create_connection(("127.0.0.1", server["port"]), orchestration_client.PROBE_TIMEOUT_SECONDS)
+    try:
+        if options.get("tlsMode", options.get("sslMode", "disabled")) in ("requireTLS", "requireSSL"):
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            (context.check_hostname, context.verify_mode) = (False, ssl.CERT_NONE)
+            # The server's own certificate is the one client certificate sure to be on hand
+            pem = options.get("tlsCertificateKeyFile") or options.get("sslPEMKeyFile")
+            if pem:
+                context.load_cert_chain(pem, password=options.get("tlsCertificateKeyFilePassword")
+                    or options.get("sslPEMKeyPassword"))
+            sock = context.wrap_socket(sock)
+        body = struct.pack("<i", 0) + b"admin.$cmd\x00" + struct.pack("<ii", 0, -1) + _IS_MASTER
+        sock.sendall(struct.pack("<iiii", 16 + len(body), 1, 0, _OP_QUERY) + body)
+        (length,) = struct.unpack("<i", _recv_exactly(sock, 4))
+        # Skip the rest of the header and the OP_REPLY flags, cursor id, starting from and count
+        reply = _recv_exactly(sock, length - 4)
+        return _bson_decode(reply, 12 + 20)
+    finally:
+        sock.close()
+
+def _wait_ready(servers, processes=None, timeout=orchestration_client.READY_TIMEOUT_SECONDS):
+    """
+    Poll until every process is usable, failing early if one of processes exits.
+
+    A mongos, or a standalone mongod, is usable once it answers isMaster. A
+    replica set is usable once one of its members reports being a writable primary.
+    """
+    start = time.monotonic()
+    delay = orchestration_client.PROBE_INITIAL_DELAY_SECONDS
+    while True:
+        replies = {}
+        for (server, process) in zip(servers, processes or [None] * len(servers)):
+            if process and process.poll() is not None:
+                raise ValueError(f"Process on port {server['port']} exited with {process.returncode}")
+            try:
+                replies[server["port"]] = _is_master(server)
+            except (OSError, ValueError, struct.error) as e:
+                LOGGER.debug("isMaster on port %s failed with %r", server["port"], e)
+
+        waiting = []
+        sets = {}
+        for server in servers:
+            reply = replies.get(server["port"])
+            set_name = dict(server["options"]).get("replSet")
+            if reply is None:
+                waiting.append(str(server["port"]))
+            elif set_name and server["name"].startswith("mongod"):
+                sets[set_name] = sets.get(set_name, False) or bool(reply.get("ismaster"))
+        waiting += [f"a primary for {name}" for (name, has_primary) in sets.items() if not has_primary]
+        if not waiting:
+            return
+
+        if time.monotonic() - start >= timeout:
+            raise ValueError(f"Timeout waiting for the cluster, still waiting for {', '.join(waiting)}")
+        time.sleep(delay)
+        delay = min(delay * 2, orchestration_client.PROBE_MAX_DELAY_SECONDS)
+
+def _start(binaries, server, server_dir):
+    """
+    Start one snapshotted mongod or mongos from its copy in server_dir.
+    """
+    name = server["name"]
+    # Point the options naming the process's own files at their copies
+    paths = {"dbpath": os.path.join(server_dir, "db"), "logpath": os.path.join(server_dir, f"{name}.log"),
+             "pidfilepath": os.path.join(server_dir, f"{name}.pid"), "keyFile": os.path.join(server_dir, "key")}
+    options = [(key, paths.get(key, value)) for (key, value) in server["options"]]
+    if os.path.exists(paths["keyFile"]):
+        # mongod refuses a key file others can read
+        os.chmod(paths["keyFile"], 0o600)
+    optfile = os.path.join(server_dir, f"{name}.conf")
+    _write_options(optfile, options)
+
+    binary = shutil.which(name, path=binaries)
+    if not binary:
+        raise ValueError(f"No {name} in {binaries}")
+    LOGGER.info("Starting %s on port %s from its snapshot", name, server["port"])
+    return subprocess.Popen([binary, "--config", optfile], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT, start_new_session=True)
+
+class SnapshotCache:
+    """
+    A directory of cluster snapshots, shared by every task on the host.
+
+    Each snapshot is a directory named by its key, holding metadata.json,
+    with the cluster's description and each process's name, port and
+    options, and a directory for each process with its dbpath and key file.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _lock(self):
+        return mongodb_download._locked(os.path.join(self.cache_dir, "snapshots.lock"))
+
+    def _path(self, key, *parts):
+        return os.path.join(self.cache_dir, key, *parts)
+
+    def _metadata(self, key):
+        with open(self._path(key, "metadata.json")) as f:
+            return json.load(f)
+
+    def has(self, key):
+        return os.path.exists(self._path(key, "metadata.json"))
+
+    def entries(self):
+        with self._lock():
+            keys = [name for name in os.listdir(self.cache_dir) if self.has(name)]
+            return {key: dict(self._metadata(key), size=_directory_size(self._path(key))) for key in keys}
+
+    def discard(self, key):
+        with self._lock():
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def save(self, key, client, servers, cluster, config_path, version):
+        """
+        Snapshot a running cluster that client's mongo-orchestration started.
+
+        servers are the cluster's processes, from _cluster_servers. Stops each
+        of them cleanly so its data files are consistent, copies them, and
+        starts them again, without waiting for them to be usable.
+        """
+        servers = _stop_order(servers)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for server in servers:
+                client.server_action(server["id"], "stop")
+            try:
+                snapshot = []
+                for (i, server) in enumerate(servers):
+                    params = dict(server["options"])
+                    server_dir = os.path.join(tmp_dir, str(i))
+                    os.makedirs(server_dir)
+                    if params.get("dbpath"):
+                        shutil.copytree(params["dbpath"], os.path.join(server_dir, "db"),
+                            copy_function=mongodb_download._clone)
+                    if params.get("keyFile"):
+                        shutil.copyfile(params["keyFile"], os.path.join(server_dir, "key"))
+                    snapshot.append({"name": server["name"], "port": server["port"], "options": server["options"]})
+            finally:
+                for server in reversed(servers):
+                    client.server_action(server["id"], "start")
+
+            with open(os.path.join(tmp_dir, "metadata.json"), "w") as f:
+                json.dump({"config": config_path, "version": version, "cluster": cluster, "servers": snapshot,
+                           "used": time.time()}, f, indent=2)
+
+            with self._lock():
+                if self.has(key):
+                    LOGGER.info("Snapshot %s was saved by another task", key)
+                    return
+                os.rename(tmp_dir, self._path(key))
+                LOGGER.info("Saved snapshot %s of %d processes", key, len(snapshot))
+                self._evict(keep=key)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def restore(self, key, binaries, dest_dir, processes):
+        """
+        Start a snapshotted cluster from copies of its data in dest_dir, and return its description.
+
+        Appends each started process to processes, so a caller can stop them if a later one fails.
+        """
+        with self._lock():
+            metadata = self._metadata(key)
+            for i in range(len(metadata["servers"])):
+                shutil.copytree(self._path(key, str(i)), os.path.join(dest_dir, str(i)),
+                    copy_function=mongodb_download._clone)
+            metadata["used"] = time.time()
+            with open(self._path(key, "metadata.json"), "w") as f:
+                json.dump(metadata, f, indent=2)
+
+        # Start every mongod, then the routers once the config servers and shards have primaries
+        servers = list(enumerate(metadata["servers"]))
+        for name in ("mongod", "mongos"):
+            started = []
+            for (i, server) in servers:
+                if server["name"].split(".")[0] == name:
+                    process = _start(binaries, server, os.path.join(dest_dir, str(i)))
+                    processes.append(process)
+                    started.append((server, process))
+            _wait_ready([server for (server, _) in started], [process for (_, process) in started])
+        return metadata["cluster"]
+
+    def _evict(self, keep):
+        """
+        Delete the least recently used snapshots until the cache fits in max_size.
+        """
+        keys = [name for name in os.listdir(self.cache_dir) if self.has(name)]
+        sizes = {key: _directory_size(self._path(key)) for key in keys}
+        total = sum(sizes.values())
+        for key in sorted(keys, key=lambda key: self._metadata(key)["used"]):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            LOGGER.info("Evicting snapshot %s, %d bytes", key, sizes[key])
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= sizes[key]
+
+def _record(mo_home, processes, dest_dir):
+    path = os.path.join(mo_home, PIDS_FILE)
+    restored = {"pids": [], "dirs": []}
+    with contextlib.suppress(OSError, ValueError):
+        with open(path) as f:
+            restored = json.load(f)
+    restored["pids"] += [process.pid for process in processes]
+    restored["dirs"].append(dest_dir)
+    with open(path, "w") as f:
+        json.dump(restored, f)
+
+def stop(mo_home):
+    """
+    Stop the processes restored from snapshots, and delete their data.
+    """
+    path = os.path.join(mo_home, PIDS_FILE)
+    try:
+        with open(path) as f:
+            restored = json.load(f)
+    except OSError:
+        return
+
+    # mongod and mongos shut down cleanly on SIGTERM
+    for pid in restored["pids"]:
+        with contextlib.suppress(OSError):
+            os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + STOP_TIMEOUT_SECONDS
+    for pid in restored["pids"]:
+        while time.monotonic() < deadline:
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                break
+            time.sleep(0.1)
+        else:
+            LOGGER.warning("Killing %d, which did not stop in %d seconds", pid, STOP_TIMEOUT_SECONDS)
+            with contextlib.suppress(OSError):
+                os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+
+    for dest_dir in restored["dirs"]:
+        shutil.rmtree(dest_dir, ignore_errors=True)
+    os.unlink(path)
+
+def start_cluster(config_path, topology_url, binaries, expansion="mo-expansion.yml", response="tmp.json",
+        mo_home=None, cache=None, timer=None):
+    """
+    Start the cluster in a topology config file from its snapshot, or else through mongo-orchestration and snapshot it.
+    """
+    cache = cache or SnapshotCache()
+    timer = timer or orchestration_client.StepTimer()
+    version = server_version(binaries)
+    key = snapshot_key(config_path, version)
+    mo_home = mo_home or os.getcwd()
+
+    if cache.has(key):
+        dest_dir = tempfile.mkdtemp(prefix="orchestration-snapshot-")
+        processes = []
+        try:
+            with timer.step("Orchestration restore"):
+                cluster = cache.restore(key, binaries, dest_dir, processes)
+        except (OSError, ValueError, KeyError, subprocess.SubprocessError) as e:
+            LOGGER.warning("Restoring snapshot %s failed with %r, starting the cluster instead", key, e)
+            for process in processes:
+                process.kill()
+                process.wait()
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            cache.discard(key)
+        else:
+            _record(mo_home, processes, dest_dir)
+            orchestration_client.write_cluster(cluster, expansion, response)
+            return cluster
+
+    cluster = orchestration_client.start_cluster(config_path, topology_url, expansion, response, mo_home, timer)
+    split = urllib.parse.urlsplit(topology_url)
+    client = orchestration_client.OrchestrationClient(f"{split.scheme}://{split.netloc}")
+    topology = split.path.rstrip("/").split("/")[-1]
+    with timer.step("Orchestration snapshot") as record:
+        servers = []
+        try:
+            servers = _cluster_servers(client, topology, cluster)
+            cache.save(key, client, servers, cluster, config_path, version)
+        except (OSError, ValueError, KeyError, http.client.HTTPException) as e:
+            # The cluster is still usable, only later tasks miss the snapshot
+            LOGGER.warning("Saving snapshot %s failed with %r", key, e)
+            record["status"] = "FAIL"
+
+    # The start action returns once a process runs, before its replica set
+    # has elected a primary again, so wait as a restore does
+    with timer.step("Orchestration restart"):
+        for name in ("mongod", "mongos"):
+            _wait_ready([server for server in servers if server["name"].split(".")[0] == name])
+    return cluster
+
+def _start_cluster(args):
+    timer = orchestration_client.StepTimer()
+    try:
+        start_cluster(args.config, args.url, args.binaries, args.expansion, args.response, args.mo_home,
+            SnapshotCache(args.cache_dir, args.cache_size), timer)
+    finally:
+        timer.write_results(args.results_json)
+
+def _list(args):
+    for (key, entry) in SnapshotCache(args.cache_dir, args.cache_size).entries().items():
+        print(f"{key}  {entry['size']:>12}  {entry['version']}  {entry['config']}")
+
+def _stop(args):
+    stop(args.mo_home)
+
+def main() -> None:
+    """Execute Main entry point."""
+
+    parser = argparse.ArgumentParser(description='Orchestration cluster snapshots.')
+
+    parser.add_argument('-v', "--verbose", action='store_true', help="Enable verbose logging")
+    parser.add_argument('-d', "--debug", action='store_true', help="Enable debug logging")
+    parser.add_argument('--results_json', type=str, help="Append step timings to this results.json")
+    parser.add_argument('--mo_home', type=str, default=os.getenv("MONGO_ORCHESTRATION_HOME", os.getcwd()),
+        help="mongo-orchestration home, for its logs and the restored processes")
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR, help="Snapshot directory")
+    parser.add_argument('--cache_size', type=int, default=DEFAULT_CACHE_SIZE, help="Snapshot size limit in bytes")
+
+    sub = parser.add_subparsers(title="Snapshot subcommands", help="sub-command help")
+
+    start_cluster_cmd = sub.add_parser('start_cluster', help='Start a cluster from its snapshot, or snapshot it')
+    start_cluster_cmd.add_argument('--config', type=str, required=True, help="Topology config file")
+    start_cluster_cmd.add_argument('--url', type=str, required=True,
+        help="Topology URL, e.g. http://localhost:8889/v1/servers")
+    start_cluster_cmd.add_argument('--binaries', type=str, default=os.getenv("MONGODB_BINARIES"),
+        help="Directory with mongod and mongos")
+    start_cluster_cmd.add_argument('--expansion', type=str, default="mo-expansion.yml", help="Expansion file to write")
+    start_cluster_cmd.add_argument('--response', type=str, default="tmp.json", help="File to save the response in")
+    start_cluster_cmd.set_defaults(func=_start_cluster)
+
+    list_cmd = sub.add_parser('list', help='List the snapshots')
+    list_cmd.set_defaults(func=_list)
+
+    stop_cmd = sub.add_parser('stop', help='Stop the processes restored from snapshots')
+    stop_cmd.set_defaults(func=_stop)
+
+    args = parser.parse_args()
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    elif args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    if not hasattr(args, "func"):
+        parser.error("a subcommand is required")
+    if args.func == _start_cluster and not args.binaries:
+        parser.error("start_cluster needs --binaries or MONGODB_BINARIES")
+
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
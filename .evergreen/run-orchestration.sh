@@ -11,6 +11,15 @@ STORAGE_ENGINE=${STORAGE_ENGINE}
 # cluster config, eg DISABLE_TEST_COMMANDS=1
 DISABLE_TEST_COMMANDS=${DISABLE_TEST_COMMANDS}
 MONGODB_VERSION=${MONGODB_VERSION:-latest}
+# Set to a non-empty string to start the cluster from a snapshot of its
+# initialized data, saved by the first task on the host to start it, eg
+# ORCHESTRATION_SNAPSHOT=1
+ORCHESTRATION_SNAPSHOT=${ORCHESTRATION_SNAPSHOT}
+# Set to start several clusters at once on free ports instead of TOPOLOGY's,
+# each with a MONGODB_URI_<NAME> in mo-expansion.yml, eg
+# ORCHESTRATION_CLUSTERS="standalone=servers/basic.json repl=replica_sets/basic.json"
+ORCHESTRATION_CLUSTERS=${ORCHESTRATION_CLUSTERS}
+export MONGO_ORCHESTRATION_PORT=${MONGO_ORCHESTRATION_PORT:-8889}
 
 DL_START=$(date +%s)
 DIR=$(dirname $0)
@@ -55,36 +64,62 @@ if [ -z "$ORCHESTRATION_FILE" ]; then
 fi
 
 export ORCHESTRATION_FILE="$MONGO_ORCHESTRATION_HOME/configs/${TOPOLOGY}s/${ORCHESTRATION_FILE}"
-export ORCHESTRATION_URL="http://localhost:8889/v1/${TOPOLOGY}s"
+export ORCHESTRATION_URL="http://localhost:$MONGO_ORCHESTRATION_PORT/v1/${TOPOLOGY}s"
 
 # Start mongo-orchestration
 sh $DIR/start-orchestration.sh "$MONGO_ORCHESTRATION_HOME"
 
 pwd
-if ! curl --silent --show-error --data @"$ORCHESTRATION_FILE" "$ORCHESTRATION_URL" --max-time 600 --fail -o tmp.json; then
-  echo Failed to start cluster, see $MONGO_ORCHESTRATION_HOME/out.log:
-  cat $MONGO_ORCHESTRATION_HOME/out.log
-  echo Failed to start cluster, see $MONGO_ORCHESTRATION_HOME/server.log:
-  cat $MONGO_ORCHESTRATION_HOME/server.log
+# Start the cluster with the client, which also writes mo-expansion.yml, or
+# with curl when there is no Python 3.6+.
+find_python3
+if [ -z "$PYTHON3" ] && [ -n "$ORCHESTRATION_CLUSTERS" ]; then
+  echo "ORCHESTRATION_CLUSTERS needs Python 3.6+ with fcntl to start the clusters, and none was found"
   exit 1
+elif [ -n "$ORCHESTRATION_CLUSTERS" ]; then
+  $PYTHON3 $DIR/orchestration_client.py -v --mo_home "$MONGO_ORCHESTRATION_HOME" --results_json "$DRIVERS_TOOLS/results.json" \
+    start_clusters --url "http://localhost:$MONGO_ORCHESTRATION_PORT" --configs_dir "$MONGO_ORCHESTRATION_HOME/configs" \
+    $ORCHESTRATION_CLUSTERS
+  cat mo-expansion.yml
+elif [ -n "$PYTHON3" ] && [ -n "$ORCHESTRATION_SNAPSHOT" ]; then
+  $PYTHON3 $DIR/orchestration_snapshot.py -v --mo_home "$MONGO_ORCHESTRATION_HOME" --results_json "$DRIVERS_TOOLS/results.json" \
+    start_cluster --config "$ORCHESTRATION_FILE" --url "$ORCHESTRATION_URL"
+  cat tmp.json
+elif [ -n "$PYTHON3" ]; then
+  $PYTHON3 $DIR/orchestration_client.py -v --mo_home "$MONGO_ORCHESTRATION_HOME" --results_json "$DRIVERS_TOOLS/results.json" \
+    start_cluster --config "$ORCHESTRATION_FILE" --url "$ORCHESTRATION_URL"
+  cat tmp.json
+else
+  if ! curl --silent --show-error --data @"$ORCHESTRATION_FILE" "$ORCHESTRATION_URL" --max-time 600 --fail -o tmp.json; then
+    echo Failed to start cluster, see $MONGO_ORCHESTRATION_HOME/out.log:
+    cat $MONGO_ORCHESTRATION_HOME/out.log
+    echo Failed to start cluster, see $MONGO_ORCHESTRATION_HOME/server.log:
+    cat $MONGO_ORCHESTRATION_HOME/server.log
+    exit 1
+  fi
+  cat tmp.json
+  URI=$(python -c 'import sys, json; j=json.load(open("tmp.json")); print(j["mongodb_auth_uri" if "mongodb_auth_uri" in j else "mongodb_uri"])' | tr -d '\r')
+  echo 'MONGODB_URI: "'$URI'"' > mo-expansion.yml
+  echo "Cluster URI: $URI"
 fi
-cat tmp.json
-URI=$(python -c 'import sys, json; j=json.load(open("tmp.json")); print(j["mongodb_auth_uri" if "mongodb_auth_uri" in j else "mongodb_uri"])' | tr -d '\r')
-echo 'MONGODB_URI: "'$URI'"' > mo-expansion.yml
-echo "Cluster URI: $URI"
 
 MO_END=$(date +%s)
 MO_ELAPSED=$(expr $MO_END - $MO_START)
 DL_ELAPSED=$(expr $DL_END - $DL_START)
-cat <<EOT >> $DRIVERS_TOOLS/results.json
-{"results": [
+# The Python client appends its own orchestration steps to results.json
+MO_RESULT=""
+if [ -z "$PYTHON3" ]; then
+  MO_RESULT="
   {
-    "status": "PASS",
-    "test_file": "Orchestration",
-    "start": $MO_START,
-    "end": $MO_END,
-    "elapsed": $MO_ELAPSED
-  },
+    \"status\": \"PASS\",
+    \"test_file\": \"Orchestration\",
+    \"start\": $MO_START,
+    \"end\": $MO_END,
+    \"elapsed\": $MO_ELAPSED
+  },"
+fi
+cat <<EOT >> $DRIVERS_TOOLS/results.json
+{"results": [$MO_RESULT
   {
     "status": "PASS",
     "test_file": "Download MongoDB",
@@ -11,6 +11,9 @@ set -o errexit  # Exit the script with error if any of the commands fail
 
 
 MONGO_ORCHESTRATION_HOME="$1"
+# Set to run mongo-orchestration on a port of its own, so that several jobs
+# can share a host, eg MONGO_ORCHESTRATION_PORT=8890
+MONGO_ORCHESTRATION_PORT=${MONGO_ORCHESTRATION_PORT:-8889}
 
 echo From shell `date` > $MONGO_ORCHESTRATION_HOME/server.log
 
@@ -48,19 +51,37 @@ ORCHESTRATION_ARGUMENTS="-e default -f $MONGO_ORCHESTRATION_HOME/orchestration.c
 if [ "Windows_NT" = "$OS" ]; then # Magic variable in cygwin
   ORCHESTRATION_ARGUMENTS="$ORCHESTRATION_ARGUMENTS -s wsgiref"
 fi
+if [ "$MONGO_ORCHESTRATION_PORT" != "8889" ]; then
+  ORCHESTRATION_ARGUMENTS="$ORCHESTRATION_ARGUMENTS -p $MONGO_ORCHESTRATION_PORT"
+fi
 
-# Forcibly kill the process listening on port 8889, most likey a wild
-# mongo-orchestration left running from a previous task.
+# Forcibly kill the process listening on our port, most likey a wild
+# mongo-orchestration left running from a previous task. Anything else
+# listening there belongs to someone else, so leave it be.
 if [ "Windows_NT" = "$OS" ]; then # Magic variable in cygwin
-  OLD_MO_PID=$(netstat -ano | grep ':8889 .* LISTENING' | awk '{print $5}' | tr -d '[:space:]')
+  OLD_MO_PID=$(netstat -ano | grep ":$MONGO_ORCHESTRATION_PORT .* LISTENING" | awk '{print $5}' | tr -d '[:space:]')
   if [ ! -z "$OLD_MO_PID" ]; then
     taskkill /F /T /PID "$OLD_MO_PID" || true
   fi
 else
-  OLD_MO_PID=$(lsof -t -i:8889 || true)
-  if [ ! -z "$OLD_MO_PID" ]; then
-    kill -9 "$OLD_MO_PID" || true
-  fi
+  for OLD_MO_PID in $(lsof -t -i:$MONGO_ORCHESTRATION_PORT -s TCP:LISTEN || true); do
+    if ps -o args= -p "$OLD_MO_PID" | grep -q mongo-orchestration; then
+      kill -9 "$OLD_MO_PID" || true
+    else
+      echo "Port $MONGO_ORCHESTRATION_PORT is in use by another program, set MONGO_ORCHESTRATION_PORT to a free port"
+      exit 1
+    fi
+  done
+fi
+
+# Start mongo-orchestration and poll it until it answers, rather than sleep,
+# with the client when the virtualenv has a Python 3.6+ to run it.
+DIR=$(dirname $0)
+if python -c 'import sys; sys.exit(sys.version_info < (3, 6))' 2>/dev/null; then
+  python $DIR/orchestration_client.py -v --mo_home "$MONGO_ORCHESTRATION_HOME" ${DRIVERS_TOOLS:+--results_json "$DRIVERS_TOOLS/results.json"} \
+    launch --url "http://localhost:$MONGO_ORCHESTRATION_PORT" -- mongo-orchestration $ORCHESTRATION_ARGUMENTS start
+  ls -la $MONGO_ORCHESTRATION_HOME
+  exit 0
 fi
 
 mongo-orchestration $ORCHESTRATION_ARGUMENTS start > $MONGO_ORCHESTRATION_HOME/out.log 2>&1 < /dev/null &
@@ -68,7 +89,7 @@ mongo-orchestration $ORCHESTRATION_ARGUMENTS start > $MONGO_ORCHESTRATION_HOME/o
 ls -la $MONGO_ORCHESTRATION_HOME
 
 sleep 5
-if ! curl http://localhost:8889/ --silent --show-error --max-time 120 --fail; then
+if ! curl http://localhost:$MONGO_ORCHESTRATION_PORT/ --silent --show-error --max-time 120 --fail; then
   echo Failed to start mongo-orchestration, see $MONGO_ORCHESTRATION_HOME/out.log:
   cat $MONGO_ORCHESTRATION_HOME/out.log
   echo Failed to start mongo-orchestration, see $MONGO_ORCHESTRATION_HOME/server.log:
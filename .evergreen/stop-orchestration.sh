@@ -2,6 +2,12 @@
 set -o xtrace   # Write all commands first to stderr
 set -o errexit  # Exit the script with error if any of the commands fail
 
+DIR=$(cd "$(dirname $0)" && pwd)
+# Find the same Python 3 run-orchestration.sh restored snapshots with, before
+# the virtualenv, which may be Python 2, comes first on the PATH
+. $DIR/download-mongodb.sh
+find_python3
+
 cd "$MONGO_ORCHESTRATION_HOME"
 # source the mongo-orchestration virtualenv if it exists
 if [ -f venv/bin/activate ]; then
@@ -9,4 +15,29 @@ if [ -f venv/bin/activate ]; then
 elif [ -f venv/Scripts/activate ]; then
     . venv/Scripts/activate
 fi
-mongo-orchestration stop
+# Stop the processes run-orchestration.sh restored from a snapshot, which
+# mongo-orchestration does not know about. Stop mongo-orchestration even if
+# that fails, and fail afterwards.
+SNAPSHOT_STOP_FAILED=""
+if [ -f snapshot-pids.json ]; then
+  $PYTHON3 $DIR/orchestration_snapshot.py -v --mo_home "$MONGO_ORCHESTRATION_HOME" stop || SNAPSHOT_STOP_FAILED=1
+fi
+# Remove the dbpaths orchestration_client.py start_clusters put in temp dirs
+# even if mongo-orchestration fails to stop, and fail afterwards.
+MO_STOP_FAILED=""
+mongo-orchestration stop || MO_STOP_FAILED=1
+if [ -f orchestration-data-dirs.txt ]; then
+  while read -r DATA_DIR; do
+    rm -rf "$DATA_DIR"
+  done < orchestration-data-dirs.txt
+  rm orchestration-data-dirs.txt
+fi
+if [ -n "$SNAPSHOT_STOP_FAILED" ]; then
+  echo "Failed to stop the processes restored from a snapshot, see $MONGO_ORCHESTRATION_HOME/snapshot-pids.json"
+fi
+if [ -n "$MO_STOP_FAILED" ]; then
+  echo "Failed to stop mongo-orchestration"
+fi
+if [ -n "$SNAPSHOT_STOP_FAILED$MO_STOP_FAILED" ]; then
+  exit 1
+fi
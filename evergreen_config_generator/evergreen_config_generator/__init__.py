@@ -14,8 +14,21 @@
 
 
 import sys
+import types
 from collections import OrderedDict as OD
 
+try:
+    # Python 3 abstract base classes.
+    import collections.abc as abc
+except ImportError:
+    import collections as abc
+
+try:
+    string_types = (str, unicode)
+except NameError:
+    # Python 3.
+    string_types = (str,)
+
 try:
     import yaml
     import yamlordereddictloader
@@ -33,8 +46,12 @@ class ConfigObject(object):
     def name(self):
         return 'UNSET'
 
+    def iter_items(self):
+        """Generate (key, value) pairs lazily, in output order."""
+        yield 'name', self.name
+
     def to_dict(self):
-        return OD([('name', self.name)])
+        return OD(self.iter_items())
 
 
 # We want legible YAML tasks:
@@ -56,33 +73,103 @@ class _Dumper(yamlordereddictloader.Dumper):
     def __init__(self, *args, **kwargs):
         super(_Dumper, self).__init__(*args, **kwargs)
         self.add_representer(set, type(self).represent_set)
+        self.add_representer(types.GeneratorType,
+                             type(self).represent_generator)
         # Use "multi_representer" to represent all subclasses of ConfigObject.
         self.add_multi_representer(ConfigObject,
                                    type(self).represent_config_object)
 
     def represent_scalar(self, tag, value, style=None):
-        if isinstance(value, (str, unicode)) and '\n' in value:
+        if isinstance(value, string_types) and '\n' in value:
             style = '|'
         return super(_Dumper, self).represent_scalar(tag, value, style)
 
     def represent_set(self, data):
         return super(_Dumper, self).represent_list(sorted(data))
 
+    def represent_generator(self, data):
+        return super(_Dumper, self).represent_list(list(data))
+
     def represent_config_object(self, obj):
         return super(_Dumper, self).represent_data(obj.to_dict())
 
 
-def yaml_dump(obj):
-    return yaml.dump(obj, Dumper=_Dumper)
+def yaml_dump(obj, stream=None):
+    return yaml.dump(obj, stream, Dumper=_Dumper)
+
+
+_EMPTY = object()
+
+
+def _is_sequence(value):
+    if isinstance(value, (abc.Mapping, set, bytes) + string_types):
+        return False
+
+    return isinstance(value, abc.Iterable)
+
+
+def _stream_node(dumper, data):
+    node = dumper.represent_data(data)
+    dumper.anchor_node(node)
+    dumper.serialize_node(node, None, None)
+    # Forget data as yaml.dump would after each document, so that no alias
+    # refers to it and it's freed.
+    dumper.represented_objects = {}
+    dumper.object_keeper = []
+    dumper.alias_key = None
+    dumper.anchors = {}
+    dumper.serialized_nodes = {}
+
+
+def yaml_stream(config, stream):
+    """Dump config to stream one top-level value or list item at a time.
+
+    Lists and iterables in config, like a MatrixTask.matrix() generator, are
+    consumed item by item, so only one item's YAML is in memory at once.
+    The output is the same as yaml_dump's, except that YAML aliases are
+    never shared between top-level values or list items, and top-level lists
+    are always in block style.
+    """
+    items = list(config.items())
+    if not isinstance(config, OD):
+        # yaml_dump sorts the keys of plain dicts.
+        items.sort()
+
+    dumper = _Dumper(stream)
+    dumper.open()
+    dumper.emit(yaml.DocumentStartEvent())
+    dumper.emit(yaml.MappingStartEvent(None, None, True,
+                                       flow_style=not items))
+    for key, value in items:
+        _stream_node(dumper, key)
+        if not _is_sequence(value):
+            _stream_node(dumper, value)
+            continue
+
+        value = iter(value)
+        first = next(value, _EMPTY)
+        dumper.emit(yaml.SequenceStartEvent(None, None, True,
+                                            flow_style=first is _EMPTY))
+        if first is not _EMPTY:
+            _stream_node(dumper, first)
+            for item in value:
+                _stream_node(dumper, item)
+
+        dumper.emit(yaml.SequenceEndEvent())
+
+    dumper.emit(yaml.MappingEndEvent())
+    dumper.emit(yaml.DocumentEndEvent())
+    dumper.close()
 
 
 def generate(config, path):
     """Dump config to a file as YAML.
 
-    config is a dict, preferably an OrderedDict. path is a file path.
+    config is a dict, preferably an OrderedDict. path is a file path. Values
+    may be lists or other iterables, which are written as they're consumed.
     """
-    f = open(path, 'w+')
-    f.write('''####################################
+    with open(path, 'w+') as f:
+        f.write('''####################################
 # Evergreen configuration
 #
 # Generated with evergreen_config_generator from
@@ -93,4 +180,4 @@ def generate(config, path):
 ####################################
 
 ''')
-    f.write(yaml_dump(config))
+        yaml_stream(config, f)
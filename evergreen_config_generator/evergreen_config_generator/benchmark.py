@@ -0,0 +1,234 @@
+# Copyright 2018-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark config generation with synthetic matrices.
+
+    python -m evergreen_config_generator.benchmark --axes 4 --values 4 \\
+        --tasks 10 --variants 20 --profile generate.pstats
+
+Times each phase (matrix expansion, to_dict, YAML dump, file write)
+separately and records each phase's peak traced memory (Python 3 only).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict as OD
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2.
+    tracemalloc = None
+
+from evergreen_config_generator import generate, yaml_dump
+from evergreen_config_generator.functions import (bootstrap, func, run_tests,
+                                                  shell_exec, Function)
+from evergreen_config_generator.tasks import MatrixTask, prohibit
+from evergreen_config_generator.variants import Variant
+
+
+def make_matrix_task(family, n_axes, n_values):
+    """Make a MatrixTask subclass with n_axes axes of n_values values."""
+    axes = OD(('axis%d' % a, ['v%d' % v for v in range(n_values)])
+              for a in range(n_axes))
+
+    class SyntheticTask(MatrixTask):
+        def __init__(self, *args, **kwargs):
+            super(SyntheticTask, self).__init__(*args, **kwargs)
+            self.add_tags(family, *[self.display(a) for a in self.axes])
+            self.commands = [
+                bootstrap(VERSION='latest', TOPOLOGY=self.display('axis0')),
+                func('fetch source'),
+                run_tests(**dict((a.upper(), self.display(a))
+                                 for a in self.axes))]
+            self.options['exec_timeout_secs'] = 1800
+
+        @property
+        def name(self):
+            return '-'.join([family] + [self.display(a) for a in self.axes])
+
+        def _check_allowed(self):
+            # Prune some cells, like real matrices do.
+            last = 'v%d' % (n_values - 1)
+            prohibit(n_axes > 1 and self.axis0 == last and self.axis1 == last)
+
+    SyntheticTask.axes = axes
+    SyntheticTask.__name__ = str('SyntheticTask_%s' % family)
+    return SyntheticTask
+
+
+def make_classes(args):
+    return [make_matrix_task('family%d' % t, args.axes, args.values)
+            for t in range(args.tasks)]
+
+
+def make_functions():
+    return OD([
+        ('fetch source', Function(shell_exec('git clone $URL src'))),
+        ('run tests', Function(shell_exec('''
+            cd src
+            sh .evergreen/run-tests.sh
+        ''')))])
+
+
+def make_variants(tasks, args):
+    # Each variant selects a different value of the first axis.
+    return [Variant('variant%d' % v, 'Variant %d' % v, 'ubuntu1604-test',
+                    [t.name for t in tasks
+                     if t.axis0 == 'v%d' % (v % args.values)])
+            for v in range(args.variants)]
+
+
+class Phase(object):
+    def __init__(self, name, trace):
+        self.name = name
+        self.trace = trace and tracemalloc is not None
+        self.seconds = None
+        self.peak_bytes = None
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.start()
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.time() - self._start
+        if self.trace:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+
+def run_once(args, directory, trace=False):
+    phases = OD()
+    classes = make_classes(args)
+
+    with Phase('matrix', trace) as phases['matrix']:
+        tasks = [task for cls in classes for task in cls.matrix()]
+        variants = make_variants(tasks, args)
+
+    with Phase('to_dict', trace) as phases['to_dict']:
+        for obj in tasks + variants:
+            obj.to_dict()
+
+    config = OD([('functions', make_functions()),
+                 ('tasks', tasks),
+                 ('buildvariants', variants)])
+
+    with Phase('yaml_dump', trace) as phases['yaml_dump']:
+        text = yaml_dump(config)
+
+    with Phase('write', trace) as phases['write']:
+        generate(config, os.path.join(directory, 'config.yml'))
+
+    return len(tasks), len(text), phases
+
+
+def run(args):
+    """Time each phase, keeping the fastest of args.repeat runs.
+
+    Tracing allocations slows Python down, so peak memory comes from one
+    extra traced run whose timings are discarded.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        best = None
+        for _ in range(args.repeat):
+            n_tasks, size, phases = run_once(args, directory)
+            if best is None:
+                best = phases
+            else:
+                for name, phase in phases.items():
+                    if phase.seconds < best[name].seconds:
+                        best[name] = phase
+
+        if args.memory:
+            _, _, traced = run_once(args, directory, trace=True)
+            for name, phase in traced.items():
+                best[name].peak_bytes = phase.peak_bytes
+    finally:
+        shutil.rmtree(directory)
+
+    return OD([
+        ('axes', args.axes),
+        ('values', args.values),
+        ('task_classes', args.tasks),
+        ('variants', args.variants),
+        ('tasks', n_tasks),
+        ('yaml_bytes', size),
+        ('phases', OD((name, OD([('seconds', phase.seconds),
+                                 ('peak_bytes', phase.peak_bytes)]))
+                      for name, phase in best.items()))])
+
+
+def print_results(results):
+    print('%(tasks)d tasks from %(task_classes)d classes with %(axes)d axes '
+          'of %(values)d values, %(variants)d variants, '
+          '%(yaml_bytes)d bytes of YAML' % results)
+    print('%-10s %10s %14s' % ('phase', 'seconds', 'peak KiB'))
+    for name, phase in results['phases'].items():
+        peak = phase['peak_bytes']
+        print('%-10s %10.4f %14s' % (
+            name, phase['seconds'],
+            '-' if peak is None else '%.1f' % (peak / 1024.0)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark evergreen_config_generator.')
+    parser.add_argument('--axes', type=int, default=3,
+                        help='Axes per MatrixTask class')
+    parser.add_argument('--values', type=int, default=4,
+                        help='Values per axis')
+    parser.add_argument('--tasks', type=int, default=5,
+                        help='Number of MatrixTask classes')
+    parser.add_argument('--variants', type=int, default=10,
+                        help='Number of build variants')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per phase, the fastest is reported')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='Skip the traced run that measures peak memory')
+    parser.add_argument('--json', action='store_true',
+                        help='Print results as JSON')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Write cProfile stats for one run to PATH')
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        import cProfile
+        import pstats
+
+        args.repeat = 1
+        args.memory = False
+        profiler = cProfile.Profile()
+        results = profiler.runcall(run, args)
+        profiler.dump_stats(args.profile)
+        pstats.Stats(args.profile, stream=sys.stderr).sort_stats(
+            'cumulative').print_stats(20)
+    else:
+        results = run(args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
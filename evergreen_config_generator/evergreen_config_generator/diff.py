@@ -0,0 +1,331 @@
+# Copyright 2018-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Semantic diff of two generated Evergreen configs.
+
+    python -m evergreen_config_generator.diff old.yml new.yml
+
+Reports the functions, tasks and variants that were added, removed or
+changed, and which keys changed, and names defined more than once. Entities
+are compared by a hash of their normalized contents, where the order of
+tags, commands, a variant's tasks and similar lists doesn't matter.
+
+Loading a whole config with PyYAML takes minutes at 100k tasks, so
+diff_files() first splits each file's text into one chunk per entity,
+relying on the block layout that generate() and hand-written configs use.
+Only entities whose text differs at all, even in comments or whitespace,
+are parsed and compared semantically.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+from collections import OrderedDict as OD
+from textwrap import dedent
+
+import yaml
+
+try:
+    # libyaml's loader is much faster for large configs.
+    _Loader = yaml.CSafeLoader
+except AttributeError:
+    _Loader = yaml.SafeLoader
+
+# Lists under these keys are compared as unordered collections.
+UNORDERED_KEYS = frozenset(['tags', 'commands', 'tasks', 'run_on',
+                            'depends_on', 'pre', 'post', 'timeout'])
+
+
+def _hash(obj):
+    return hashlib.sha1(
+        json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def digest(value, unordered=False):
+    """Hash a YAML value so equal values up to list order hash equally."""
+    if isinstance(value, dict):
+        return _hash(['map', sorted(
+            (str(k), digest(v, k in UNORDERED_KEYS))
+            for k, v in value.items())])
+
+    if isinstance(value, list):
+        children = [digest(item) for item in value]
+        if unordered:
+            children.sort()
+        return _hash(['list', children])
+
+    return _hash(['scalar', value])
+
+
+SECTIONS = ('functions', 'tasks', 'buildvariants', 'other')
+
+
+class _Sections(object):
+    """Each section's OD(entity name -> entity), and the names seen twice."""
+
+    def __init__(self):
+        self.entities = OD((section, OD()) for section in SECTIONS)
+        self.duplicates = OD((section, []) for section in SECTIONS)
+
+    def add(self, section, name, entity):
+        entities = self.entities[section]
+        if name in entities and name not in self.duplicates[section]:
+            self.duplicates[section].append(name)
+
+        # The last definition wins, as it does for YAML mapping keys.
+        entities[name] = entity
+
+
+def _entities(config):
+    """Split a loaded config into _Sections."""
+    sections = _Sections()
+    for name, body in (config.get('functions') or {}).items():
+        sections.add('functions', name, body)
+
+    for section in 'tasks', 'buildvariants':
+        for entity in config.get(section) or []:
+            name = entity.get('name') or entity.get('matrix_name')
+            sections.add(section, name, entity)
+
+    for key, value in config.items():
+        if key not in ('functions', 'tasks', 'buildvariants'):
+            sections.add('other', key, value)
+
+    return sections
+
+
+def _changed_keys(old, new):
+    if not (isinstance(old, dict) and isinstance(new, dict)):
+        return []
+
+    keys = set(old) | set(new)
+    return sorted(
+        str(k) for k in keys
+        if k not in old or k not in new or
+        digest(old[k], k in UNORDERED_KEYS) !=
+        digest(new[k], k in UNORDERED_KEYS))
+
+
+class SectionDiff(object):
+    def __init__(self, added, removed, changed, old_duplicates=None,
+                 new_duplicates=None):
+        self.added = added
+        self.removed = removed
+        # Map entity name to the sorted keys that differ.
+        self.changed = changed
+        # Names defined more than once, which hide all but one definition.
+        self.old_duplicates = old_duplicates or []
+        self.new_duplicates = new_duplicates or []
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or
+                    self.old_duplicates or self.new_duplicates)
+
+    __nonzero__ = __bool__
+
+
+def _compare(section, name, old, new):
+    """Return None if two entities are equal, else the keys that differ."""
+    # Function bodies are command lists; top-level settings are unordered
+    # only if listed in UNORDERED_KEYS.
+    unordered = section == 'functions' or name in UNORDERED_KEYS
+    if digest(old, unordered) == digest(new, unordered):
+        return None
+
+    return _changed_keys(old, new)
+
+
+def _diff(old_sections, new_sections, compare):
+    result = OD()
+    for section in SECTIONS:
+        old_entities = old_sections.entities[section]
+        new_entities = new_sections.entities[section]
+        added = [n for n in new_entities if n not in old_entities]
+        removed = [n for n in old_entities if n not in new_entities]
+        changed = OD()
+        for name, old_entity in old_entities.items():
+            if name in new_entities:
+                keys = compare(section, name, old_entity, new_entities[name])
+                if keys is not None:
+                    changed[name] = keys
+
+        result[section] = SectionDiff(added, removed, changed,
+                                      old_sections.duplicates[section],
+                                      new_sections.duplicates[section])
+
+    return result
+
+
+def diff_configs(old, new):
+    """Return OD(section name -> SectionDiff) for two loaded configs."""
+    return _diff(_entities(old), _entities(new), _compare)
+
+
+def load_config(path):
+    with open(path) as f:
+        return yaml.load(f, Loader=_Loader) or {}
+
+
+def _load(text):
+    return yaml.load(text, Loader=_Loader)
+
+
+# A top-level key: content at column 0 that isn't a list item or comment.
+_TOP_LEVEL = re.compile(r'^(?![-#\s]|---)(.+?):', re.M)
+# The first list item in a section, or the first key in a mapping section.
+_FIRST_ITEM = re.compile(r'^( *)-(?: |$)', re.M)
+_FIRST_KEY = re.compile(r'^( *)(?![-#\s])\S', re.M)
+
+
+def _split(text, pattern):
+    """Split text at each match of pattern, dropping text before the first."""
+    starts = [m.start() for m in pattern.finditer(text)]
+    return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)])]
+
+
+def _top_level_sections(text):
+    """Map each top-level key to the text of its section."""
+    sections = OD()
+    for section in _split(text, _TOP_LEVEL):
+        sections[_scalar(_TOP_LEVEL.match(section).group(1))] = section
+
+    return sections
+
+
+def _split_items(section, first):
+    """Split a section's body at each line indented like its first item."""
+    body = section[section.index('\n') + 1:] if '\n' in section else ''
+    match = first.search(body)
+    if not match:
+        return []
+
+    indent = match.group(1)
+    if first is _FIRST_ITEM:
+        pattern = re.compile(r'^%s-(?: |$)' % indent, re.M)
+    else:
+        pattern = re.compile(r'^%s(?![-#\s])\S' % indent, re.M)
+
+    return _split(body, pattern)
+
+
+def _scalar(text):
+    text = text.strip()
+    # Parsing every plain name with PyYAML would dominate the run time.
+    if text[:1] in ('"', "'") or ' #' in text:
+        return _load(text)
+
+    return text
+
+
+_NAME = re.compile(r'-\s+(?:name|matrix_name):\s*(\S.*)')
+
+
+def _list_item_name(chunk):
+    match = _NAME.match(chunk.lstrip(' '))
+    if match:
+        return _scalar(match.group(1))
+
+    item = _load(dedent(chunk))[0]
+    return item.get('name') or item.get('matrix_name')
+
+
+def _chunks(text):
+    """Split config text into _Sections of (text, parse function)."""
+    chunks = _Sections()
+    for key, section in _top_level_sections(text).items():
+        if key in ('tasks', 'buildvariants'):
+            for chunk in _split_items(section, _FIRST_ITEM):
+                chunks.add(key, _list_item_name(chunk), (
+                    chunk, lambda c: _load(dedent(c))[0]))
+        elif key == 'functions':
+            for chunk in _split_items(section, _FIRST_KEY):
+                name = _scalar(chunk.split(':', 1)[0])
+                chunks.add(key, name, (
+                    chunk, lambda c: list(_load(dedent(c)).values())[0]))
+        else:
+            chunks.add('other', key, (
+                section, lambda c: list(_load(c).values())[0]))
+
+    return chunks
+
+
+def _compare_chunks(section, name, old, new):
+    (old_chunk, parse), (new_chunk, _) = old, new
+    # Comments and whitespace can be content inside block scalars, such as a
+    # script's shebang, so any other difference is left to the parser.
+    if old_chunk == new_chunk:
+        return None
+
+    return _compare(section, name, parse(old_chunk), parse(new_chunk))
+
+
+def diff_texts(old_text, new_text):
+    """Like diff_configs, but parses only the entities whose text differs."""
+    return _diff(_chunks(old_text), _chunks(new_text), _compare_chunks)
+
+
+def diff_files(old_path, new_path):
+    with open(old_path) as f:
+        old_text = f.read()
+    with open(new_path) as f:
+        new_text = f.read()
+
+    try:
+        return diff_texts(old_text, new_text)
+    except (yaml.YAMLError, AttributeError, IndexError, KeyError, TypeError):
+        # A layout the splitter doesn't understand, or aliases to anchors in
+        # other entities: compare the fully loaded configs instead.
+        return diff_configs(_load(old_text) or {}, _load(new_text) or {})
+
+
+def format_diff(result):
+    lines = []
+    for section, d in result.items():
+        if not d:
+            continue
+
+        lines.append('%s: %d added, %d removed, %d changed' % (
+            section, len(d.added), len(d.removed), len(d.changed)))
+        lines.extend('  ! %s is defined more than once in the old config'
+                     % name for name in d.old_duplicates)
+        lines.extend('  ! %s is defined more than once in the new config'
+                     % name for name in d.new_duplicates)
+        lines.extend('  + %s' % name for name in d.added)
+        lines.extend('  - %s' % name for name in d.removed)
+        for name, keys in d.changed.items():
+            if keys:
+                lines.append('  ~ %s (%s)' % (name, ', '.join(keys)))
+            else:
+                lines.append('  ~ %s' % name)
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare two generated Evergreen configs.')
+    parser.add_argument('old', help='Original config file')
+    parser.add_argument('new', help='New config file')
+    args = parser.parse_args(argv)
+
+    result = diff_files(args.old, args.new)
+    if any(result.values()):
+        print(format_diff(result))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Copyright 2018-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import json
+from collections import OrderedDict as OD
+
+
+def _json_documents(text):
+    # run-orchestration.sh appends a whole {"results": [...]} document to
+    # results.json per run, so one file may hold several documents.
+    decoder = json.JSONDecoder()
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+
+        if pos == len(text):
+            return
+
+        doc, pos = decoder.raw_decode(text, pos)
+        yield doc
+
+
+def _samples_from_json(text):
+    for doc in _json_documents(text):
+        if 'results' in doc:
+            for result in doc['results']:
+                if 'elapsed' in result:
+                    yield result['test_file'], float(result['elapsed'])
+        else:
+            # A plain {"task name": seconds} mapping.
+            for name, seconds in doc.items():
+                yield name, float(seconds)
+
+
+# Column headers we accept in exported CSV files.
+NAME_COLUMNS = ('name', 'task', 'task_name', 'test_file', 'display_name')
+DURATION_COLUMNS = ('elapsed', 'duration', 'seconds', 'time_taken')
+
+
+def _column(fieldnames, candidates, path):
+    for name in fieldnames or ():
+        if name.strip().lower() in candidates:
+            return name
+
+    raise ValueError('%s has no column named one of %s' % (
+        path, ', '.join(candidates)))
+
+
+def _samples_from_csv(f, path):
+    reader = csv.DictReader(f)
+    name_column = _column(reader.fieldnames, NAME_COLUMNS, path)
+    duration_column = _column(reader.fieldnames, DURATION_COLUMNS, path)
+    for row in reader:
+        if row[duration_column]:
+            yield row[name_column], float(row[duration_column])
+
+
+def load_durations(path):
+    """Read historical durations in seconds, keyed by task or test name.
+
+    path is a results.json file in the format Evergreen and
+    run-orchestration.sh use, a JSON object mapping names to seconds, or a
+    CSV file with a header row naming a name column and a duration column.
+    Names seen more than once get their mean duration.
+    """
+    with open(path) as f:
+        if path.lower().endswith('.csv'):
+            return mean_durations(_samples_from_csv(f, path))
+
+        return mean_durations(_samples_from_json(f.read()))
+
+
+def mean_durations(samples):
+    totals = OD()
+    for name, seconds in samples:
+        total, count = totals.get(name, (0.0, 0))
+        totals[name] = (total + seconds, count + 1)
+
+    return OD((name, total / count)
+              for name, (total, count) in totals.items())
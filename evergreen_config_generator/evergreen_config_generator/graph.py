@@ -0,0 +1,222 @@
+# Copyright 2018-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict as OD
+
+try:
+    # Python 3 abstract base classes.
+    import collections.abc as abc
+except ImportError:
+    import collections as abc
+
+
+class DependencyError(Exception):
+    pass
+
+
+def _dependencies(task):
+    depends_on = task.depends_on
+    if not depends_on:
+        return []
+
+    if isinstance(depends_on, abc.Mapping):
+        depends_on = [depends_on]
+
+    return depends_on
+
+
+def dependency_names(task):
+    """Names of the tasks in the same variant that task depends on."""
+    return [dependency['name'] for dependency in _dependencies(task)
+            if 'variant' not in dependency]
+
+
+def external_dependencies(task):
+    """(variant, name) of each task in another variant that task depends on.
+
+    The graph holds one variant's tasks, so these aren't edges in it.
+    """
+    return [(dependency['variant'], dependency['name'])
+            for dependency in _dependencies(task) if 'variant' in dependency]
+
+
+class TaskGraph(object):
+    """DAG of generated tasks and the tasks they depend on.
+
+    A task's cost is its historical duration from "durations" (see
+    evergreen_config_generator.durations) if known, else its
+    exec_timeout_secs, else default_cost.
+    """
+
+    def __init__(self, tasks, durations=None, default_cost=1):
+        self.tasks = OD()
+        for task in tasks:
+            if task.name in self.tasks:
+                raise DependencyError('duplicate task name %r' % task.name)
+            self.tasks[task.name] = task
+
+        self.durations = durations or {}
+        self.default_cost = default_cost
+
+        # Map each task name to the names of the tasks it depends on.
+        self.dependencies = OD()
+        self.missing = []
+        # (task name, variant, name) of dependencies in other variants.
+        self.external = []
+        for name, task in self.tasks.items():
+            self.external.extend((name,) + dep
+                                 for dep in external_dependencies(task))
+            self.dependencies[name] = deps = []
+            for dep in dependency_names(task):
+                if dep == '*':
+                    deps.extend(self._all_except(name))
+                elif dep in self.tasks:
+                    deps.append(dep)
+                else:
+                    self.missing.append((name, dep))
+
+    def _all_except(self, name):
+        # Evergreen's "*" means every other task; skip other "*" tasks so that
+        # two of them don't depend on each other.
+        return [other for other, task in self.tasks.items()
+                if other != name and '*' not in dependency_names(task)]
+
+    def cost(self, name):
+        if name in self.durations:
+            return self.durations[name]
+
+        return self.tasks[name].options.get('exec_timeout_secs',
+                                            self.default_cost)
+
+    def cycles(self):
+        """Find dependency cycles, each a list of task names."""
+        cycles = []
+        # 0 is unvisited, 1 is on the DFS stack, 2 is finished.
+        state = dict((name, 0) for name in self.tasks)
+        for root in self.tasks:
+            if state[root]:
+                continue
+
+            path = [root]
+            stack = [iter(self.dependencies[root])]
+            state[root] = 1
+            while stack:
+                for dep in stack[-1]:
+                    if state[dep] == 1:
+                        cycles.append(path[path.index(dep):] + [dep])
+                    elif state[dep] == 0:
+                        state[dep] = 1
+                        path.append(dep)
+                        stack.append(iter(self.dependencies[dep]))
+                        break
+                else:
+                    state[path.pop()] = 2
+                    stack.pop()
+
+        return cycles
+
+    def validate(self):
+        problems = ['%s depends on missing task %s' % pair
+                    for pair in self.missing]
+        problems.extend('dependency cycle: %s' % ' -> '.join(cycle)
+                        for cycle in self.cycles())
+        if problems:
+            raise DependencyError('\n'.join(problems))
+
+    def topological_order(self):
+        """Task names, each after all the tasks it depends on."""
+        dependents = dict((name, []) for name in self.tasks)
+        waiting = {}
+        for name, deps in self.dependencies.items():
+            waiting[name] = len(deps)
+            for dep in deps:
+                dependents[dep].append(name)
+
+        order = [name for name in self.tasks if not waiting[name]]
+        for name in order:
+            for dependent in dependents[name]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    order.append(dependent)
+
+        if len(order) < len(self.tasks):
+            raise DependencyError('dependency cycle: %s' % ', '.join(
+                ' -> '.join(cycle) for cycle in self.cycles()))
+
+        return order
+
+    def schedule(self):
+        """Earliest (start, finish) of each task given unlimited hosts."""
+        times = OD()
+        for name in self.topological_order():
+            start = max([times[dep][1] for dep in self.dependencies[name]]
+                        or [0])
+            times[name] = (start, start + self.cost(name))
+
+        return times
+
+    def critical_path(self):
+        """The chain of tasks that sets the wall-clock time, and its cost."""
+        times = self.schedule()
+        if not times:
+            return [], 0
+
+        name = max(times, key=lambda n: times[n][1])
+        length = times[name][1]
+        path = [name]
+        while self.dependencies[name]:
+            # Follow the dependency that finishes last.
+            name = max(self.dependencies[name], key=lambda n: times[n][1])
+            path.append(name)
+
+        path.reverse()
+        return path, length
+
+    def max_parallelism(self):
+        """Most tasks running at once when each starts as early as it can.
+
+        More hosts than this can't shorten the build.
+        """
+        events = []
+        for start, finish in self.schedule().values():
+            if finish > start:
+                events.append((start, 1))
+                events.append((finish, -1))
+
+        # At equal times process finishes (-1) before starts (+1).
+        events.sort()
+        running = peak = 0
+        for _, delta in events:
+            running += delta
+            peak = max(peak, running)
+
+        return peak
+
+    def report(self):
+        path, length = self.critical_path()
+        work = sum(self.cost(name) for name in self.tasks)
+        lines = ['tasks: %d' % len(self.tasks),
+                 'total cost: %g' % work,
+                 'critical path cost: %g' % length]
+        if length:
+            lines.append('average parallelism: %.1f' % (work / float(length)))
+
+        lines.append('suggested max parallelism: %d' % self.max_parallelism())
+        lines.append('critical path:')
+        lines.extend('  %s (%g)' % (name, self.cost(name)) for name in path)
+        lines.extend('missing: %s depends on %s' % pair
+                     for pair in self.missing)
+        lines.extend('external: %s depends on %s in %s' % (name, dep, variant)
+                     for name, variant, dep in self.external)
+        return '\n'.join(lines)
@@ -0,0 +1,120 @@
+# Copyright 2018-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class TaskIndex(object):
+    """Inverted index from tag to the tasks that have it.
+
+    Each tag maps to an integer used as a bitset over task positions, so
+    selecting tasks for many variants costs a few big-integer operations per
+    query instead of a has_tags() call per task:
+
+        index = TaskIndex(all_tasks)
+        Variant('ubuntu', 'Ubuntu', 'ubuntu1604-test',
+                tasks=index.names(all_of=['auth'], none_of=['latest']))
+
+    Tasks are returned in the order they were added.
+    """
+
+    def __init__(self, tasks=()):
+        self._tasks = []
+        self._positions = {}
+        self._bitsets = {}
+        self._tags = []
+        self.add(*tasks)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __iter__(self):
+        return iter(self._tasks)
+
+    def __contains__(self, task):
+        return id(task) in self._positions
+
+    @property
+    def tags(self):
+        return set(tag for tag, bits in self._bitsets.items() if bits)
+
+    def add(self, *tasks):
+        for task in tasks:
+            if task in self:
+                self.update(task)
+                continue
+
+            position = len(self._tasks)
+            self._tasks.append(task)
+            self._positions[id(task)] = position
+            self._tags.append(frozenset(task.tags))
+            self._set(position, self._tags[position])
+
+    def update(self, task):
+        """Re-read the tags of a task that changed after it was added."""
+        position = self._positions[id(task)]
+        old, new = self._tags[position], frozenset(task.tags)
+        bit = 1 << position
+        for tag in old - new:
+            self._bitsets[tag] &= ~bit
+
+        self._set(position, new - old)
+        self._tags[position] = new
+
+    def _set(self, position, tags):
+        bit = 1 << position
+        for tag in tags:
+            self._bitsets[tag] = self._bitsets.get(tag, 0) | bit
+
+    def bits(self, all_of=(), any_of=(), none_of=()):
+        """Bitset of the tasks with every tag in all_of, at least one tag in
+        any_of, and no tag in none_of. Empty arguments don't constrain."""
+        mask = (1 << len(self._tasks)) - 1
+        for tag in all_of:
+            mask &= self._bitsets.get(tag, 0)
+
+        if any_of:
+            mask &= self._union(any_of)
+
+        if none_of:
+            mask &= ~self._union(none_of)
+
+        return mask
+
+    def _union(self, tags):
+        mask = 0
+        for tag in tags:
+            mask |= self._bitsets.get(tag, 0)
+
+        return mask
+
+    def tasks_for(self, mask):
+        # bin() lists the bits most significant first; reverse it so that
+        # string offsets are task positions.
+        digits = bin(mask)[:1:-1]
+        tasks = []
+        position = digits.find('1')
+        while position != -1:
+            tasks.append(self._tasks[position])
+            position = digits.find('1', position + 1)
+
+        return tasks
+
+    def select(self, all_of=(), any_of=(), none_of=()):
+        return self.tasks_for(self.bits(all_of, any_of, none_of))
+
+    def names(self, all_of=(), any_of=(), none_of=()):
+        """Names of the selected tasks, suitable for Variant(tasks=...)."""
+        return [task.name for task in self.select(all_of, any_of, none_of)]
+
+    def count(self, all_of=(), any_of=(), none_of=()):
+        return bin(self.bits(all_of, any_of, none_of)).count('1')
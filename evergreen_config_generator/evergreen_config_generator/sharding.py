@@ -0,0 +1,113 @@
+# Copyright 2018-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+from collections import OrderedDict as OD
+from copy import deepcopy
+
+from evergreen_config_generator.tasks import NamedTask
+
+
+def estimator(durations, default=None):
+    """Return a function from name to estimated seconds.
+
+    Names without a historical duration are estimated at "default", or at
+    the mean known duration if default is None.
+    """
+    if default is None:
+        default = (sum(durations.values()) / float(len(durations))
+                   if durations else 1)
+
+    def estimate(name):
+        return durations.get(name, default)
+
+    return estimate
+
+
+def pack(items, n, cost):
+    """Split items into n bins of balanced total cost.
+
+    Uses longest-processing-time-first: place each item, largest first, in
+    the bin with the least total so far. Returns a list of (total, items)
+    pairs; items keep their original relative order within each bin.
+    """
+    if n < 1:
+        raise ValueError('need at least one shard, not %r' % n)
+
+    costs = [cost(item) for item in items]
+    order = sorted(range(len(items)), key=lambda i: -costs[i])
+    heap = [(0, b) for b in range(n)]
+    assigned = [[] for _ in range(n)]
+    totals = [0] * n
+    for i in order:
+        total, b = heapq.heappop(heap)
+        assigned[b].append(i)
+        totals[b] = total + costs[i]
+        heapq.heappush(heap, (totals[b], b))
+
+    return [(totals[b], [items[i] for i in sorted(assigned[b])])
+            for b in range(n)]
+
+
+def shard_tag(i, prefix='shard'):
+    return '%s-%d' % (prefix, i)
+
+
+def shard_tasks(tasks, n, durations, default=None, prefix='shard'):
+    """Tag tasks, e.g. the cells of a MatrixTask.matrix(), into n shards.
+
+    Each task gets the tag "shard-<i>" for the shard it lands in, so n
+    variants can each run a balanced share with tasks=['.shard-<i>'].
+    Returns the shards from pack().
+    """
+    tasks = list(tasks)
+    estimate = estimator(durations, default)
+    shards = pack(tasks, n, lambda task: estimate(task.name))
+    for i, (_, members) in enumerate(shards):
+        for task in members:
+            task.add_tags(shard_tag(i, prefix))
+
+    return shards
+
+
+def shard_tests(task, tests, n, durations, default=None, var='TESTS',
+                funcs=('run tests',), prefix='shard'):
+    """Split one task into up to n tasks that each run a subset of tests.
+
+    Each shard is a copy of the task named "<task>-shard-<i>", tagged with
+    the original tags plus "shard-<i>". Its calls to the functions in funcs
+    get the shard's tests, space-separated, in the "var" expansion. Empty
+    shards are dropped.
+    """
+    estimate = estimator(durations, default)
+    shards = []
+    for i, (_, members) in enumerate(pack(list(tests), n, estimate)):
+        if not members:
+            continue
+
+        commands = deepcopy(list(task.commands))
+        for command in commands:
+            if command.get('func') in funcs:
+                command.setdefault('vars', OD())[var] = ' '.join(members)
+
+        shard = NamedTask('%s-%s' % (task.name, shard_tag(i, prefix)),
+                          commands=commands,
+                          tags=task.tags | set([shard_tag(i, prefix)]))
+        shard.options.update(task.options)
+        if task.depends_on:
+            shard.depends_on = deepcopy(task.depends_on)
+
+        shards.append(shard)
+
+    return shards
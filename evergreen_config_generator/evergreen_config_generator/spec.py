@@ -0,0 +1,291 @@
+# Copyright 2018-present MongoDB, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compile a declarative task matrix spec into tasks and variants.
+
+A spec is a YAML file like:
+
+    name: test-{version}-{topology}
+    tags: ['{version}', '{topology}']
+    axes:
+      version: ['3.6', 'latest']
+      topology: [standalone, replica_set]
+    derive:
+      # Per-cell values computed from an axis value, defaulting to the value.
+      mo_topology: {from: topology, map: {standalone: server}}
+    exclude:
+      - {version: '3.6', topology: replica_set}
+    commands:
+      - func: bootstrap mongo-orchestration
+        vars: {VERSION: '{version}', TOPOLOGY: '{mo_topology}'}
+      - func: run tests
+    overrides:
+      # Extra function vars for the cells that match.
+      - match: {topology: replica_set}
+        vars: {run tests: {REPLICA_SET: 'true'}}
+    variants:
+      - name: ubuntu
+        display_name: Ubuntu
+        run_on: ubuntu1604-test
+        all_of: [latest]
+
+Placeholders like "{version}" in name, tags, commands and overrides are
+replaced with the cell's axis and derived values; Evergreen expansions like
+"${project}" are left alone. Variants select tasks by tag with all_of,
+any_of and none_of, like TaskIndex.select().
+
+load() caches compilations only if given a cache_dir or if the
+EVERGREEN_CONFIG_GENERATOR_CACHE environment variable names one.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict as OD
+
+import yaml
+import yamlordereddictloader
+
+from evergreen_config_generator import string_types
+from evergreen_config_generator.index import TaskIndex
+from evergreen_config_generator.tasks import MatrixTask, prohibit
+from evergreen_config_generator.variants import Variant
+
+# Bump when compile_spec's output changes, to invalidate cached compilations.
+SPEC_VERSION = 2
+
+VARIANT_OPTIONS = ('display_name', 'run_on', 'expansions', 'batchtime')
+
+
+class SpecError(Exception):
+    pass
+
+
+def load_spec(path):
+    with open(path) as f:
+        return yaml.load(f, Loader=yamlordereddictloader.Loader)
+
+
+# "{version}" is a placeholder, but "${version}" is an Evergreen expansion.
+_PLACEHOLDER = re.compile(r'(?<!\$)\{(\w+)\}')
+
+
+def render(template, values):
+    """Fill placeholders in every string in a structure of lists and dicts.
+
+    Placeholders whose names aren't in values are left as they are.
+    """
+    if isinstance(template, string_types):
+        return _PLACEHOLDER.sub(
+            lambda m: values.get(m.group(1), m.group(0)), template)
+
+    if isinstance(template, dict):
+        return OD((render(k, values), render(v, values))
+                  for k, v in template.items())
+
+    if isinstance(template, list):
+        return [render(item, values) for item in template]
+
+    return template
+
+
+def _matches(values, pattern):
+    return all(values.get(k) == str(v) for k, v in pattern.items())
+
+
+def _check(spec):
+    for key in 'name', 'axes', 'commands':
+        if key not in spec:
+            raise SpecError('spec has no %r' % key)
+
+    for name, rule in spec.get('derive', {}).items():
+        if rule.get('from') not in spec['axes']:
+            raise SpecError('%r derives from unknown axis %r' % (
+                name, rule.get('from')))
+
+    for pattern in (spec.get('exclude', []) +
+                    [o['match'] for o in spec.get('overrides', [])]):
+        for axis in pattern:
+            if axis not in spec['axes']:
+                raise SpecError('unknown axis %r in %r' % (axis, pattern))
+
+
+class SpecTask(MatrixTask):
+    """A cell of a spec's matrix, with its name, tags and commands filled in.
+
+    make_matrix_task and load make subclasses with the spec's axes.
+    """
+
+    @property
+    def name(self):
+        return self._task_name
+
+    def cell(self):
+        return tuple(getattr(self, axis) for axis in self.axes)
+
+
+def make_matrix_task(spec):
+    """Make a SpecTask subclass for the spec's matrix."""
+    _check(spec)
+    # YAML may parse values like 4.0 as numbers; the templates want strings.
+    axes = OD((name, [str(value) for value in values])
+              for name, values in spec['axes'].items())
+    derive = spec.get('derive', OD())
+    exclude = spec.get('exclude', [])
+    overrides = spec.get('overrides', [])
+
+    class CompiledSpecTask(SpecTask):
+        def __init__(self, *args, **kwargs):
+            super(CompiledSpecTask, self).__init__(*args, **kwargs)
+            values = self.cell_values()
+            self._task_name = render(spec['name'], values)
+            self.add_tags(*render(spec.get('tags', []), values))
+            self.commands = render(spec['commands'], values)
+            for override in overrides:
+                if _matches(values, override['match']):
+                    self._add_vars(render(override['vars'], values))
+
+            if 'exec_timeout_secs' in spec:
+                self.options['exec_timeout_secs'] = spec['exec_timeout_secs']
+
+        def cell_values(self):
+            values = dict((axis, getattr(self, axis)) for axis in self.axes)
+            for name, rule in derive.items():
+                value = values[rule['from']]
+                values[name] = str(rule.get('map', {}).get(value, value))
+
+            return values
+
+        def _add_vars(self, func_vars):
+            for command in self.commands:
+                if command.get('func') in func_vars:
+                    command.setdefault('vars', OD()).update(
+                        func_vars[command['func']])
+
+        def _check_allowed(self):
+            values = self.cell_values()
+            for pattern in exclude:
+                prohibit(_matches(values, pattern))
+
+    CompiledSpecTask.axes = axes
+    return CompiledSpecTask
+
+
+def _cached_matrix_task(axes, compiled_tasks):
+    """Make a SpecTask subclass whose cells are the compiled tasks."""
+    cells = dict((tuple(d['cell']), d) for d in compiled_tasks)
+
+    class CachedSpecTask(SpecTask):
+        def __init__(self, *args, **kwargs):
+            cell = tuple(kwargs.get(axis, values[0])
+                         for axis, values in self.axes.items())
+            d = cells.get(cell, {})
+            for k, v in d.items():
+                if k not in ('name', 'cell'):
+                    kwargs[k] = v
+
+            super(CachedSpecTask, self).__init__(*args, **kwargs)
+            self._task_name = d.get('name')
+
+        def _check_allowed(self):
+            prohibit(self.cell() not in cells)
+
+    CachedSpecTask.axes = axes
+    return CachedSpecTask
+
+
+def compile_spec(spec):
+    """Return the spec's tasks and variants."""
+    tasks = list(make_matrix_task(spec).matrix())
+    index = TaskIndex(tasks)
+    variants = []
+    for v in spec.get('variants', []):
+        options = dict((k, v[k]) for k in VARIANT_OPTIONS if k in v)
+        options.setdefault('display_name', v['name'])
+        options.setdefault('run_on', None)
+        names = index.names(v.get('all_of', ()), v.get('any_of', ()),
+                            v.get('none_of', ()))
+        variants.append(Variant(v['name'], tasks=names, **options))
+
+    return tasks, variants
+
+
+def _to_json(obj):
+    d = obj.to_dict()
+    if 'tags' in d:
+        d['tags'] = sorted(d['tags'])
+
+    if isinstance(obj, SpecTask):
+        d['cell'] = list(obj.cell())
+
+    return d
+
+
+def _from_json(compiled):
+    task_class = _cached_matrix_task(compiled['axes'], compiled['tasks'])
+    tasks = list(task_class.matrix())
+
+    variants = []
+    for d in compiled['variants']:
+        options = dict((k, v) for k, v in d.items() if k != 'name')
+        options.setdefault('display_name', None)
+        options.setdefault('run_on', None)
+        variants.append(Variant(d['name'], **options))
+
+    return tasks, variants
+
+
+def default_cache_dir():
+    return os.environ.get('EVERGREEN_CONFIG_GENERATOR_CACHE')
+
+
+def load(path, cache_dir=None):
+    """Compile the spec file at path, or reuse its cached compilation.
+
+    Compilations are cached as JSON in cache_dir, keyed by a hash of the
+    spec file's contents. cache_dir defaults to default_cache_dir(); if
+    neither is set, or cache_dir is False, the spec is always compiled.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    if not cache_dir:
+        return compile_spec(yaml.load(data, yamlordereddictloader.Loader))
+
+    digest = hashlib.sha256(('%d\n' % SPEC_VERSION).encode() + data)
+    cache_path = os.path.join(cache_dir, digest.hexdigest() + '.json')
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return _from_json(json.load(f, object_pairs_hook=OD))
+
+    tasks, variants = compile_spec(
+        yaml.load(data, yamlordereddictloader.Loader))
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    # Write to a temp file and rename, so concurrent readers never see a
+    # partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(OD([('axes', tasks[0].axes if tasks else OD()),
+                      ('tasks', [_to_json(t) for t in tasks]),
+                      ('variants', [_to_json(v) for v in variants])]), f)
+    os.rename(tmp_path, cache_path)
+    return tasks, variants
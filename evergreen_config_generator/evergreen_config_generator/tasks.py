@@ -14,7 +14,6 @@
 
 from collections import OrderedDict as OD
 from itertools import product
-from types import NoneType
 
 try:
     # Python 3 abstract base classes.
@@ -25,6 +24,8 @@ except ImportError:
 from evergreen_config_generator import ConfigObject
 from evergreen_config_generator.functions import func
 
+NoneType = type(None)
+
 
 class Task(ConfigObject):
     def __init__(self, *args, **kwargs):
@@ -83,15 +84,16 @@ class Task(ConfigObject):
         (axis_name, value), = kwargs.items()
         return 'on' if getattr(self, axis_name) == value else 'off'
 
-    def to_dict(self):
-        task = super(Task, self).to_dict()
+    def iter_items(self):
+        for item in super(Task, self).iter_items():
+            yield item
         if self.tags:
-            task['tags'] = self.tags
-        task.update(self.options)
+            yield 'tags', self.tags
+        for item in self.options.items():
+            yield item
         if self.depends_on:
-            task['depends_on'] = self.depends_on
-        task['commands'] = self.commands
-        return task
+            yield 'depends_on', self.depends_on
+        yield 'commands', self.commands
 
 
 class NamedTask(Task):
@@ -30,9 +30,9 @@ class Variant(ConfigObject):
     def name(self):
         return self._variant_name
 
-    def to_dict(self):
-        v = super(Variant, self).to_dict()
+    def iter_items(self):
+        for item in super(Variant, self).iter_items():
+            yield item
         for i in 'display_name', 'expansions', 'run_on', 'tasks', 'batchtime':
             if getattr(self, i):
-                v[i] = getattr(self, i)
-        return v
+                yield i, getattr(self, i)